@@ -48,6 +48,14 @@ def from_ctx(cls, ctx, interpreter=None):
             return None
         return cls(combat, None, interpreter=interpreter)
 
+    @classmethod
+    async def from_ctx_async(cls, ctx, interpreter=None):
+        try:
+            combat = await init.Combat.from_ctx(ctx)
+        except init.CombatNotFound:
+            return None
+        return cls(combat, None, interpreter=interpreter)
+
     # public methods
     def get_combatant(self, name, strict=None):
         """
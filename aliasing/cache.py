@@ -0,0 +1,97 @@
+import logging
+import threading
+
+import cachetools
+
+from utils import config, invalidation
+
+log = logging.getLogger(__name__)
+
+GVAR_CACHE_NAME = "gvars"
+# a parsed module's AST takes up much more memory than its source - this is a rough estimate of how much more
+AST_SIZE_MULTIPLIER = 10
+
+
+class _CachedGvar:
+    __slots__ = ("value", "ast")
+
+    def __init__(self, value: str, ast=None):
+        self.value = value
+        self.ast = ast
+
+    @property
+    def size(self):
+        if self.ast is None:
+            return len(self.value)
+        return len(self.value) * (1 + AST_SIZE_MULTIPLIER)
+
+
+class GvarCache:
+    """
+    A process-wide cache of gvar values, and the parsed ASTs of gvars that have been imported as modules, shared
+    between all script executions. Bounded by the (approximate) size of its contents in bytes, evicting the least
+    recently used gvars first.
+
+    Gvars are dropped when they are edited or deleted, on all clusters (see :mod:`utils.invalidation`). Entries
+    also expire after a TTL, in case an invalidation is missed.
+
+    Interpreters run in an executor, so all access is locked.
+    """
+
+    def __init__(self, max_bytes: int, ttl: int):
+        self._cache = cachetools.TTLCache(maxsize=max_bytes, ttl=ttl, getsizeof=lambda entry: entry.size)
+        self._lock = threading.Lock()
+
+    def get(self, address: str):
+        """Returns the value of the gvar at *address*, or None if it is not cached."""
+        with self._lock:
+            entry = self._cache.get(address)
+        return entry.value if entry is not None else None
+
+    def get_many(self, addresses) -> dict:
+        """Returns a dict of {address: value} for each of *addresses* that is cached."""
+        out = {}
+        with self._lock:
+            for address in addresses:
+                entry = self._cache.get(address)
+                if entry is not None:
+                    out[address] = entry.value
+        return out
+
+    def set(self, address: str, value: str):
+        with self._lock:
+            entry = self._cache.get(address)
+            if entry is not None and entry.value == value:
+                return
+            self._set(address, _CachedGvar(value))
+
+    def get_ast(self, address: str, value: str):
+        """Returns the parsed AST of the gvar at *address*, if it is cached and was parsed from *value*."""
+        with self._lock:
+            entry = self._cache.get(address)
+        if entry is None or entry.value != value:
+            return None
+        return entry.ast
+
+    def set_ast(self, address: str, value: str, ast):
+        with self._lock:
+            self._set(address, _CachedGvar(value, ast))
+
+    def invalidate(self, addresses):
+        with self._lock:
+            for address in addresses:
+                self._cache.pop(address, None)
+
+    def _set(self, address, entry):
+        if entry.size > self._cache.maxsize:  # would raise ValueError, and evict everything else anyway
+            return
+        self._cache[address] = entry
+
+
+gvar_cache = GvarCache(max_bytes=int(config.GVAR_CACHE_MAX_BYTES), ttl=int(config.GVAR_CACHE_TTL))
+invalidation.register(GVAR_CACHE_NAME, gvar_cache.invalidate)
+
+
+async def invalidate_gvar(bot, address: str):
+    """Drops the gvar at *address* from the gvar cache of every cluster. Call after editing or deleting a gvar."""
+    await invalidation.invalidate(bot, GVAR_CACHE_NAME, address)
@@ -1,6 +1,8 @@
 import asyncio
 import functools
+import itertools
 import json
+import logging
 import re
 import textwrap
 import time
@@ -19,6 +21,7 @@
 import aliasing.api.character as character_api
 import aliasing.api.combat as combat_api
 from aliasing import helpers
+from aliasing.cache import gvar_cache
 from aliasing.api.context import AliasContext
 from aliasing.api.functions import (
     _roll,
@@ -79,10 +82,19 @@
     r"|<(?P<lookup>[^\s]+?)>"  # <lookup>
     r")"
 )
+# statically detectable references in draconic code, prefetched before the code runs
+# gvar addresses are uuid4s, so any uuid in the code might be a gvar (e.g. using(), get_gvar(), or a constant)
+GVAR_ADDRESS_RE = re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}")
+SVAR_REFERENCE_RE = re.compile(r"get_svar\(\s*([\"'])(?P<name>\w+)\1")
+COMBAT_REFERENCE_RE = re.compile(r"\bcombat\s*\(")
+MAX_PREFETCH_GVARS = 100
+MAX_PREFETCH_DEPTH = 5  # how many levels of gvars referenced by prefetched gvars to follow
 # an alias/snippet that can invoke draconic code
 _CodeInvokerT = Optional[Union[_CustomizationBase, WorkshopCollectableObject]]
 ScriptingWarning = namedtuple("ScriptingWarning", "msg node expr")
 
+log = logging.getLogger(__name__)
+
 
 class MathEvaluator(draconic.SimpleInterpreter):
     """Evaluator with basic math functions exposed."""
@@ -149,6 +161,8 @@ def __init__(self, ctx, *args, **kwargs):
         self.builtins.update(vroll=self._limited_vroll, roll=self._limited_roll)
 
         self._cache = {"gvars": {}, "svars": {}, "uvars": {}, "imports": {}}
+        # names that were prefetched and do not exist, so they are not fetched again
+        self._missing = {"gvars": set(), "svars": set()}
 
         self.ctx = ctx
         self.character_changed = False
@@ -190,6 +204,46 @@ def combat():
         self.builtins.update(combat=combat)
         return self
 
+    async def prefetch(self, code: str):
+        """
+        Statically finds the gvars, svars, and combat referenced by the given code and fetches them asynchronously,
+        with one query per collection, so that the interpreter does not need to fetch them synchronously while it runs.
+        References that cannot be found statically (e.g. ``get_svar(some_name)``) still fall back to a synchronous fetch.
+        """
+        # gvars, and any gvars that those gvars reference (e.g. imports in imported modules)
+        gvar_addresses = set(GVAR_ADDRESS_RE.findall(code))
+        for _ in range(MAX_PREFETCH_DEPTH):
+            gvar_addresses -= self._cache["gvars"].keys() | self._missing["gvars"]
+            remaining = MAX_PREFETCH_GVARS - len(self._cache["gvars"]) - len(self._missing["gvars"])
+            if not gvar_addresses or remaining <= 0:
+                break
+            to_fetch = sorted(gvar_addresses)[:remaining]
+            found = gvar_cache.get_many(to_fetch)
+            if len(found) < len(to_fetch):
+                async for gvar in self.ctx.bot.mdb.gvars.find(
+                    {"key": {"$in": [a for a in to_fetch if a not in found]}}, projection={"key": 1, "value": 1}
+                ):
+                    found[gvar["key"]] = gvar["value"]
+                    gvar_cache.set(gvar["key"], gvar["value"])
+            self._cache["gvars"].update(found)
+            self._missing["gvars"].update(a for a in to_fetch if a not in found)
+            gvar_addresses = set(itertools.chain.from_iterable(GVAR_ADDRESS_RE.findall(v) for v in found.values()))
+
+        # svars
+        if self.ctx.guild is not None:
+            svar_names = {m.group("name") for m in SVAR_REFERENCE_RE.finditer(code)}
+            svar_names -= self._cache["svars"].keys() | self._missing["svars"]
+            if svar_names:
+                async for svar in self.ctx.bot.mdb.svars.find(
+                    {"owner": self.ctx.guild.id, "name": {"$in": list(svar_names)}}, projection={"name": 1, "value": 1}
+                ):
+                    self._cache["svars"][svar["name"]] = svar["value"]
+                self._missing["svars"].update(n for n in svar_names if n not in self._cache["svars"])
+
+        # combat
+        if "combat" not in self._cache and COMBAT_REFERENCE_RE.search(code):
+            self._cache["combat"] = await combat_api.SimpleCombat.from_ctx_async(self.ctx, interpreter=self)
+
     async def run_commits(self):
         if self.character_changed and "character" in self._cache:
             await self._cache["character"].func_commit(self.ctx)
@@ -215,6 +269,7 @@ def combat(self):
         :rtype: :class:`~aliasing.api.combat.SimpleCombat`
         """
         if "combat" not in self._cache:
+            log.info(f"Loading combat synchronously in channel {self.ctx.channel.id} (not prefetched)")
             self._cache["combat"] = combat_api.SimpleCombat.from_ctx(self.ctx, interpreter=self)
         self.combat_changed = True
         return self._cache["combat"]
@@ -248,11 +303,18 @@ def get_gvar(self, address):
         :rtype: str
         """
         address = str(address)
+        if address in self._missing["gvars"]:
+            return None
         if address not in self._cache["gvars"]:
-            result = self.ctx.bot.mdb.gvars.delegate.find_one({"key": address})
-            if result is None:
-                return None
-            self._cache["gvars"][address] = result["value"]
+            value = gvar_cache.get(address)
+            if value is None:
+                log.info(f"Fetching gvar {address!r} synchronously (not prefetched)")
+                result = self.ctx.bot.mdb.gvars.delegate.find_one({"key": address})
+                if result is None:
+                    return None
+                value = result["value"]
+                gvar_cache.set(address, value)
+            self._cache["gvars"][address] = value
         return self._cache["gvars"][address]
 
     def get_svar(self, name, default=None):
@@ -265,9 +327,10 @@ def get_svar(self, name, default=None):
         :rtype: str or None
         """
         name = str(name)
-        if self.ctx.guild is None:
+        if self.ctx.guild is None or name in self._missing["svars"]:
             return default
         if name not in self._cache["svars"]:
+            log.info(f"Fetching svar {name!r} synchronously (not prefetched)")
             result = self.ctx.bot.mdb.svars.delegate.find_one({"owner": self.ctx.guild.id, "name": name})
             if result is None:
                 return default
@@ -626,6 +689,20 @@ def _import_one(self, name: str, addr: str, user_ns: dict):
             raise ValueError(f"{name} is already builtin (no shadow assignments).")
         user_ns[name] = mod_ns
 
+    def parse(self, expr, *args, **kwargs):
+        # modules are parsed once per process, not once per import: reuse the AST from the shared gvar cache
+        # if we are importing a module whose source is unchanged since it was cached
+        if not self._import_stack:
+            return super().parse(expr, *args, **kwargs)
+        addr = self._import_stack[-1]
+        if expr != self._cache["gvars"].get(addr):  # not the module itself, e.g. code the module evaluates
+            return super().parse(expr, *args, **kwargs)
+        if (cached := gvar_cache.get_ast(addr, expr)) is not None:
+            return cached
+        parsed = super().parse(expr, *args, **kwargs)
+        gvar_cache.set_ast(addr, expr, parsed)
+        return parsed
+
     # ==== warnings ====
     def _eval(self, node):
         last_node = self._aliasing_current_node
@@ -9,7 +9,8 @@
 import draconic
 from disnake.ext.commands import ArgumentParsingError
 
-from aliasing import evaluators
+from aliasing import evaluators, name_index
+from aliasing.cache import invalidate_gvar
 from aliasing.api.functions import AliasException
 from aliasing.constants import CVAR_SIZE_LIMIT, GVAR_SIZE_LIMIT, SVAR_SIZE_LIMIT, UVAR_SIZE_LIMIT, VAR_NAME_LIMIT
 from aliasing.errors import AliasNameConflict, CollectableNotFound, CollectableRequiresLicenses, EvaluationError
@@ -33,6 +34,10 @@ async def handle_aliases(ctx: "AvraeContext"):
     alias = ctx.invoked_with
     qualified_name_parts = [alias]
     server_invoker = False
+    guild_id = ctx.guild.id if ctx.guild is not None else None
+    if name_index.is_known_miss(ctx.author.id, guild_id, alias):
+        return
+    index_generation = name_index.current_generation()
 
     # personal alias/servalias
     try:
@@ -44,6 +49,7 @@ async def handle_aliases(ctx: "AvraeContext"):
         return await ctx.send(str(anc))
 
     if not the_alias:
+        name_index.record_miss(ctx.author.id, guild_id, alias, index_generation)
         return
 
     # workshop alias subcommands
@@ -154,15 +160,10 @@ async def handle_alias_arguments(command, ctx):
 async def get_collectable_named(
     ctx, name, personal_cls, workshop_cls, workshop_sub_meth, is_alias, obj_name, obj_name_pl, obj_command_name
 ):
-    binding_key = "alias_bindings" if is_alias else "snippet_bindings"
-
-    personal_obj = await personal_cls.get_named(name, ctx)
+    index = await name_index.get_index(ctx, personal_cls, workshop_sub_meth, is_alias)
+    personal_obj = index.get_personal(name)
     # get list of subscription object ids
-    subscribed_obj_ids = []
-    async for subscription_doc in workshop_sub_meth(ctx):
-        for binding in subscription_doc[binding_key]:
-            if binding["name"] == name:
-                subscribed_obj_ids.append(binding["id"])
+    subscribed_obj_ids = index.get_workshop_ids(name)
 
     # if only personal, return personal (or none)
     if not subscribed_obj_ids:
@@ -183,6 +184,9 @@ async def get_collectable_named(
             "to manually rename it."
         )
     # otherwise return the subscribed
+    if workshop_cls is WorkshopAlias:
+        # load any subcommands with the alias, so handle_aliases can resolve them without another query
+        return await WorkshopAlias.from_id_with_subcommands(ctx, subscribed_obj_ids[0])
     return await workshop_cls.from_id(ctx, subscribed_obj_ids[0])
 
 
@@ -347,6 +351,7 @@ async def update_gvar(ctx, gid, value):
     elif len(value) > GVAR_SIZE_LIMIT:
         raise InvalidArgument(f"Gvars must be shorter than {GVAR_SIZE_LIMIT} characters.")
     await ctx.bot.mdb.gvars.update_one({"key": gid}, {"$set": {"value": value}})
+    await invalidate_gvar(ctx.bot, gid)
 
 
 # snippets
@@ -395,6 +400,7 @@ async def parse_snippets(args, ctx, statblock=None, character=None, base_args=No
                 the_snippet.code = the_snippet.code.replace("&ARGS&", str(original_args))
                 # enter the evaluator
                 execution_scope = ExecutionScope.SERVER_SNIPPET if server_invoker else ExecutionScope.PERSONAL_SNIPPET
+                await evaluator.prefetch(the_snippet.code)
                 args[index] = await evaluator.transformed_str_async(
                     the_snippet.code, execution_scope=execution_scope, invoking_object=the_snippet
                 )
@@ -407,6 +413,7 @@ async def parse_snippets(args, ctx, statblock=None, character=None, base_args=No
                     )
             else:
                 # in case the user is using old-style on the fly templating
+                await evaluator.prefetch(arg)
                 arg = await evaluator.transformed_str_async(arg, execution_scope=ExecutionScope.PERSONAL_SNIPPET)
                 args[index] = argquote(arg)
     finally:
@@ -436,6 +443,7 @@ async def parse_draconic(
         evaluator.with_statblock(statblock)
 
     try:
+        await evaluator.prefetch(program)
         out = await evaluator.transformed_str_async(
             program, execution_scope=execution_scope, invoking_object=invoking_object
         )
@@ -0,0 +1,153 @@
+"""
+An in-memory index of the names of the personal and workshop aliases/snippets in scope for a user or a guild, so that
+resolving a name (which happens on every prefixed message that is not a builtin command) does not need to query the
+personal collection and stream every workshop subscription each time.
+
+Indices are dropped on every cluster when the user's or guild's aliases, snippets, subscriptions, or bindings are
+edited through the bot. Entries also expire after a TTL, to pick up edits made on the dashboard.
+"""
+
+import asyncio
+import copy
+from collections import defaultdict
+
+import cachetools
+
+from utils import config, invalidation
+from utils.invalidation import guild_scope, user_scope
+
+NAME_INDEX_CACHE_NAME = "alias_name_index"
+
+
+class CollectableNameIndex:
+    def __init__(self, personal: dict, workshop: dict):
+        """
+        :param personal: A dict of {name: personal customization}.
+        :param workshop: A dict of {name: list of ObjectIds of workshop objects bound to the name}.
+        """
+        self._personal = personal
+        self._workshop = workshop
+
+    @classmethod
+    async def build(cls, ctx, personal_cls, workshop_sub_meth, is_alias):
+        binding_key = "alias_bindings" if is_alias else "snippet_bindings"
+
+        async def load_workshop_bindings():
+            bindings = defaultdict(list)
+            async for subscription_doc in workshop_sub_meth(ctx):
+                for binding in subscription_doc[binding_key]:
+                    bindings[binding["name"]].append(binding["id"])
+            return dict(bindings)
+
+        personal_objs, workshop_bindings = await asyncio.gather(personal_cls.get_all(ctx), load_workshop_bindings())
+        return cls({obj.name: obj for obj in personal_objs}, workshop_bindings)
+
+    def get_personal(self, name):
+        """Returns the personal customization named *name*, or None."""
+        obj = self._personal.get(name)
+        # return a copy so callers can't mutate the cached object
+        return copy.copy(obj) if obj is not None else None
+
+    def get_workshop_ids(self, name) -> list:
+        """Returns a list of the ObjectIds of the workshop objects bound to *name*."""
+        return list(self._workshop.get(name, ()))
+
+
+class _InvalidationGenerations(cachetools.TTLCache):
+    """
+    Scope key -> the generation at which the scope was last invalidated. An entry outlives every miss recorded before
+    it (they share a TTL), so an expired entry is no longer needed; an entry evicted early raises the floor that every
+    miss is checked against instead.
+    """
+
+    def __init__(self, maxsize, ttl):
+        super().__init__(maxsize=maxsize, ttl=ttl)
+        self.floor = 0
+
+    def popitem(self):
+        key, generation = super().popitem()
+        self.floor = max(self.floor, generation)
+        return key, generation
+
+    def invalidated_at(self, scope) -> int:
+        return self.get(scope, self.floor)
+
+
+# (scope key, is_alias) -> CollectableNameIndex
+_indices = cachetools.TTLCache(maxsize=int(config.ALIAS_INDEX_CACHE_SIZE), ttl=int(config.ALIAS_INDEX_CACHE_TTL))
+# (user id, guild id or None, name) -> generation, of recent names that resolved to no alias - most prefixed messages
+# that are not commands are typos, other bots' commands, or casual messages
+_misses = cachetools.TTLCache(maxsize=int(config.ALIAS_MISS_CACHE_SIZE), ttl=int(config.ALIAS_INDEX_CACHE_TTL))
+# a miss is stale if its user's or guild's scope was invalidated after it was recorded - checked on read, so that
+# invalidating a scope does not need to find its misses
+_invalidated = _InvalidationGenerations(
+    maxsize=int(config.ALIAS_MISS_CACHE_SIZE), ttl=int(config.ALIAS_INDEX_CACHE_TTL)
+)
+# incremented on every invalidation, so an index built while an invalidation happened is not cached
+_generation = 0
+
+
+async def get_index(ctx, personal_cls, workshop_sub_meth, is_alias) -> CollectableNameIndex:
+    """Returns the name index of the aliases or snippets in the scope of *personal_cls* in *ctx*."""
+    scope = guild_scope(ctx.guild.id) if personal_cls.is_server else user_scope(ctx.author.id)
+    key = (scope, is_alias)
+    if (index := _indices.get(key)) is not None:
+        return index
+    generation = _generation
+    index = await CollectableNameIndex.build(ctx, personal_cls, workshop_sub_meth, is_alias)
+    if generation == _generation:
+        _indices[key] = index
+    return index
+
+
+def is_known_miss(user_id, guild_id, name) -> bool:
+    """Returns whether *name* recently resolved to no alias for this user in this guild (None in DMs)."""
+    generation = _misses.get((user_id, guild_id, name))
+    if generation is None:
+        return False
+    if generation < _invalidated.invalidated_at(user_scope(user_id)):
+        return False
+    return guild_id is None or generation >= _invalidated.invalidated_at(guild_scope(guild_id))
+
+
+def current_generation() -> int:
+    """Returns a token to pass to :func:`record_miss`, taken before looking the name up."""
+    return _generation
+
+
+def record_miss(user_id, guild_id, name, generation):
+    """Records that *name* resolved to no alias, unless any index was invalidated since *generation* was taken."""
+    if generation == _generation:
+        _misses[(user_id, guild_id, name)] = generation
+
+
+def _invalidate_scopes(scopes):
+    global _generation
+    _generation += 1
+    for scope in scopes:
+        _indices.pop((scope, True), None)
+        _indices.pop((scope, False), None)
+
+        # a new alias in either the user's or the guild's scope may match a cached miss
+        _invalidated[scope] = _generation
+
+
+invalidation.register(NAME_INDEX_CACHE_NAME, _invalidate_scopes)
+
+
+async def invalidate_user(bot, user_id):
+    """Drops the alias and snippet name indices of a user on every cluster. Call after editing their collectables."""
+    await invalidation.invalidate(bot, NAME_INDEX_CACHE_NAME, user_scope(user_id))
+
+
+async def invalidate_guild(bot, guild_id):
+    """Drops the alias and snippet name indices of a guild on every cluster. Call after editing its collectables."""
+    await invalidation.invalidate(bot, NAME_INDEX_CACHE_NAME, guild_scope(guild_id))
+
+
+async def invalidate_ctx(ctx, is_server):
+    """Drops the name indices of the contextual guild (if *is_server*) or author."""
+    if is_server:
+        await invalidate_guild(ctx.bot, ctx.guild.id)
+    else:
+        await invalidate_user(ctx.bot, ctx.author.id)
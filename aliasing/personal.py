@@ -9,6 +9,8 @@
 
 
 class _CustomizationBase(abc.ABC):
+    is_server = False  # whether customizations are owned by a guild (otherwise, by a user)
+
     def __init__(self, _id, name, code, owner):
         self.id = _id
         self.name = name
@@ -72,6 +74,13 @@ async def get_named(cls, name, ctx):
         """
         raise NotImplementedError
 
+    @classmethod
+    async def get_all(cls, ctx):
+        """
+        Returns a list of all customizations in scope.
+        """
+        raise NotImplementedError
+
     @classmethod
     async def get_code_for(cls, name, ctx):
         """
@@ -128,8 +137,9 @@ async def delete(self, mdb):
         await mdb.aliases.delete_one({"owner": self.owner, "name": self.name})
 
     async def log_invocation(self, ctx, _):
-        await ctx.bot.mdb.analytics_alias_events.insert_one(
-            {"type": "alias", "object_id": self.id, "timestamp": datetime.datetime.utcnow(), "user_id": ctx.author.id}
+        await ctx.bot.analytics.insert(
+            "analytics_alias_events",
+            {"type": "alias", "object_id": self.id, "timestamp": datetime.datetime.utcnow(), "user_id": ctx.author.id},
         )
 
     @staticmethod
@@ -146,8 +156,17 @@ async def get_named(cls, name, ctx):
             return cls(doc["_id"], doc["name"], doc["commands"], doc["owner"])
         return None
 
+    @classmethod
+    async def get_all(cls, ctx):
+        return [
+            cls(doc["_id"], doc["name"], doc["commands"], doc["owner"])
+            async for doc in ctx.bot.mdb.aliases.find({"owner": str(ctx.author.id)})
+        ]
+
 
 class Servalias(_AliasBase):
+    is_server = True
+
     async def commit(self, mdb):
         result = await mdb.servaliases.update_one(
             {"server": self.owner, "name": self.name}, {"$set": {"commands": self.code}}, upsert=True
@@ -163,13 +182,14 @@ async def delete(self, mdb):
         await mdb.servaliases.delete_one({"server": self.owner, "name": self.name})
 
     async def log_invocation(self, ctx, _):
-        await ctx.bot.mdb.analytics_alias_events.insert_one(
+        await ctx.bot.analytics.insert(
+            "analytics_alias_events",
             {
                 "type": "servalias",
                 "object_id": self.id,
                 "timestamp": datetime.datetime.utcnow(),
                 "user_id": ctx.author.id,
-            }
+            },
         )
 
     @staticmethod
@@ -186,6 +206,13 @@ async def get_named(cls, name, ctx):
             return cls(doc["_id"], doc["name"], doc["commands"], doc["server"])
         return None
 
+    @classmethod
+    async def get_all(cls, ctx):
+        return [
+            cls(doc["_id"], doc["name"], doc["commands"], doc["server"])
+            async for doc in ctx.bot.mdb.servaliases.find({"server": str(ctx.guild.id)})
+        ]
+
 
 class Snippet(_SnippetBase):
     async def commit(self, mdb):
@@ -203,8 +230,14 @@ async def delete(self, mdb):
         await mdb.snippets.delete_one({"owner": self.owner, "name": self.name})
 
     async def log_invocation(self, ctx, _):
-        await ctx.bot.mdb.analytics_alias_events.insert_one(
-            {"type": "snippet", "object_id": self.id, "timestamp": datetime.datetime.utcnow(), "user_id": ctx.author.id}
+        await ctx.bot.analytics.insert(
+            "analytics_alias_events",
+            {
+                "type": "snippet",
+                "object_id": self.id,
+                "timestamp": datetime.datetime.utcnow(),
+                "user_id": ctx.author.id,
+            },
         )
 
     @staticmethod
@@ -221,8 +254,17 @@ async def get_named(cls, name, ctx):
             return cls(doc["_id"], doc["name"], doc["snippet"], doc["owner"])
         return None
 
+    @classmethod
+    async def get_all(cls, ctx):
+        return [
+            cls(doc["_id"], doc["name"], doc["snippet"], doc["owner"])
+            async for doc in ctx.bot.mdb.snippets.find({"owner": str(ctx.author.id)})
+        ]
+
 
 class Servsnippet(_SnippetBase):
+    is_server = True
+
     async def commit(self, mdb):
         result = await mdb.servsnippets.update_one(
             {"server": self.owner, "name": self.name}, {"$set": {"snippet": self.code}}, upsert=True
@@ -238,13 +280,14 @@ async def delete(self, mdb):
         await mdb.servsnippets.delete_one({"server": self.owner, "name": self.name})
 
     async def log_invocation(self, ctx, _):
-        await ctx.bot.mdb.analytics_alias_events.insert_one(
+        await ctx.bot.analytics.insert(
+            "analytics_alias_events",
             {
                 "type": "servsnippet",
                 "object_id": self.id,
                 "timestamp": datetime.datetime.utcnow(),
                 "user_id": ctx.author.id,
-            }
+            },
         )
 
     @staticmethod
@@ -261,3 +304,10 @@ async def get_named(cls, name, ctx):
         if doc:
             return cls(doc["_id"], doc["name"], doc["snippet"], doc["server"])
         return None
+
+    @classmethod
+    async def get_all(cls, ctx):
+        return [
+            cls(doc["_id"], doc["name"], doc["snippet"], doc["server"])
+            async for doc in ctx.bot.mdb.servsnippets.find({"server": str(ctx.guild.id)})
+        ]
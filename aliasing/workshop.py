@@ -6,6 +6,7 @@
 
 from bson import ObjectId
 
+from aliasing import name_index
 from aliasing.errors import CollectableNotFound, CollectionNotFound
 from cogs5e.models.errors import NotAllowed
 from utils.subscription_mixins import EditorMixin, GuildActiveMixin, SubscriberMixin
@@ -218,31 +219,35 @@ async def subscribe(self, ctx):
                 "snippet_bindings": snippet_bindings,
             }
         )
+        await name_index.invalidate_user(ctx.bot, ctx.author.id)
         # increase subscription count
         await ctx.bot.mdb.workshop_collections.update_one({"_id": self.id}, {"$inc": {"num_subscribers": 1}})
         # log subscribe event
-        await ctx.bot.mdb.analytics_alias_events.insert_one(
+        await ctx.bot.analytics.insert(
+            "analytics_alias_events",
             {
                 "type": "subscribe",
                 "object_id": self.id,
                 "timestamp": datetime.datetime.utcnow(),
                 "user_id": ctx.author.id,
-            }
+            },
         )
 
     async def unsubscribe(self, ctx):
         # remove sub doc
         await super().unsubscribe(ctx)
+        await name_index.invalidate_user(ctx.bot, ctx.author.id)
         # decr sub count
         await ctx.bot.mdb.workshop_collections.update_one({"_id": self.id}, {"$inc": {"num_subscribers": -1}})
         # log unsub event
-        await ctx.bot.mdb.analytics_alias_events.insert_one(
+        await ctx.bot.analytics.insert(
+            "analytics_alias_events",
             {
                 "type": "unsubscribe",
                 "object_id": self.id,
                 "timestamp": datetime.datetime.utcnow(),
                 "user_id": ctx.author.id,
-            }
+            },
         )
 
     async def set_server_active(self, ctx):
@@ -266,16 +271,18 @@ async def set_server_active(self, ctx):
                 "snippet_bindings": snippet_bindings,
             }
         )
+        await name_index.invalidate_guild(ctx.bot, ctx.guild.id)
         # incr sub count
         await ctx.bot.mdb.workshop_collections.update_one({"_id": self.id}, {"$inc": {"num_guild_subscribers": 1}})
         # log sub event
-        await ctx.bot.mdb.analytics_alias_events.insert_one(
+        await ctx.bot.analytics.insert(
+            "analytics_alias_events",
             {
                 "type": "server_subscribe",
                 "object_id": self.id,
                 "timestamp": datetime.datetime.utcnow(),
                 "user_id": ctx.author.id,
-            }
+            },
         )
 
     async def unset_server_active(self, ctx):
@@ -284,16 +291,18 @@ async def unset_server_active(self, ctx):
 
         # remove sub doc
         await super().unset_server_active(ctx)
+        await name_index.invalidate_guild(ctx.bot, ctx.guild.id)
         # decr sub count
         await ctx.bot.mdb.workshop_collections.update_one({"_id": self.id}, {"$inc": {"num_guild_subscribers": -1}})
         # log unsub event
-        await ctx.bot.mdb.analytics_alias_events.insert_one(
+        await ctx.bot.analytics.insert(
+            "analytics_alias_events",
             {
                 "type": "server_unsubscribe",
                 "object_id": self.id,
                 "timestamp": datetime.datetime.utcnow(),
                 "user_id": ctx.author.id,
-            }
+            },
         )
 
     async def _bindings_sanity_check(self, ctx, the_ids, the_bindings, binding_cls):
@@ -307,6 +316,13 @@ async def _bindings_sanity_check(self, ctx, the_ids, the_bindings, binding_cls):
         # sanity check: ensure there is no binding to anything deleted
         return [b for b in the_bindings if b["id"] in the_ids]
 
+    @staticmethod
+    async def _invalidate_subscriber_index(ctx, subscription_doc):
+        if subscription_doc["type"] == "server_active":
+            await name_index.invalidate_guild(ctx.bot, subscription_doc["subscriber_id"])
+        else:
+            await name_index.invalidate_user(ctx.bot, subscription_doc["subscriber_id"])
+
     async def update_alias_bindings(self, ctx, subscription_doc):
         """Updates the alias bindings for a given subscription (given the entire subscription document)."""
         the_bindings = await self._bindings_sanity_check(
@@ -316,6 +332,7 @@ async def update_alias_bindings(self, ctx, subscription_doc):
         await self.sub_coll(ctx).update_one(
             {"_id": subscription_doc["_id"]}, {"$set": {"alias_bindings": the_bindings}}
         )
+        await self._invalidate_subscriber_index(ctx, subscription_doc)
 
     async def update_snippet_bindings(self, ctx, subscription_doc):
         """Updates the snippet bindings for a given subscription (given the entire subscription document)."""
@@ -326,6 +343,7 @@ async def update_snippet_bindings(self, ctx, subscription_doc):
         await self.sub_coll(ctx).update_one(
             {"_id": subscription_doc["_id"]}, {"$set": {"snippet_bindings": the_bindings}}
         )
+        await self._invalidate_subscriber_index(ctx, subscription_doc)
 
 
 class WorkshopCollectableObject(abc.ABC):
@@ -467,14 +485,42 @@ async def from_id(cls, ctx, _id, collection=None, parent=None):
             raise CollectableNotFound()
         return cls.from_dict(raw, collection, parent)
 
+    @classmethod
+    async def from_id_with_subcommands(cls, ctx, _id, collection=None):
+        """Loads the alias and its direct subcommands in one query."""
+        if not isinstance(_id, ObjectId):
+            _id = ObjectId(_id)
+
+        alias_raw = None
+        subcommands_raw = []
+        async for raw in ctx.bot.mdb.workshop_aliases.find({"$or": [{"_id": _id}, {"parent_id": _id}]}):
+            if raw["_id"] == _id:
+                alias_raw = raw
+            else:
+                subcommands_raw.append(raw)
+        if alias_raw is None:
+            raise CollectableNotFound()
+
+        inst = cls.from_dict(alias_raw, collection)
+        order = {sc_id: i for i, sc_id in enumerate(inst._subcommand_ids)}
+        subcommands_raw.sort(key=lambda raw: order.get(raw["_id"], len(order)))
+        inst._subcommands = [cls.from_dict(raw, collection, parent=inst) for raw in subcommands_raw]
+        return inst
+
     # helpers
     async def log_invocation(self, ctx, is_server):
         inv_type = "workshop_alias" if not is_server else "workshop_servalias"
-        await ctx.bot.mdb.analytics_alias_events.insert_one(
-            {"type": inv_type, "object_id": self.id, "timestamp": datetime.datetime.utcnow(), "user_id": ctx.author.id}
+        await ctx.bot.analytics.insert(
+            "analytics_alias_events",
+            {"type": inv_type, "object_id": self.id, "timestamp": datetime.datetime.utcnow(), "user_id": ctx.author.id},
         )
 
     async def get_subalias_named(self, ctx, name):
+        if self._subcommands is not None:
+            for subcommand in self._subcommands:
+                if subcommand.name == name:
+                    return subcommand
+            raise CollectableNotFound()
         alias = await ctx.bot.mdb.workshop_aliases.find_one({"parent_id": self.id, "name": name})
         if alias is None:
             raise CollectableNotFound()
@@ -500,8 +546,9 @@ async def from_id(cls, ctx, _id, collection=None):
     # helpers
     async def log_invocation(self, ctx, is_server):
         inv_type = "workshop_snippet" if not is_server else "workshop_servsnippet"
-        await ctx.bot.mdb.analytics_alias_events.insert_one(
-            {"type": inv_type, "object_id": self.id, "timestamp": datetime.datetime.utcnow(), "user_id": ctx.author.id}
+        await ctx.bot.analytics.insert(
+            "analytics_alias_events",
+            {"type": inv_type, "object_id": self.id, "timestamp": datetime.datetime.utcnow(), "user_id": ctx.author.id},
         )
 
 
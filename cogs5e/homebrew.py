@@ -133,7 +133,9 @@ async def bestiary_update(self, ctx):
         loading = await ctx.send("Updating bestiary (this may take a while for large bestiaries)...")
 
         old_server_subs = await old_bestiary.server_subscriptions(ctx)
-        bestiary = await Bestiary.from_critterdb(ctx, old_bestiary.upstream, old_bestiary.published)
+        bestiary = await Bestiary.from_critterdb(
+            ctx, old_bestiary.upstream, old_bestiary.published, previous=old_bestiary
+        )
 
         # only do subscription operations if there was actually a change
         if bestiary.sha256 != old_bestiary.sha256:
@@ -25,6 +25,7 @@ async def handle(
         button_id: str,
         message_type: InteractionMessageType,
     ):
+        # the interaction was deferred by the caller (in some rate-limited cases we can fail the 3-second response time)
         # load the combat
         try:
             # oh boy, here we go with ctx duck-typing
@@ -70,9 +71,6 @@ async def handle(
             await update_triggering_message(inter, combat, combatant, message_type)
             return
 
-        # in some rate-limited cases we can fail the 3-second response time so we have to defer each interaction
-        await inter.response.defer()
-
         # anyway, we're good to run the automation!
         if button_interaction.verb is not None:
             verb = button_interaction.verb
@@ -73,6 +73,11 @@ async def cog_check(self, ctx):
 
     async def cog_before_invoke(self, ctx):
         await try_delete(ctx.message)
+        # commands in a channel change its combat one at a time, so they see each other's changes (see get_combat)
+        ctx.locks_combat = True
+
+    async def cog_after_invoke(self, ctx):
+        ctx.release_combat_lock()
 
     def cog_unload(self):
         self.nlp.deregister_listeners()
@@ -91,13 +96,17 @@ async def on_button_click(self, interaction: disnake.MessageInteraction):
                     # interaction_message_type added v4.0.8
                     _, combatant_id, effect_id, button_id = interaction.data.custom_id.split(":")
                     message_type = utils.InteractionMessageType.STATUS_GROUP
-                await self.buttons.handle(
-                    interaction,
-                    combatant_id=combatant_id,
-                    effect_id=effect_id,
-                    button_id=button_id,
-                    message_type=message_type,
-                )
+                # acknowledge the click now: another command may be holding the combat for longer than the
+                # 3-second response time
+                await interaction.response.defer()
+                async with Combat.channel_lock(str(interaction.channel_id)):
+                    await self.buttons.handle(
+                        interaction,
+                        combatant_id=combatant_id,
+                        effect_id=effect_id,
+                        button_id=button_id,
+                        message_type=message_type,
+                    )
             except ValueError:
                 log.exception("Failed to handle init effect button click interaction:")
 
@@ -118,6 +127,7 @@ async def begin(self, ctx, *args):
         `-name <name>` - Sets a name for the combat instance.
         `norecord` - If the server has opted in to the Natural Language Training project, omit this combat from recording.
         """  # noqa E501
+        await ctx.lock_combat()
         await Combat.ensure_unique_chan(ctx)
         guild_settings = await ctx.get_server_settings()
 
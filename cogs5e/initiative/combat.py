@@ -1,4 +1,7 @@
 import asyncio
+import logging
+import time
+import weakref
 from functools import cached_property
 from typing import List, Literal, Optional, TYPE_CHECKING, Tuple, Union, overload
 
@@ -8,13 +11,23 @@
 from pydantic import BaseModel
 
 from cogs5e.models.errors import NoCharacter
+from utils import config, dirty, invalidation
 from utils.functions import search_and_select
 from .combatant import Combatant, MonsterCombatant, PlayerCombatant
 from .errors import *
 from .group import CombatantGroup
 from .types import CombatantType
 
+log = logging.getLogger(__name__)
+
 COMBAT_TTL = 60 * 60 * 24 * 7  # 1 week TTL
+COMBAT_CACHE_NAME = "combats"
+# times to rebase a commit onto a combat changed concurrently by another command before giving up
+COMMIT_MAX_RETRIES = 3
+# combatant fields whose concurrent changes are both applied when rebasing a commit (e.g. two attacks' damage)
+ADDITIVE_COMBATANT_FIELDS = ("hp",)
+# a combat that keeps being changed is still written at least every this many debounce delays
+COMMIT_DEBOUNCE_MAX_FACTOR = 5
 
 # ==== typing ====
 if TYPE_CHECKING:
@@ -32,12 +45,22 @@ class CombatOptions(BaseModel):
 
 
 class Combat:
-    # we cache up to 500 combats in memory for a short period
+    # we cache combats in memory for a short period
     # this makes sure that multiple calls to Combat.from_ctx() in the same invocation or two simultaneous ones
     # retrieve/modify the same Combat state
     # caches based on channel id
-    # probably won't encounter any scaling issues, since a combat will be shard-specific
-    _cache: cachetools.TTLCache[str, "Combat"] = cachetools.TTLCache(maxsize=500, ttl=10)
+    # other processes drop their copy when a combat is written or ended (e.g. by a button interaction routed elsewhere)
+    _cache: cachetools.TTLCache[str, "Combat"] = cachetools.TTLCache(
+        maxsize=int(config.COMBAT_CACHE_SIZE), ttl=int(config.COMBAT_CACHE_TTL)
+    )
+    # channel id -> asyncio.Lock, held by an initiative command (or button) while it uses the combat, so that commands
+    # in one channel apply their changes to the live combat one at a time - see channel_lock()
+    _channel_locks = weakref.WeakValueDictionary()
+    # debounced writes: combats committed but not yet written, by channel id - see commit()
+    # these are always the latest state of the combat, so loading a combat checks here first
+    _pending_commits = {}
+    # channel id -> asyncio.Lock, held while writing or deleting the combat
+    _write_locks = weakref.WeakValueDictionary()
 
     def __init__(
         self,
@@ -69,6 +92,13 @@ def __init__(
         self.metadata = metadata
         self.nlp_record_session_id = nlp_record_session_id
 
+        # snapshots of the combat as it is in the db, to only write what changed on commit
+        self._committed_snapshot = None  # top-level fields, excluding combatants
+        self._committed_combatants = None  # list of (combatant id, combatant snapshot)
+        # incremented on every write, so a commit can tell whether the combat changed since it was loaded
+        # None if the combat in the db is not our committed state (it has another command's changes merged in)
+        self._version = 0
+
     @classmethod
     def new(
         cls,
@@ -87,6 +117,8 @@ async def from_ctx(cls, ctx):  # cached
 
     @classmethod
     async def from_id(cls, channel_id: str, ctx):
+        if (pending := cls._pending_commits.get(channel_id)) is not None:
+            return pending.combat
         try:
             return cls._cache[channel_id]
         except KeyError:
@@ -116,12 +148,16 @@ async def from_dict(cls, raw, ctx):
         )
         for c in raw["combatants"]:
             inst._combatants.append(await deserialize_combatant(c, ctx, inst))
+        inst._version = raw.get("version", 0)
+        inst._mark_committed(inst.to_dict())
         return inst
 
     # sync deser/ser
     @classmethod
     def from_ctx_sync(cls, ctx):  # cached
         channel_id = str(ctx.channel.id)
+        if (pending := cls._pending_commits.get(channel_id)) is not None:
+            return pending.combat
         try:
             return cls._cache[channel_id]
         except KeyError:
@@ -151,6 +187,8 @@ def from_dict_sync(cls, raw, ctx):
         )
         for c in raw["combatants"]:
             inst._combatants.append(deserialize_combatant_sync(c, ctx, inst))
+        inst._version = raw.get("version", 0)
+        inst._mark_committed(inst.to_dict())
         return inst
 
     def to_dict(self):
@@ -501,11 +539,15 @@ async def end(self):
         """Ends combat in a channel."""
         for c in self._combatants:
             c.on_remove()
-        await self.ctx.bot.mdb.combats.delete_one({"channel": self._channel})
+        async with Combat._write_lock(self._channel):
+            if (pending := Combat._pending_commits.pop(self._channel, None)) is not None:
+                pending.cancel()
+            await self.ctx.bot.mdb.combats.delete_one({"channel": self._channel})
         try:
             del Combat._cache[self._channel]
         except KeyError:
             pass
+        await invalidation.invalidate_remote(self.ctx.bot, COMBAT_CACHE_NAME, self._channel)
 
     # stringification
     def get_turn_str(self, status=True, **kwargs) -> Optional[str]:
@@ -587,16 +629,210 @@ def get_summary(self, private=False) -> str:
 
     # db
     async def commit(self, ctx):
-        """Commits the combat to db."""
+        """
+        Commits the combat to db, writing only the fields and combatants that changed since the last commit.
+
+        If another command changed the combat since it was loaded, our changes are rebased onto theirs (see
+        :meth:`_merge`), and this object is dropped from the cache so the next command loads the merged combat.
+
+        If ``COMBAT_COMMIT_DEBOUNCE`` is set, the write is deferred until the combat has not been committed for that
+        many seconds, and every commit in the meantime is written along with it. Until then, loading the combat returns
+        this object.
+        """
         for pc in self.get_combatants():
-            if isinstance(pc, PlayerCombatant):
+            if isinstance(pc, PlayerCombatant) and pc.character.has_uncommitted_changes():
                 await pc.character.commit(ctx)
-        await ctx.bot.mdb.combats.update_one(
-            {"channel": self._channel},
-            {"$set": self.to_dict(), "$currentDate": {"lastchanged": True}},
-            upsert=True,
+
+        delay = float(config.COMBAT_COMMIT_DEBOUNCE)
+        if delay > 0:
+            self._schedule_commit(ctx.bot, delay)
+        else:
+            async with Combat._write_lock(self._channel):
+                await self._write(ctx.bot)
+
+    async def _write(self, bot):
+        data = self.to_dict()
+        if self._committed_snapshot is None:  # a new combat
+            await bot.mdb.combats.update_one(
+                {"channel": self._channel},
+                {"$set": {**data, "version": 1}, "$currentDate": {"lastchanged": True}},
+                upsert=True,
+            )
+            await self._committed(bot, data, 1)
+            return
+
+        update = self._get_delta_update(data)
+        if update is not None:
+            query, to_set, to_unset = update
+        else:  # combatants were added, removed, or reordered
+            query, to_set, to_unset = {"channel": self._channel}, data, {}
+        if not (to_set or to_unset):  # nothing changed
+            return
+        # compare-and-set: only write if no one else has since we loaded the combat
+        if self._version is not None:
+            query["version"] = self._version or None  # combats from before versioning have no version
+            update_doc = {"$currentDate": {"lastchanged": True}, "$inc": {"version": 1}}
+            if to_set:
+                update_doc["$set"] = to_set
+            if to_unset:
+                update_doc["$unset"] = to_unset
+            result = await bot.mdb.combats.update_one(query, update_doc)
+            if result.matched_count:
+                await self._committed(bot, data, self._version + 1)
+                return
+
+        # someone else changed the combat: rebase our changes onto theirs
+        for _ in range(COMMIT_MAX_RETRIES):
+            latest = await bot.mdb.combats.find_one({"channel": self._channel})
+            if latest is None:  # the combat was ended - don't recreate it
+                Combat._cache.pop(self._channel, None)
+                return
+            latest_version = latest.get("version", 0)
+            merged = self._merge(latest, data)
+            result = await bot.mdb.combats.update_one(
+                {"channel": self._channel, "version": latest_version or None},
+                {"$set": merged, "$currentDate": {"lastchanged": True}, "$inc": {"version": 1}},
+            )
+            if result.matched_count:
+                # this object does not have their changes, so make sure the next command loads the merged combat
+                Combat._cache.pop(self._channel, None)
+                # this object may still be committed again (by the running command, or a pending debounced write):
+                # record our own state as committed, but with no version, so that the next write is rebased onto the
+                # latest combat again rather than overwriting their changes
+                await self._committed(bot, data, None)
+                return
+        raise CombatConflict()
+
+    async def _committed(self, bot, data, version):
+        self._version = version
+        self._mark_committed(data)
+        await invalidation.invalidate_remote(bot, COMBAT_CACHE_NAME, self._channel)
+
+    def _merge(self, latest, data) -> dict:
+        """
+        Returns the combat *data* (our state) rebased onto *latest* (the combat in the db), from the state we last
+        committed: fields we changed take precedence, except concurrent HP changes, which are both applied.
+
+        Combatants added, removed, or reordered by either side are kept that way. If both sides did so, the combat
+        order (and each combatant's index in it) cannot be reconciled, so this raises :exc:`CombatConflict`.
+        """
+        merged = dirty.merge(
+            self._committed_snapshot,
+            {k: v for k, v in data.items() if k != "combatants"},
+            {k: v for k, v in latest.items() if k not in ("_id", "combatants", "version", "lastchanged")},
         )
 
+        base_combatants = dict(self._committed_combatants)
+        ours_by_id = {c["id"]: c for c in data["combatants"]}
+        theirs_by_id = {c["id"]: c for c in latest["combatants"]}
+        we_changed_order = list(ours_by_id) != list(base_combatants)
+        they_changed_order = list(theirs_by_id) != list(base_combatants)
+        if we_changed_order and they_changed_order:
+            raise CombatConflict()
+        # the side that did not add, remove, or reorder combatants has every combatant the other side has
+        order = list(ours_by_id) if we_changed_order else list(theirs_by_id)
+
+        combatants = []
+        for cid in order:
+            ours, theirs = ours_by_id.get(cid), theirs_by_id.get(cid)
+            if cid not in base_combatants:  # added by one side
+                combatants.append(ours or theirs)
+            else:
+                combatants.append(dirty.merge(base_combatants[cid], ours, theirs, additive=ADDITIVE_COMBATANT_FIELDS))
+        merged["combatants"] = combatants
+        return merged
+
+    def _mark_committed(self, data):
+        """Records *data* (the output of ``to_dict()``) as the state of this combat in the db."""
+        self._committed_snapshot = dirty.snapshot({k: v for k, v in data.items() if k != "combatants"})
+        self._committed_combatants = [(c["id"], dirty.snapshot(c)) for c in data["combatants"]]
+
+    def _get_delta_update(self, data) -> Optional[Tuple[dict, dict, dict]]:
+        """
+        Returns a tuple (query, $set, $unset) that updates the committed combat to *data*, or None if the whole combat
+        must be written (it was never committed, or combatants were added, removed, or reordered).
+        """
+        if self._committed_snapshot is None:
+            return None
+        if [c["id"] for c in data["combatants"]] != [cid for cid, _ in self._committed_combatants]:
+            return None
+
+        query = {"channel": self._channel}
+        to_set, to_unset = dirty.diff({k: v for k, v in data.items() if k != "combatants"}, self._committed_snapshot)
+        for i, (combatant, (cid, old_snapshot)) in enumerate(zip(data["combatants"], self._committed_combatants)):
+            c_set, c_unset = dirty.diff(combatant, old_snapshot, prefix=f"combatants.{i}.")
+            if c_set or c_unset:
+                # only update the combatant where we expect it to be
+                query[f"combatants.{i}.id"] = cid
+                to_set.update(c_set)
+                to_unset.update(c_unset)
+        return query, to_set, to_unset
+
+    # ---------- CHANNEL ACTOR ----------
+    @classmethod
+    def channel_lock(cls, channel_id: str) -> asyncio.Lock:
+        """
+        Returns the lock that commands changing the combat in a channel hold from loading the combat until they finish,
+        except while they wait for user input (see :meth:`utils.context.AvraeContext.lock_combat`). Holding it makes
+        the command the only one loading, changing, and committing the channel's combat in this process until it is
+        released.
+        """
+        lock = cls._channel_locks.get(channel_id)
+        if lock is None:
+            lock = cls._channel_locks[channel_id] = asyncio.Lock()
+        return lock
+
+    @classmethod
+    def _write_lock(cls, channel_id) -> asyncio.Lock:
+        lock = cls._write_locks.get(channel_id)
+        if lock is None:
+            lock = cls._write_locks[channel_id] = asyncio.Lock()
+        return lock
+
+    def _schedule_commit(self, bot, delay):
+        now = time.monotonic()
+        pending = Combat._pending_commits.get(self._channel)
+        if pending is None:
+            pending = Combat._pending_commits[self._channel] = _PendingCommit(self, bot)
+        pending.combat = self
+        pending.version += 1
+        if pending.task is None:
+            pending.latest_write_at = now + delay * COMMIT_DEBOUNCE_MAX_FACTOR
+            pending.task = asyncio.create_task(Combat._flush_later(self._channel))
+        pending.write_at = min(now + delay, pending.latest_write_at)
+
+    @classmethod
+    async def _flush_later(cls, channel_id):
+        while (pending := cls._pending_commits.get(channel_id)) is not None:
+            remaining = pending.write_at - time.monotonic()
+            if remaining <= 0:
+                pending.task = None  # commits from now on schedule another write
+                await cls._flush(channel_id)
+                return
+            await asyncio.sleep(remaining)
+
+    @classmethod
+    async def _flush(cls, channel_id):
+        async with cls._write_lock(channel_id):
+            pending = cls._pending_commits.get(channel_id)
+            if pending is None:
+                return
+            version = pending.version
+            try:
+                await pending.combat._write(pending.bot)
+            except Exception:
+                log.exception(f"Failed to write combat in channel {channel_id}")
+            # the entry stays until the write completes, so loads in the meantime return the written object
+            if pending.version == version:
+                del cls._pending_commits[channel_id]
+
+    @classmethod
+    async def flush_pending_commits(cls):
+        """Writes every deferred commit now. Call before shutting down."""
+        for channel_id, pending in list(cls._pending_commits.items()):
+            pending.cancel()
+            await cls._flush(channel_id)
+
     async def final(self, ctx):
         """Commit, update the summary message, and fire any recorder events in parallel."""
         # Eventually edit the summary message with the latest summary - this is fire-and-forget so that edit ratelimits
@@ -610,6 +846,8 @@ async def final(self, ctx):
     # misc
     @staticmethod
     async def ensure_unique_chan(ctx):
+        if str(ctx.channel.id) in Combat._pending_commits:
+            raise ChannelInCombat
         if await ctx.bot.mdb.combats.find_one({"channel": str(ctx.channel.id)}):
             raise ChannelInCombat
 
@@ -639,6 +877,31 @@ def __str__(self):
         return f"Initiative in <#{self.channel_id}>"
 
 
+def _invalidate_cached_combats(channel_ids):
+    for channel_id in channel_ids:
+        Combat._cache.pop(channel_id, None)
+
+
+invalidation.register(COMBAT_CACHE_NAME, _invalidate_cached_combats)
+
+
+class _PendingCommit:
+    __slots__ = ("combat", "bot", "version", "task", "write_at", "latest_write_at")
+
+    def __init__(self, combat, bot):
+        self.combat = combat
+        self.bot = bot
+        self.version = 0  # incremented on every commit, to tell whether a commit happened during a write
+        self.task = None  # the task that will write the combat, if one is scheduled
+        self.write_at = 0  # time.monotonic() after which to write the combat, pushed back by every commit
+        self.latest_write_at = 0  # the latest write_at can be pushed back to
+
+    def cancel(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+
 async def deserialize_combatant(raw_combatant, ctx, combat):
     ctype = CombatantType(raw_combatant["type"])
     if ctype == CombatantType.GENERIC:
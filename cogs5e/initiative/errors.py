@@ -7,6 +7,7 @@
     "ChannelInCombat",
     "CombatChannelNotFound",
     "NoCombatants",
+    "CombatConflict",
 )
 
 
@@ -49,3 +50,10 @@ class NoCombatants(CombatException):
 
     def __init__(self):
         super().__init__("There are no combatants.")
+
+
+class CombatConflict(CombatException):
+    """Raised when a combat cannot be committed because changes made by other commands at once could not be merged."""
+
+    def __init__(self):
+        super().__init__("This combat was changed by another command at the same time. Please try again.")
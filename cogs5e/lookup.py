@@ -625,7 +625,7 @@ async def lookup_settings(self, ctx, *args):
             out.append(f"pm_result set to {setting}!")
 
         if out:
-            await guild_settings.commit(ctx.bot.mdb)
+            await guild_settings.commit(ctx.bot)
             await ctx.send("Lookup settings set:\n" + "\n".join(out))
         else:
             await ctx.send(f"No settings found. Try using `{ctx.prefix}lookup_settings` to open an interactive menu.")
@@ -649,7 +649,7 @@ async def on_guild_join(self, guild):
 
         if guild.member_count >= LARGE_THRESHOLD:
             guild_settings = utils.settings.ServerSettings(guild_id=guild.id, lookup_dm_required=False)
-            await guild_settings.commit(self.bot.mdb)
+            await guild_settings.commit(self.bot)
 
 
 def setup(bot):
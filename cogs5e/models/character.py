@@ -1,6 +1,9 @@
+import asyncio
 import logging
+import weakref
 from collections import namedtuple
 
+import bson
 import cachetools
 from disnake.ext.commands import NoPrivateMessage
 
@@ -19,6 +22,7 @@
 from cogs5e.models.sheet.statblock import DESERIALIZE_MAP as _DESER, StatBlock
 from cogs5e.models.sheet.coinpurse import Coinpurse
 from cogs5e.sheets.abc import SHEET_VERSION
+from utils import config, dirty, invalidation
 from utils.functions import search_and_select
 from utils.settings import CharacterSettings
 
@@ -29,11 +33,16 @@
 
 
 class Character(StatBlock):
-    # cache characters for 10 seconds to avoid race conditions
+    # cache characters for a short time to avoid race conditions
     # this makes sure that multiple calls to Character.from_ctx() in the same invocation or two simultaneous ones
     # retrieve/modify the same Character state
-    # caches based on (owner, upstream)
-    _cache = cachetools.TTLCache(maxsize=50, ttl=5)
+    # caches based on (owner, upstream); other processes drop their copy when a character is written (see _write)
+    _cache = cachetools.TTLCache(maxsize=int(config.CHARACTER_CACHE_SIZE), ttl=int(config.CHARACTER_CACHE_TTL))
+    # write-behind: characters committed but not yet written, by (owner, upstream) - see commit()
+    # these are always the latest state of the character, so loading a character checks here first
+    _pending_commits = {}
+    # (owner, upstream) -> asyncio.Lock, held while writing or deleting the character
+    _commit_locks = weakref.WeakValueDictionary()
 
     def __init__(
         self,
@@ -145,6 +154,9 @@ def __init__(
         # action automation
         self.actions = actions
 
+        # snapshot of the data last read from or written to the db, to tell whether a commit is needed
+        self._committed_snapshot = None
+
     # ---------- Deserialization ----------
     @classmethod
     def from_dict(cls, d):
@@ -153,7 +165,9 @@ def from_dict(cls, d):
         for key, klass in DESERIALIZE_MAP.items():
             if key in d:
                 d[key] = klass.from_dict(d[key])
-        return cls(**d)
+        inst = cls(**d)
+        inst._committed_snapshot = dirty.snapshot(inst._commit_data(), COMMIT_SUBDOCUMENTS)
+        return inst
 
     @classmethod
     async def from_ctx(cls, ctx, ignore_guild: bool = False):
@@ -167,6 +181,9 @@ async def from_ctx(cls, ctx, ignore_guild: bool = False):
         if active_character is None:
             raise NoCharacter()
 
+        if (pending := cls._pending_commits.get((owner_id, active_character["upstream"]))) is not None:
+            return pending.character
+
         try:
             # return from cache if available
             return cls._cache[owner_id, active_character["upstream"]]
@@ -180,6 +197,9 @@ async def from_ctx(cls, ctx, ignore_guild: bool = False):
     async def from_bot_and_ids(cls, bot, owner_id: str, character_id: str):
         owner_id = str(owner_id)
 
+        if (pending := cls._pending_commits.get((owner_id, character_id))) is not None:
+            return pending.character
+
         try:
             # read from cache if available
             return cls._cache[owner_id, character_id]
@@ -194,10 +214,21 @@ async def from_bot_and_ids(cls, bot, owner_id: str, character_id: str):
         cls._cache[owner_id, character_id] = inst
         return inst
 
+    @staticmethod
+    async def list_owned(ctx, owner_id: str) -> list[dict]:
+        """
+        Returns a list of dicts with the name, upstream, active flag, and sheet type of each character the owner owns.
+        Use :meth:`from_bot_and_ids` to load the full character.
+        """
+        return await ctx.bot.mdb.characters.find({"owner": str(owner_id)}, projection=INDEX_PROJECTION).to_list(None)
+
     @classmethod
     def from_bot_and_ids_sync(cls, bot, owner_id: str, character_id: str):
         owner_id = str(owner_id)
 
+        if (pending := cls._pending_commits.get((owner_id, character_id))) is not None:
+            return pending.character
+
         try:
             # read from cache if available
             return cls._cache[owner_id, character_id]
@@ -242,11 +273,16 @@ def to_dict(self):
 
     @staticmethod
     async def delete(ctx, owner_id, upstream):
-        await ctx.bot.mdb.characters.delete_one({"owner": owner_id, "upstream": upstream})
+        async with Character._commit_lock((owner_id, upstream)):
+            # a pending write would recreate the character
+            if (pending := Character._pending_commits.pop((owner_id, upstream), None)) is not None:
+                pending.cancel()
+            await ctx.bot.mdb.characters.delete_one({"owner": owner_id, "upstream": upstream})
         try:
             del Character._cache[owner_id, upstream]
         except KeyError:
             pass
+        await invalidation.invalidate_remote(ctx.bot, CHARACTER_CACHE_NAME, [owner_id, upstream])
 
     # ---------- Basic CRUD ----------
     def get_color(self) -> int:
@@ -315,24 +351,122 @@ def get_scope_locals(self, no_cvars=False):
         return out
 
     # ---------- DATABASE ----------
-    async def commit(self, ctx, do_live_integrations=True):
-        """Writes a character object to the database, under the contextual author."""
+    def _commit_data(self):
         data = self.to_dict()
         data.pop("active")  # #1472 - may regress when doing atomic commits, be careful
         data.pop("active_guilds")
+        return data
+
+    def has_uncommitted_changes(self) -> bool:
+        """Returns whether the character has changed since it was loaded from or last written to the database."""
+        if self._committed_snapshot is None:
+            return True
+        to_set, to_unset = dirty.diff(self._commit_data(), self._committed_snapshot)
+        return bool(to_set or to_unset)
+
+    async def commit(self, ctx, do_live_integrations=True):
+        """
+        Writes a character object to the database, under the contextual author.
+        If the character was loaded from the database, only writes the fields that changed since.
+
+        If ``CHARACTER_WRITE_BEHIND_DELAY`` is set, the write is deferred by up to that many seconds, and any other
+        commits of the character in the meantime are written along with it. Until then, loading the character returns
+        this object.
+        """
+        delay = float(config.CHARACTER_WRITE_BEHIND_DELAY)
+        if delay > 0:
+            try:
+                bson.encode(self._commit_data())  # fail now rather than in the deferred write
+            except OverflowError:
+                raise ExternalImportError("A number on the character sheet is too large to store.")
+            self._schedule_commit(ctx.bot, delay)
+        else:
+            async with self._commit_lock((self._owner, self._upstream)):
+                await self._write(ctx.bot)
+        if self._live_integration is not None and do_live_integrations and self.options.sync_outbound:
+            self._live_integration.commit_soon(ctx)  # creates a task to commit eventually
+
+    async def _write(self, bot):
+        data = self._commit_data()
         try:
-            await ctx.bot.mdb.characters.update_one(
-                {"owner": self._owner, "upstream": self._upstream},
-                {
-                    "$set": data,
-                    "$setOnInsert": {"active": self._active, "active_guilds": self._active_guilds},  # also #1472
-                },
-                upsert=True,
-            )
+            if not await self._commit_changes(bot.mdb, data):
+                await bot.mdb.characters.update_one(
+                    {"owner": self._owner, "upstream": self._upstream},
+                    {
+                        "$set": data,
+                        "$setOnInsert": {"active": self._active, "active_guilds": self._active_guilds},  # also #1472
+                    },
+                    upsert=True,
+                )
         except OverflowError:
             raise ExternalImportError("A number on the character sheet is too large to store.")
-        if self._live_integration is not None and do_live_integrations and self.options.sync_outbound:
-            self._live_integration.commit_soon(ctx)  # creates a task to commit eventually
+        self._committed_snapshot = dirty.snapshot(data, COMMIT_SUBDOCUMENTS)
+        await invalidation.invalidate_remote(bot, CHARACTER_CACHE_NAME, [self._owner, self._upstream])
+
+    async def _commit_changes(self, mdb, data) -> bool:
+        """
+        Writes only the fields of *data* that changed since the last commit.
+        Returns False if the whole character must be written instead (it was never committed, or no longer exists).
+        """
+        if self._committed_snapshot is None:
+            return False
+        to_set, to_unset = dirty.diff(data, self._committed_snapshot)
+        if not (to_set or to_unset):
+            return True
+        update = {}
+        if to_set:
+            update["$set"] = to_set
+        if to_unset:
+            update["$unset"] = to_unset
+        result = await mdb.characters.update_one({"owner": self._owner, "upstream": self._upstream}, update)
+        return result.matched_count > 0
+
+    # ---------- WRITE-BEHIND ----------
+    @classmethod
+    def _commit_lock(cls, key) -> asyncio.Lock:
+        lock = cls._commit_locks.get(key)
+        if lock is None:
+            lock = cls._commit_locks[key] = asyncio.Lock()
+        return lock
+
+    def _schedule_commit(self, bot, delay):
+        key = (self._owner, self._upstream)
+        pending = Character._pending_commits.get(key)
+        if pending is None:
+            pending = Character._pending_commits[key] = _PendingCommit(self, bot)
+        pending.character = self
+        pending.version += 1
+        if pending.task is None:
+            pending.task = asyncio.create_task(self._flush_later(key, delay))
+
+    @classmethod
+    async def _flush_later(cls, key, delay):
+        await asyncio.sleep(delay)
+        if (pending := cls._pending_commits.get(key)) is not None:
+            pending.task = None  # commits from now on schedule another write
+        await cls._flush(key)
+
+    @classmethod
+    async def _flush(cls, key):
+        async with cls._commit_lock(key):
+            pending = cls._pending_commits.get(key)
+            if pending is None:
+                return
+            version = pending.version
+            try:
+                await pending.character._write(pending.bot)
+            except Exception:
+                log.exception(f"Failed to write character {key!r}")
+            # the entry stays until the write completes, so loads in the meantime return the written object
+            if pending.version == version:
+                del cls._pending_commits[key]
+
+    @classmethod
+    async def flush_pending_commits(cls):
+        """Writes every deferred commit now. Call before shutting down."""
+        for key, pending in list(cls._pending_commits.items()):
+            pending.cancel()
+            await cls._flush(key)
 
     async def set_active(self, ctx):
         """Sets the character as globally active and unsets any server-active character in the current context."""
@@ -356,6 +490,8 @@ async def set_active(self, ctx):
             {"owner": owner_id, "upstream": self._upstream}, {"$set": {"active": True}}
         )
         self._active = True
+        # the active flags of the owner's other characters changed too
+        await invalidation.invalidate_remote(ctx.bot, CHARACTER_CACHE_NAME, [owner_id, None])
         return SetActiveResult(did_unset_server_active=did_unset_server_active)
 
     async def set_server_active(self, ctx):
@@ -377,6 +513,7 @@ async def set_server_active(self, ctx):
         )
         if guild_id not in self._active_guilds:
             self._active_guilds.append(guild_id)
+        await invalidation.invalidate_remote(ctx.bot, CHARACTER_CACHE_NAME, [owner_id, None])
         return SetActiveResult(did_unset_server_active=unset_result.modified_count > 0)
 
     async def unset_server_active(self, ctx):
@@ -395,6 +532,7 @@ async def unset_server_active(self, ctx):
             self._active_guilds.remove(guild_id)
         except ValueError:
             pass
+        await invalidation.invalidate_remote(ctx.bot, CHARACTER_CACHE_NAME, [self._owner, self._upstream])
         return SetActiveResult(did_unset_server_active=unset_result.modified_count > 0)
 
     # ---------- HP ----------
@@ -690,6 +828,37 @@ def set_slots(self, *args, **kwargs):
 
 SetActiveResult = namedtuple("SetActiveResult", "did_unset_server_active")
 
+CHARACTER_CACHE_NAME = "characters"
+
+
+def _invalidate_cached_characters(keys):
+    """Drops cached characters, given a list of [owner, upstream] (or [owner, None] for all of the owner's)."""
+    for owner_id, upstream in keys:
+        if upstream is not None:
+            Character._cache.pop((owner_id, upstream), None)
+            continue
+        for key in [k for k in list(Character._cache.keys()) if k[0] == owner_id]:
+            Character._cache.pop(key, None)
+
+
+invalidation.register(CHARACTER_CACHE_NAME, _invalidate_cached_characters)
+
+
+class _PendingCommit:
+    __slots__ = ("character", "bot", "version", "task")
+
+    def __init__(self, character, bot):
+        self.character = character
+        self.bot = bot
+        self.version = 0  # incremented on every commit, to tell whether a commit happened during a write
+        self.task = None  # the task that will write the character, if one is scheduled
+
+    def cancel(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+
 INTEGRATION_MAP = {"dicecloud": DicecloudIntegration, "beyond": DDBSheetSync}
 DESERIALIZE_MAP = {
     **_DESER,
@@ -698,3 +867,8 @@ def set_slots(self, *args, **kwargs):
     "options_v2": CharacterSettings,
     "coinpurse": Coinpurse,
 }
+# large dict fields that are written key-by-key on commit, since usually only a small part of them changes
+COMMIT_SUBDOCUMENTS = ("spellbook", "cvars")
+# the fields needed to list and select a user's characters - covered by the characters index on
+# (owner, name, upstream, active, sheet_type)
+INDEX_PROJECTION = {"_id": False, "name": True, "upstream": True, "active": True, "sheet_type": True}
@@ -1,4 +1,7 @@
+import asyncio
+import collections
 import hashlib
+import json
 import logging
 import re
 from math import floor
@@ -6,6 +9,8 @@
 
 import aiohttp
 import automation_common
+import bson
+import cachetools
 import pydantic
 import yaml
 from markdownify import markdownify
@@ -17,8 +22,9 @@
 from cogs5e.models.sheet.resistance import Resistances
 from cogs5e.models.sheet.spellcasting import SpellbookSpell
 from gamedata.monster import Monster, MonsterSpellbook, Trait
+from utils import config
 from utils.functions import search_and_select
-from utils.subscription_mixins import CommonHomebrewMixin
+from utils.subscription_mixins import CommonHomebrewMixin, guild_scope, object_scope
 
 log = logging.getLogger(__name__)
 
@@ -26,16 +32,32 @@
 # to invalidate the existing cache of data
 BESTIARY_SCHEMA_VERSION = b"1"
 
+# bestiaries are immutable once written, so their deserialized monsters are shared between all lookups
+# (_id, sha256) -> (size of the raw monsters in bytes, list of Monster)
+_monster_cache = cachetools.LRUCache(maxsize=int(config.BESTIARY_CACHE_MAX_BYTES), getsizeof=lambda entry: entry[0])
+
 
 class Bestiary(CommonHomebrewMixin):
     def __init__(
-        self, _id, sha256: str, upstream: str, published: bool, name: str, monsters: list = None, desc: str = None, **_
+        self,
+        _id,
+        sha256: str,
+        upstream: str,
+        published: bool,
+        name: str,
+        monsters: list = None,
+        desc: str = None,
+        validators: list = None,
+        **_,
     ):
         # metadata - should never change
         super().__init__(_id)
         self.sha256 = sha256
         self.upstream = upstream
         self.published = published
+        # HTTP cache validators of the CritterDB responses this bestiary was built from
+        # list of {"url": str, "etag": str?, "last_modified": str?}
+        self.validators = validators
 
         # content
         self.name = name
@@ -65,52 +87,96 @@ async def from_id(cls, ctx, oid):
         return cls.from_dict(bestiary)
 
     @classmethod
-    async def from_critterdb(cls, ctx, url, published=True):
+    async def from_critterdb(cls, ctx, url, published=True, previous=None):
+        """
+        Imports a bestiary from CritterDB, returning the existing bestiary if an identical one was imported before.
+
+        :param previous: The bestiary previously imported from *url*, if this is an update. If CritterDB reports that
+            nothing changed since it was imported, it is returned without downloading the bestiary again.
+        """
         log.info(f"Getting bestiary ID {url}...")
         api_base = (
             "https://critterdb.com:443/api/publishedbestiaries"
             if published
             else "https://critterdb.com:443/api/bestiaries"
         )
-        sha256_hash = hashlib.sha256()
-        sha256_hash.update(BESTIARY_SCHEMA_VERSION)
         async with aiohttp.ClientSession() as session:
+            fetcher = _CritterDBFetcher(session, int(config.CRITTERDB_FETCH_CONCURRENCY))
+            if previous is not None and await fetcher.is_unchanged(previous.validators):
+                log.info("This bestiary has not changed since it was imported")
+                await previous.load_monsters(ctx)
+                return previous
+
+            # the name is needed to parse the creatures, so get the metadata first
+            meta_url = f"{api_base}/{url}"
+            status, raw_meta, validators = await fetcher.get(meta_url)
+            if status == 400 and not published:
+                raise ExternalImportError(
+                    "Error importing bestiary: Cannot access bestiary. Please ensure link sharing is enabled!"
+                )
+            try:
+                if not 199 < status < 300:
+                    raise ValueError(f"HTTP {status}")
+                meta = json.loads(raw_meta)
+                name = meta["name"]
+                desc = meta["description"]
+            except (ValueError, TypeError, KeyError):
+                raise ExternalImportError("Error importing bestiary metadata. Are you sure the link is right?")
+            fetcher.record(meta_url, validators)
+
+            # parse each page of creatures as soon as it arrives, while the next pages download
+            parsed_creatures = []
+
+            def on_creatures(raw_creatures):
+                parsed_creatures.extend(_monster_factory(c, name) for c in raw_creatures)
+
+            sha256_hash = hashlib.sha256()
+            sha256_hash.update(BESTIARY_SCHEMA_VERSION)
             if published:
-                creatures = await get_published_bestiary_creatures(url, session, api_base, sha256_hash)
+                await get_published_bestiary_creatures(url, fetcher, api_base, sha256_hash, on_creatures)
             else:
-                creatures = await get_link_shared_bestiary_creatures(url, session, api_base, sha256_hash)
-
-            async with session.get(f"{api_base}/{url}") as resp:
-                try:
-                    raw = await resp.json()
-                except (ValueError, aiohttp.ContentTypeError):
-                    raise ExternalImportError("Error importing bestiary metadata. Are you sure the link is right?")
-                name = raw["name"]
-                desc = raw["description"]
-                sha256_hash.update(name.encode() + desc.encode())
+                await get_link_shared_bestiary_creatures(url, fetcher, api_base, sha256_hash, on_creatures)
+            sha256_hash.update(name.encode() + desc.encode())
 
         # try and find a bestiary by looking up upstream|hash
         # if it exists, return it
         # otherwise commit a new one to the db and return that
         sha256 = sha256_hash.hexdigest()
         log.debug(f"Bestiary hash: {sha256}")
-        existing_bestiary = await ctx.bot.mdb.bestiaries.find_one({"upstream": url, "sha256": sha256})
+        existing_bestiary = await ctx.bot.mdb.bestiaries.find_one(
+            {"upstream": url, "sha256": sha256}, projection={"monsters": False}
+        )
         if existing_bestiary:
             log.info("This bestiary already exists")
             existing_bestiary = Bestiary.from_dict(existing_bestiary)
+            # the creatures were parsed from identical data, so there's no need to load them from the db
+            existing_bestiary._monsters = parsed_creatures
+            if existing_bestiary.validators != fetcher.validators:
+                existing_bestiary.validators = fetcher.validators
+                await ctx.bot.mdb.bestiaries.update_one(
+                    {"_id": existing_bestiary.id}, {"$set": {"validators": fetcher.validators}}
+                )
             return existing_bestiary
 
-        parsed_creatures = [_monster_factory(c, name) for c in creatures]
-        b = cls(None, sha256, url, published, name, parsed_creatures, desc)
+        b = cls(None, sha256, url, published, name, parsed_creatures, desc, fetcher.validators)
         await b.write_to_db(ctx)
         return b
 
     async def load_monsters(self, ctx):
         if not self._monsters:
-            bestiary = await ctx.bot.mdb.bestiaries.find_one({"_id": self.id}, projection=["monsters"])
-            self._monsters = [Monster.from_bestiary(m, self.name) for m in bestiary["monsters"]]
+            try:
+                _, self._monsters = _monster_cache[self.id, self.sha256]
+            except KeyError:
+                bestiary = await ctx.bot.mdb.bestiaries.find_one({"_id": self.id}, projection=["monsters"])
+                self._monsters = [Monster.from_bestiary(m, self.name) for m in bestiary["monsters"]]
+                self._cache_monsters(len(bson.encode(bestiary)))
         return self._monsters
 
+    def _cache_monsters(self, size):
+        if self.id is None or size > _monster_cache.maxsize:
+            return
+        _monster_cache[self.id, self.sha256] = (size, self._monsters)
+
     @property
     def monsters(self):
         if self._monsters is None:
@@ -129,10 +195,12 @@ async def write_to_db(self, ctx):
             "name": self.name,
             "desc": self.desc,
             "monsters": monsters,
+            "validators": self.validators,
         }
 
         result = await ctx.bot.mdb.bestiaries.insert_one(data)
         self.id = result.inserted_id
+        self._cache_monsters(len(bson.encode(data)))
 
     async def delete(self, ctx):
         await ctx.bot.mdb.bestiaries.delete_one({"_id": self.id})
@@ -155,6 +223,7 @@ async def set_server_active(self, ctx):
             "provider_id": ctx.author.id,
         }
         await self.sub_coll(ctx).insert_one(sub_doc)
+        await self.subscriptions_changed(ctx, guild_scope(ctx.guild.id))
 
     async def unsubscribe(self, ctx):
         """The unsubscribe operation for bestiaries actually acts as a delete operation."""
@@ -165,6 +234,7 @@ async def unsubscribe(self, ctx):
         await self.sub_coll(ctx).delete_many(
             {"type": "server_active", "provider_id": ctx.author.id, "object_id": self.id}
         )
+        await self.subscriptions_changed(ctx, object_scope(self.id))
 
         # if no one is subscribed to this bestiary anymore, delete it.
         if not await self.num_subscribers(ctx):
@@ -204,6 +274,7 @@ async def add_server_subscriptions(self, ctx, serv_ids):
         ]
         if sub_docs:
             await ctx.bot.mdb.bestiary_subscriptions.insert_many(sub_docs)
+            await self.subscriptions_changed(ctx, *(guild_scope(d["subscriber_id"]) for d in sub_docs))
 
     @staticmethod
     async def num_user(ctx):
@@ -232,41 +303,110 @@ async def select_bestiary(ctx, name):
 
 
 # critterdb HTTP helpers
-async def get_published_bestiary_creatures(url, session, api_base, sha256_hash):
-    creatures = []
-    index = 1
-    for _ in range(100):  # 100 pages max
-        log.info(f"Getting page {index} of {url}...")
-        async with session.get(f"{api_base}/{url}/creatures/{index}") as resp:
-            if not 199 < resp.status < 300:
+CRITTERDB_MAX_PAGES = 100
+
+
+class _CritterDBFetcher:
+    """
+    Makes a bounded number of concurrent requests to CritterDB, recording the cache validators (ETag and
+    Last-Modified) of each successful response so that a later update can check whether anything changed.
+    """
+
+    def __init__(self, session, concurrency: int):
+        self.session = session
+        self.concurrency = concurrency
+        self.validators = []
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    async def get(self, url, headers=None):
+        """Returns a tuple (HTTP status, response body, response validators)."""
+        async with self._semaphore:
+            async with self.session.get(url, headers=headers) as resp:
+                body = await resp.read() if resp.status != 304 else None
+                validators = {"etag": resp.headers.get("ETag"), "last_modified": resp.headers.get("Last-Modified")}
+                return resp.status, body, validators
+
+    def record(self, url, validators):
+        """Records the validators of a response the bestiary is built from."""
+        self.validators.append({"url": url, **validators})
+
+    async def is_unchanged(self, validators) -> bool:
+        """Returns whether every response recorded in *validators* is still fresh, by making conditional requests."""
+        if not validators:
+            return False
+        conditional = []
+        for v in validators:
+            headers = {}
+            if v.get("etag"):
+                headers["If-None-Match"] = v["etag"]
+            if v.get("last_modified"):
+                headers["If-Modified-Since"] = v["last_modified"]
+            if not headers:
+                return False
+            conditional.append(self.get(v["url"], headers))
+        try:
+            results = await asyncio.gather(*conditional)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return False
+        return all(status == 304 for status, _, _ in results)
+
+
+async def get_published_bestiary_creatures(url, fetcher, api_base, sha256_hash, on_creatures):
+    """
+    Gets each page of a published bestiary's creatures, calling *on_creatures* with each page's creatures in order.
+    Pages are requested ahead of the page being processed, but hashed strictly in order so the hash does not depend on
+    the order responses arrive in.
+    """
+    pending = collections.deque()
+    next_index = 1
+    try:
+        while True:
+            # keep the next few pages in flight
+            while len(pending) < fetcher.concurrency and next_index <= CRITTERDB_MAX_PAGES:
+                log.info(f"Getting page {next_index} of {url}...")
+                page_url = f"{api_base}/{url}/creatures/{next_index}"
+                pending.append((page_url, asyncio.create_task(fetcher.get(page_url))))
+                next_index += 1
+            if not pending:
+                break
+            page_url, task = pending.popleft()
+            status, body, validators = await task
+            if not 199 < status < 300:
                 raise ExternalImportError("Error importing bestiary: HTTP error. Are you sure the link is right?")
-            raw_creatures = await parse_critterdb_response(resp, sha256_hash)
+            raw_creatures = parse_critterdb_response(body, sha256_hash)
+            fetcher.record(page_url, validators)
             if not raw_creatures:
                 break
-            creatures.extend(raw_creatures)
-            index += 1
-    return creatures
+            on_creatures(raw_creatures)
+    finally:
+        # pages past the last one - wait for them to finish cancelling, and retrieve any errors they failed with
+        tasks = [task for _, task in pending]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
 
 
-async def get_link_shared_bestiary_creatures(url, session, api_base, sha256_hash):
+async def get_link_shared_bestiary_creatures(url, fetcher, api_base, sha256_hash, on_creatures):
     log.info(f"Getting link shared bestiary {url}...")
-    async with session.get(f"{api_base}/{url}/creatures") as resp:
-        if resp.status == 400:
-            raise ExternalImportError(
-                "Error importing bestiary: Cannot access bestiary. Please ensure link sharing is enabled!"
-            )
-        elif not 199 < resp.status < 300:
-            raise ExternalImportError("Error importing bestiary: HTTP error. Are you sure the link is right?")
-        creatures = await parse_critterdb_response(resp, sha256_hash)
-    return creatures
-
-
-async def parse_critterdb_response(resp, sha256_hash):
+    creatures_url = f"{api_base}/{url}/creatures"
+    status, body, validators = await fetcher.get(creatures_url)
+    if status == 400:
+        raise ExternalImportError(
+            "Error importing bestiary: Cannot access bestiary. Please ensure link sharing is enabled!"
+        )
+    elif not 199 < status < 300:
+        raise ExternalImportError("Error importing bestiary: HTTP error. Are you sure the link is right?")
+    raw_creatures = parse_critterdb_response(body, sha256_hash)
+    fetcher.record(creatures_url, validators)
+    on_creatures(raw_creatures)
+
+
+def parse_critterdb_response(body, sha256_hash):
     try:
-        raw_creatures = await resp.json()
-        sha256_hash.update(await resp.read())
-    except (ValueError, aiohttp.ContentTypeError):
+        raw_creatures = json.loads(body)
+    except ValueError:
         raise ExternalImportError("Error importing bestiary: bad data. Are you sure the link is right?")
+    sha256_hash.update(body)
     return raw_creatures
 
 
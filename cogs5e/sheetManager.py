@@ -406,7 +406,7 @@ async def character(self, ctx, *, name: str = None):
             await ctx.send(embed=embed)
             return
 
-        user_characters = await self.bot.mdb.characters.find({"owner": str(ctx.author.id)}).to_list(None)
+        user_characters = await Character.list_owned(ctx, ctx.author.id)
         if not user_characters:
             return await ctx.send("You have no characters.")
 
@@ -414,7 +414,7 @@ async def character(self, ctx, *, name: str = None):
             ctx, user_characters, name, lambda e: e["name"], selectkey=lambda e: f"{e['name']} (`{e['upstream']}`)"
         )
 
-        char = Character.from_dict(selected_char)
+        char = await Character.from_bot_and_ids(ctx.bot, str(ctx.author.id), selected_char["upstream"])
         result = await char.set_active(ctx)
         await try_delete(ctx.message)
         if result.did_unset_server_active:
@@ -457,7 +457,7 @@ async def character_server(self, ctx):
     @character.command(name="list")
     async def character_list(self, ctx):
         """Lists your characters."""
-        user_characters = await self.bot.mdb.characters.find({"owner": str(ctx.author.id)}, ["name"]).to_list(None)
+        user_characters = await Character.list_owned(ctx, ctx.author.id)
         if not user_characters:
             return await ctx.send("You have no characters.")
         await ctx.send("Your characters:\n{}".format(", ".join(sorted(c["name"] for c in user_characters))))
@@ -465,9 +465,7 @@ async def character_list(self, ctx):
     @character.command(name="delete")
     async def character_delete(self, ctx, *, name):
         """Deletes a character."""
-        user_characters = await self.bot.mdb.characters.find(
-            {"owner": str(ctx.author.id)}, ["name", "upstream"]
-        ).to_list(None)
+        user_characters = await Character.list_owned(ctx, ctx.author.id)
         if not user_characters:
             return await ctx.send("You have no characters.")
 
@@ -605,7 +603,7 @@ async def csettings(self, ctx, *args):
                 f"No valid settings found. Try `{ctx.prefix}csettings` with no arguments to use an interactive menu!"
             )
 
-        await char.options.commit(ctx.bot.mdb, char)
+        await char.options.commit(ctx.bot, char)
         await ctx.send("\n".join(out))
 
     async def _confirm_overwrite(self, ctx, _id):
@@ -17,7 +17,8 @@
 
 import aliasing.utils
 import ui
-from aliasing import helpers, personal, workshop
+from aliasing import helpers, name_index, personal, workshop
+from aliasing.cache import invalidate_gvar
 from aliasing.errors import EvaluationError
 from aliasing.workshop import WORKSHOP_ADDRESS_RE
 from cogs5e.models import embeds
@@ -155,6 +156,7 @@ async def create_or_view(self, cog, ctx, name=None, *, code=None):
 
         obj = self.personal_cls.new(name, code, self.owner_from_ctx(ctx))
         await obj.commit(ctx.bot.mdb)
+        await name_index.invalidate_ctx(ctx, self.is_server)
 
         out = (
             f"{self.obj_name.capitalize()} `{name}` added.```py\n{ctx.prefix}{self.obj_copy_command} {name} {code}\n```"
@@ -253,6 +255,7 @@ async def delete(self, ctx, name):
                 f"or by using `{ctx.prefix}{self.name} unsubscribe <collection name>`."
             )
         await obj.delete(ctx.bot.mdb)
+        await name_index.invalidate_ctx(ctx, self.is_server)
         await ctx.send(f"{self.obj_name.capitalize()} {name} removed.")
 
     async def subscribe(self, ctx, url):
@@ -394,6 +397,7 @@ async def rename(self, ctx, old_name, new_name):
             if await self.personal_cls.get_named(new_name, ctx):
                 return await ctx.send(f"You already have a {self.obj_name} named {new_name}.")
             await old_obj.rename(ctx.bot.mdb, new_name)
+            await name_index.invalidate_ctx(ctx, self.is_server)
             return await ctx.send(f"Okay, renamed the {self.obj_name} {old_name} to {new_name}.")
         else:  # old_obj is actually a subscription doc
             sub_doc = old_obj
@@ -461,6 +465,7 @@ async def serve(self, ctx, name):
             return await ctx.send("Ok, aborting.")
 
         await server_obj.commit(ctx.bot.mdb)
+        await name_index.invalidate_guild(ctx.bot, ctx.guild.id)
         out = (
             f"Server {self.obj_name} `{server_obj.name}` added."
             f"```py\n{ctx.prefix}{self.obj_copy_command} {server_obj.name} {server_obj.code}\n```"
@@ -568,7 +573,6 @@ async def prefix(self, ctx, prefix: str = None):
 
         Forgot the prefix? Reset it with "@Avrae#6944 prefix !".
         """
-        guild_id = str(ctx.guild.id)
         if prefix is None:
             current_prefix = await self.bot.get_guild_prefix(ctx.guild)
             return await ctx.send(
@@ -595,11 +599,7 @@ async def prefix(self, ctx, prefix: str = None):
             ):
                 return await ctx.send("Ok, cancelling.")
 
-        # insert into cache
-        self.bot.prefixes[guild_id] = prefix
-
-        # update db
-        await self.bot.mdb.prefixes.update_one({"guild_id": guild_id}, {"$set": {"prefix": prefix}}, upsert=True)
+        await self.bot.set_guild_prefix(ctx.guild, prefix)
 
         await ctx.send(f"Prefix set to `{prefix}` for this server. Use commands like `{prefix}roll` now!")
 
@@ -656,6 +656,7 @@ async def alias_deleteall(self, ctx):
             return await ctx.send("Unconfirmed. Aborting.")
 
         await self.bot.mdb.aliases.delete_many({"owner": str(ctx.author.id)})
+        await name_index.invalidate_user(self.bot, ctx.author.id)
         return await ctx.send("OK. I have deleted all your aliases.")
 
     # decorator weirdness
@@ -709,6 +710,7 @@ async def snippet_deleteall(self, ctx):
             return await ctx.send("Unconfirmed. Aborting.")
 
         await self.bot.mdb.snippets.delete_many({"owner": str(ctx.author.id)})
+        await name_index.invalidate_user(self.bot, ctx.author.id)
         return await ctx.send("OK. I have deleted all your snippets.")
 
     servsnippet = CollectableManagementGroup(
@@ -1022,6 +1024,7 @@ async def gvar_remove(self, ctx, name):
         else:
             if await confirm(ctx, f"Are you sure you want to delete `{name}`? (Reply with yes/no)"):
                 await self.bot.mdb.gvars.delete_one({"key": name})
+                await invalidate_gvar(self.bot, name)
             else:
                 return await ctx.send("Ok, cancelling.")
 
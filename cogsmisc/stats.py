@@ -59,11 +59,13 @@ async def publish_shared_statistics(self):
         await self.bot.rdb.hset(GUILD_RDB_KEY, str(self.bot.cluster_id), cluster_servers)
 
     # ===== analytic loggers =====
+    # these are buffered and written in batches - see utils.analytics
     async def user_activity(self, ctx):
-        await self.bot.mdb.analytics_user_activity.update_one(
+        await self.bot.analytics.increment(
+            "analytics_user_activity",
             {"user_id": ctx.author.id},
-            {"$inc": {"commands_called": 1}, "$currentDate": {"last_command_time": True}},
-            upsert=True,
+            {"commands_called": 1},
+            timestamps=("last_command_time",),
         )
 
     async def guild_activity(self, ctx):
@@ -72,29 +74,32 @@ async def guild_activity(self, ctx):
         else:
             guild_id = ctx.guild.id
 
-        await self.bot.mdb.analytics_guild_activity.update_one(
+        await self.bot.analytics.increment(
+            "analytics_guild_activity",
             {"guild_id": guild_id},
-            {"$inc": {"commands_called": 1}, "$currentDate": {"last_command_time": True}},
-            upsert=True,
+            {"commands_called": 1},
+            timestamps=("last_command_time",),
         )
 
     async def command_activity(self, ctx):
         await self.increase_stat(ctx, "commands_used_life")
         # log command lifetime stat
-        await self.bot.mdb.analytics_command_activity.update_one(
+        await self.bot.analytics.increment(
+            "analytics_command_activity",
             {"name": ctx.command.qualified_name},
-            {"$inc": {"num_invocations": 1}, "$currentDate": {"last_invoked_time": True}},  # yay, atomic operations
-            upsert=True,
+            {"num_invocations": 1},
+            timestamps=("last_invoked_time",),
         )
         # log event
         guild_id = 0 if ctx.guild is None else ctx.guild.id
-        await self.bot.mdb.analytics_command_events.insert_one(
+        await self.bot.analytics.insert(
+            "analytics_command_events",
             {
                 "timestamp": datetime.datetime.utcnow(),
                 "command_name": ctx.command.qualified_name,
                 "user_id": ctx.author.id,
                 "guild_id": guild_id,
-            }
+            },
         )
 
     async def update_hourly(self):
@@ -157,7 +162,7 @@ async def on_guild_remove(self, _):
     # ===== utils =====
     @staticmethod
     async def increase_stat(ctx, stat):
-        await ctx.bot.mdb.random_stats.update_one({"key": stat}, {"$inc": {"value": 1}}, upsert=True)
+        await ctx.bot.analytics.increment("random_stats", {"key": stat}, {"value": 1})
 
     @staticmethod
     async def get_statistic(ctx, stat):
@@ -175,15 +180,13 @@ async def get_guild_count(bot):
 
     @staticmethod
     async def count_ddb_link(ctx, user_id, ddb_user):
-        await ctx.bot.mdb.analytics_ddb_activity.update_one(
+        await ctx.bot.analytics.increment(
+            "analytics_ddb_activity",
             {"user_id": user_id},
-            {
-                "$set": {"ddb_id": ddb_user.user_id},
-                "$inc": {"link_usage": 1},
-                "$currentDate": {"last_link_time": True},
-                "$setOnInsert": {"first_link_time": datetime.datetime.utcnow()},
-            },
-            upsert=True,
+            {"link_usage": 1},
+            timestamps=("last_link_time",),
+            set_fields={"ddb_id": ddb_user.user_id},
+            set_on_insert={"first_link_time": datetime.datetime.utcnow()},
         )
 
 
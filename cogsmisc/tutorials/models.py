@@ -5,7 +5,20 @@
 import asyncio
 import textwrap
 
+import cachetools
+
 from cogs5e.models.embeds import EmbedWithAuthor
+from utils import config, invalidation
+
+TUTORIAL_CACHE_NAME = "tutorial_users"
+
+# ids of users recently found not to be running a tutorial, since this is checked after every command and almost no
+# one is running one - a user is dropped on every cluster when they start a tutorial
+_no_tutorial = cachetools.TTLCache(
+    maxsize=int(config.TUTORIAL_MISS_CACHE_SIZE), ttl=int(config.TUTORIAL_MISS_CACHE_TTL)
+)
+# incremented on every invalidation, so a miss read while a tutorial was started is not cached
+_generation = 0
 
 
 class Tutorial(abc.ABC):
@@ -116,8 +129,14 @@ def __init__(self, user_id, tutorial_key, state_key, data, persist_data=None, **
     # db/ser
     @classmethod
     async def from_ctx(cls, ctx):
-        d = await ctx.bot.mdb.tutorial_map.find_one({"user_id": ctx.author.id})
+        user_id = ctx.author.id
+        if user_id in _no_tutorial:
+            return None
+        generation = _generation
+        d = await ctx.bot.mdb.tutorial_map.find_one({"user_id": user_id})
         if d is None:
+            if generation == _generation:
+                _no_tutorial[user_id] = True
             return None
         return cls.from_dict(d)
 
@@ -136,6 +155,7 @@ def to_dict(self):
 
     async def commit(self, ctx):
         await ctx.bot.mdb.tutorial_map.update_one({"user_id": self.user_id}, {"$set": self.to_dict()}, upsert=True)
+        await invalidation.invalidate(ctx.bot, TUTORIAL_CACHE_NAME, self.user_id)
 
     @classmethod
     def new(cls, ctx, tutorial_key, tutorial):
@@ -157,6 +177,18 @@ async def transition_with_delay(self, ctx, new_state, secs):
 
     async def end_tutorial(self, ctx):
         await ctx.bot.mdb.tutorial_map.delete_one({"user_id": self.user_id})
+        # other clusters either have no entry for the user, or will find none on their next read
+        _no_tutorial[self.user_id] = True
+
+
+def _invalidate_no_tutorial(user_ids):
+    global _generation
+    _generation += 1
+    for user_id in user_ids:
+        _no_tutorial.pop(user_id, None)
+
+
+invalidation.register(TUTORIAL_CACHE_NAME, _invalidate_no_tutorial)
 
 
 # registration decorators
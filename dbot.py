@@ -1,5 +1,6 @@
 import asyncio
 import faulthandler
+import functools
 import logging
 import random
 import sys
@@ -7,6 +8,7 @@
 import traceback
 
 import aioredis
+import cachetools
 import d20
 import disnake
 import motor.motor_asyncio
@@ -19,15 +21,23 @@
 
 from aliasing.errors import CollectableRequiresLicenses, EvaluationError
 from aliasing.helpers import handle_alias_exception, handle_alias_required_licenses, handle_aliases
+from cogs5e.initiative import Combat
+from cogs5e.models.character import Character
 from cogs5e.models.errors import AvraeException, RequiresLicense
 from ddb import BeyondClient, BeyondClientBase
 from ddb.gamelog import GameLogClient
 from gamedata.compendium import compendium
-from gamedata.lookuputils import handle_required_license
-from utils import clustering, config, context
+from gamedata.lookuputils import handle_required_license, prewarm_monster_tokens
+from utils import clustering, config, context, img, invalidation
+from utils.analytics import AnalyticsBuffer
 from utils.feature_flags import AsyncLaunchDarklyClient
 from utils.help import help_command
 from utils.redisIO import RedisIO
+from utils.settings import ServerSettings
+
+PREFIX_CACHE_NAME = "guild_prefixes"
+# the number of guilds to load the prefixes and settings of in one query when connecting to them
+GUILD_PRELOAD_BATCH_SIZE = 1000
 
 # -----COGS-----
 COGS = (
@@ -72,9 +82,24 @@ def __init__(self, prefix, description=None, **options):
         self.mclient = motor.motor_asyncio.AsyncIOMotorClient(config.MONGO_URL)
         self.mdb = self.mclient[config.MONGODB_DB_NAME]
         self.rdb = self.loop.run_until_complete(self.setup_rdb())
+        self.loop.create_task(invalidation.invalidation_pubsub(self))
+        self.analytics = AnalyticsBuffer(
+            self.mdb,
+            max_size=int(config.ANALYTICS_BUFFER_SIZE),
+            flush_interval=float(config.ANALYTICS_FLUSH_INTERVAL),
+        )
+        self.analytics.start(self.loop)
 
         # misc caches
-        self.prefixes = dict()
+        # guild id -> prefix; other processes drop their copy when a prefix is changed (see set_guild_prefix)
+        self.prefixes = cachetools.TTLCache(
+            maxsize=int(config.GUILD_CONFIG_CACHE_SIZE), ttl=int(config.GUILD_CONFIG_CACHE_TTL)
+        )
+        self._prefix_generation = 0  # incremented on every invalidation
+        invalidation.register(PREFIX_CACHE_NAME, self._invalidate_prefixes)
+        # guild ids whose prefixes and settings to load, from GUILD_CREATEs
+        self._guild_preload_queue = set()
+        self._guild_preload_task = None
         self.muted = set()
         self.cluster_id = 0
 
@@ -95,7 +120,9 @@ def __init__(self, prefix, description=None, **options):
             self.ddb = BeyondClient(self.loop)
 
         # launchdarkly
-        self.ldclient = AsyncLaunchDarklyClient(self.loop, sdk_key=config.LAUNCHDARKLY_SDK_KEY)
+        self.ldclient = AsyncLaunchDarklyClient(
+            self.loop, sdk_key=config.LAUNCHDARKLY_SDK_KEY, flag_data_path=config.LAUNCHDARKLY_FLAG_DATA_PATH
+        )
 
         # ddb game log
         self.glclient = GameLogClient(self)
@@ -106,17 +133,65 @@ async def setup_rdb(self):
 
     async def get_guild_prefix(self, guild: disnake.Guild) -> str:
         guild_id = str(guild.id)
-        if guild_id in self.prefixes:
-            return self.prefixes.get(guild_id, config.DEFAULT_PREFIX)
+        if (gp := self.prefixes.get(guild_id)) is not None:
+            return gp
         # load from db and cache
+        generation = self._prefix_generation
         gp_obj = await self.mdb.prefixes.find_one({"guild_id": guild_id})
         if gp_obj is None:
             gp = config.DEFAULT_PREFIX
         else:
             gp = gp_obj.get("prefix", config.DEFAULT_PREFIX)
-        self.prefixes[guild_id] = gp
+        if generation == self._prefix_generation:
+            self.prefixes[guild_id] = gp
         return gp
 
+    async def set_guild_prefix(self, guild: disnake.Guild, prefix: str):
+        guild_id = str(guild.id)
+        await self.mdb.prefixes.update_one({"guild_id": guild_id}, {"$set": {"prefix": prefix}}, upsert=True)
+        self.prefixes[guild_id] = prefix
+        await invalidation.invalidate_remote(self, PREFIX_CACHE_NAME, guild_id)
+
+    def _invalidate_prefixes(self, guild_ids):
+        self._prefix_generation += 1
+        for guild_id in guild_ids:
+            self.prefixes.pop(guild_id, None)
+
+    def queue_guild_preload(self, guild: disnake.Guild):
+        """Loads the guild's prefix and settings into their caches soon, batched with other guilds."""
+        self._guild_preload_queue.add(guild.id)
+        if self._guild_preload_task is None:
+            self._guild_preload_task = asyncio.create_task(self._preload_guilds())
+
+    async def _preload_guilds(self):
+        await asyncio.sleep(1)  # wait for the rest of a burst of GUILD_CREATEs
+        try:
+            while self._guild_preload_queue:
+                batch = [
+                    self._guild_preload_queue.pop()
+                    for _ in range(min(GUILD_PRELOAD_BATCH_SIZE, len(self._guild_preload_queue)))
+                ]
+                await asyncio.gather(self._preload_prefixes(batch), ServerSettings.preload(self.mdb, batch))
+        except Exception:
+            log.exception("Failed to preload guild prefixes and settings:")
+        finally:
+            self._guild_preload_task = None
+
+    async def _preload_prefixes(self, guild_ids):
+        guild_ids = [str(guild_id) for guild_id in guild_ids if str(guild_id) not in self.prefixes]
+        if not guild_ids or len(self.prefixes) >= self.prefixes.maxsize:
+            return  # don't evict prefixes that are in use
+        generation = self._prefix_generation
+        loaded = {}
+        async for gp_obj in self.mdb.prefixes.find({"guild_id": {"$in": guild_ids}}):
+            loaded[gp_obj["guild_id"]] = gp_obj.get("prefix", config.DEFAULT_PREFIX)
+        if generation != self._prefix_generation:
+            return
+        for guild_id in guild_ids:
+            if len(self.prefixes) >= self.prefixes.maxsize:
+                break
+            self.prefixes.setdefault(guild_id, loaded.get(guild_id, config.DEFAULT_PREFIX))
+
     @property
     def is_cluster_0(self):
         if self.cluster_id is None:  # we're not running in clustered mode anyway
@@ -197,11 +272,15 @@ async def close(self):
         # These are caused by aioredis streams being GC'ed when discord.py cancels the tasks that create them
         # (because of course d.py decides it wants to cancel *all* tasks on its loop...)
         await super().close()
+        await Combat.flush_pending_commits()
+        await Character.flush_pending_commits()
+        await self.analytics.close()
         await self.ddb.close()
         await self.rdb.close()
         await self.glclient.close()
         self.mclient.close()
         self.ldclient.close()
+        await img.close()
 
 
 desc = (
@@ -227,6 +306,11 @@ async def close(self):
     presences=False,
     typing=False,
 )  # https://discord.com/developers/docs/topics/gateway#gateway-intents
+if __name__ == "__main__":
+    # token rendering workers are forked before the bot is created, since it starts threads (e.g. the launchdarkly
+    # client's) - and only when running the bot, not when dbot is imported (e.g. by tests)
+    img.start_token_renderer()
+
 bot = Avrae(
     prefix=get_prefix,
     description=desc,
@@ -260,6 +344,12 @@ async def on_resumed():
     log.info("resumed.")
 
 
+@bot.event
+async def on_guild_available(guild):
+    # sent for each guild in our shards when they connect
+    bot.queue_guild_preload(guild)
+
+
 @bot.event
 async def on_command_error(ctx, error):
     if isinstance(error, commands.CommandNotFound):
@@ -373,5 +463,11 @@ async def on_command(ctx):
 if __name__ == "__main__":
     faulthandler.enable()  # assumes we log errors to stderr, traces segfaults
     bot.state = "run"
+    if (num_prewarm := int(config.MONSTER_TOKEN_PREWARM_COUNT)) > 0:
+        compendium.add_reload_listener(
+            functools.partial(
+                prewarm_monster_tokens, bot.mdb, num_prewarm, days=int(config.MONSTER_TOKEN_PREWARM_DAYS)
+            )
+        )
     bot.loop.create_task(compendium.reload_task(bot.mdb))
     bot.run(config.TOKEN)
@@ -20,10 +20,12 @@
 
 # cache
 # in addition to caching in redis, we have a LRU cache for 64 entity types and the 128 most recent users
+# entity types are cached as indices, which memoize the accessible entities of the most recent license combinations
 USER_ENTITLEMENT_TTL = 1 * 60
 ENTITY_ENTITLEMENT_TTL = 15 * 60
 USER_ENTITLEMENT_CACHE = cachetools.TTLCache(128, USER_ENTITLEMENT_TTL)
 ENTITY_ENTITLEMENT_CACHE = cachetools.TTLCache(64, ENTITY_ENTITLEMENT_TTL)
+ACCESSIBLE_ENTITY_CACHE_SIZE = 256  # license combinations, per entity type
 USER_ENTITLEMENTS_NONE_SENTINEL = object()
 
 log = logging.getLogger(__name__)
@@ -72,28 +74,22 @@ async def get_accessible_entities(self, ctx, user_id, entity_type):
         Returns a set of entity IDs of the given entity type that the given user is allowed to access in the given
         context.
 
-        Returns None if the user has no DDB link.
+        Returns None if the user has no DDB link. The returned set is shared between callers, and must not be mutated.
 
         :type ctx: disnake.ext.commands.Context
         :type user_id: int
         :type entity_type: str
-        :rtype: set[int] or None
+        :rtype: frozenset[int] or None
         """
         log.debug(f"Getting DDB entitlements for Discord ID {user_id}")
         user_e10s = await self._get_user_entitlements(ctx, user_id)
         if user_e10s is None:
             return None
 
-        entity_e10s = await self._get_entity_entitlements(ctx, entity_type)
-
-        # calculate visible entities
-        accessible = set()
-        user_licenses = user_e10s.licenses
-        for entity in entity_e10s:
-            if entity.is_free or user_licenses & entity.license_ids:
-                accessible.add(entity.entity_id)
+        entity_index = await self._get_entity_entitlements(ctx, entity_type)
+        accessible = entity_index.accessible(user_e10s.licenses)
 
-        log.debug(f"Discord user {user_id} can see {entity_type}s {accessible}")
+        log.debug(f"Discord user {user_id} can see {len(accessible)} {entity_type}s")
 
         return accessible
 
@@ -179,11 +175,11 @@ async def _get_user_entitlements(self, ctx, user_id):
 
     async def _get_entity_entitlements(self, ctx, entity_type):
         """
-        Gets the latest entity entitlements, from cache or by communicating with DDB.
+        Gets the latest entity entitlements, indexed by license, from cache or by communicating with DDB.
 
         :type ctx: disnake.ext.commands.Context
         :type entity_type: str
-        :rtype: list[ddb.entitlements.EntityEntitlements]
+        :rtype: ddb.entitlements.EntityEntitlementIndex
         """
         # L1: Memory
         l1_entity_entitlements = ENTITY_ENTITLEMENT_CACHE.get(entity_type)
@@ -196,17 +192,21 @@ async def _get_entity_entitlements(self, ctx, entity_type):
         l2_entity_entitlements = await ctx.bot.rdb.jget(entity_entitlement_cache_key)
         if l2_entity_entitlements is not None:
             log.debug("found entity entitlements in l2 (redis) cache")
-            return [entitlements.EntityEntitlements.from_dict(e) for e in l2_entity_entitlements]
+            entity_e10s = [entitlements.EntityEntitlements.from_dict(e) for e in l2_entity_entitlements]
+            entity_index = entitlements.EntityEntitlementIndex(entity_type, entity_e10s, ACCESSIBLE_ENTITY_CACHE_SIZE)
+            ENTITY_ENTITLEMENT_CACHE[entity_type] = entity_index
+            return entity_index
 
         # fetch from DDB
         entity_e10s = await self._fetch_entities(entity_type)
 
         # cache entitlements
-        ENTITY_ENTITLEMENT_CACHE[entity_type] = entity_e10s
+        entity_index = entitlements.EntityEntitlementIndex(entity_type, entity_e10s, ACCESSIBLE_ENTITY_CACHE_SIZE)
+        ENTITY_ENTITLEMENT_CACHE[entity_type] = entity_index
         await ctx.bot.rdb.jsetex(
             entity_entitlement_cache_key, [e.to_dict() for e in entity_e10s], ENTITY_ENTITLEMENT_TTL
         )
-        return entity_e10s
+        return entity_index
 
     # ---- low-level auth ----
     async def _fetch_token(self, claim: str):
@@ -1,3 +1,8 @@
+from collections import defaultdict
+
+import cachetools
+
+
 class UserEntitlements:
     __slots__ = ("acquired_license_ids", "shared_licenses")
 
@@ -73,3 +78,49 @@ def to_dict(self):
             "isFree": self.is_free,
             "licenseIDs": list(self.license_ids),
         }
+
+
+class EntityEntitlementIndex:
+    """
+    The entitlements of every entity of one type, indexed by the licenses that grant access to them, so that the set
+    of entities a combination of licenses grants access to is a union of a few precomputed sets rather than a scan of
+    every entity. These sets are memoized by license combination, since most users share one with many others.
+    """
+
+    __slots__ = ("entity_type", "free_ids", "ids_by_license", "_accessible")
+
+    def __init__(self, entity_type, entity_e10s, max_memoized=256):
+        """
+        :type entity_type: str
+        :type entity_e10s: list[EntityEntitlements]
+        :param max_memoized: The number of license combinations to memoize the accessible entities of.
+        """
+        self.entity_type = entity_type
+        free_ids = set()
+        ids_by_license = defaultdict(set)
+        for entity in entity_e10s:
+            if entity.is_free:
+                free_ids.add(entity.entity_id)
+                continue
+            for license_id in entity.license_ids:
+                ids_by_license[license_id].add(entity.entity_id)
+        self.free_ids = frozenset(free_ids)
+        self.ids_by_license = {license_id: frozenset(ids) for license_id, ids in ids_by_license.items()}
+        self._accessible = cachetools.LRUCache(maxsize=max_memoized)
+
+    def accessible(self, licenses):
+        """
+        Returns the IDs of the entities that are free or that any of *licenses* grants access to. Shared between
+        callers - never mutate.
+
+        :type licenses: set[int]
+        :rtype: frozenset[int]
+        """
+        key = frozenset(licenses)
+        try:
+            return self._accessible[key]
+        except KeyError:
+            pass
+        accessible = self.free_ids.union(*(self.ids_by_license.get(license_id, ()) for license_id in key))
+        self._accessible[key] = accessible
+        return accessible
@@ -176,7 +176,8 @@ async def _event_analytics(self, gctx):
         Called for each event that is successfully processed. Logs the event type, ddb user, ddb campaign,
         discord user id, discord guild id, discord channel id, event id, and timestamp.
         """
-        await self.bot.mdb.analytics_gamelog_events.insert_one(
+        await self.bot.analytics.insert(
+            "analytics_gamelog_events",
             {
                 "event_type": gctx.event.event_type,
                 "ddb_user": gctx.event.user_id,
@@ -186,7 +187,7 @@ async def _event_analytics(self, gctx):
                 "channel_id": gctx.channel.id,
                 "event_id": gctx.event.id,
                 "timestamp": datetime.datetime.now(),
-            }
+            },
         )
 
     # ==== game log callback registration ====
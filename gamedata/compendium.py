@@ -1,10 +1,15 @@
 import asyncio
 import collections
 import copy
+import functools
+import hashlib
+import itertools
 import json
 import logging
 import os
-from typing import Callable, List, Type, TypeVar
+import pickle
+import time
+from typing import Callable, Dict, List, Tuple, Type, TypeVar
 
 import gamedata.spell
 from gamedata.action import Action
@@ -13,15 +18,114 @@
 from gamedata.feat import Feat
 from gamedata.item import AdventuringGear, Armor, MagicItem, Weapon
 from gamedata.klass import Class, ClassFeature, Subclass
+from gamedata.lazy import LazyEntity
 from gamedata.mixins import LimitedUseGrantorMixin
 from gamedata.monster import Monster
 from gamedata.race import Race, RaceFeature, SubRace
 from gamedata.shared import Sourced
 from utils import config
+from utils.functions import SearchIndex
 
 log = logging.getLogger(__name__)
 T = TypeVar("T")
 
+# static data key -> attribute the raw data is loaded into
+STATIC_DATA_KEYS = {
+    "classes": "raw_classes",
+    "feats": "raw_feats",
+    "monsters": "raw_monsters",
+    "backgrounds": "raw_backgrounds",
+    "adventuring-gear": "raw_adventuring_gear",
+    "armor": "raw_armor",
+    "magic-items": "raw_magic_items",
+    "weapons": "raw_weapons",
+    "races": "raw_races",
+    "subraces": "raw_subraces",
+    "spells": "raw_spells",
+    "books": "raw_books",
+    "actions": "raw_actions",
+    "names": "names",
+    "srd-references": "rule_references",
+}
+
+# (static data key, model attribute, model class, skip_out_filter), in lookup registration order
+# if a Feat has the hidden attribute, we skip registering it in the lookup list but still register it in
+# entity lookup so it can grant limiteduse/etc
+ENTITY_SOURCES = (
+    ("backgrounds", "backgrounds", Background, None),
+    ("classes", "classes", Class, None),
+    ("races", "races", Race, None),
+    ("subraces", "subraces", SubRace, None),
+    ("feats", "feats", Feat, lambda f: f.hidden),
+    ("adventuring-gear", "adventuring_gear", AdventuringGear, None),
+    ("armor", "armor", Armor, None),
+    ("magic-items", "magic_items", MagicItem, None),
+    ("weapons", "weapons", Weapon, None),
+    ("monsters", "monsters", Monster, None),
+    ("spells", "spells", gamedata.spell.Spell, None),
+    ("books", "books", Book, None),
+)
+
+# static data keys whose entities may be kept as lazy stubs (see gamedata.lazy) - these are the largest, and do not
+# grant limited uses, which would otherwise need to be registered from the full entity
+LAZY_ENTITY_SOURCES = {"monsters", "spells", "magic-items"}
+
+# the order entity lookup groups are merged in - later groups overwrite earlier ones unless registered otherwise
+LOOKUP_GROUP_ORDER = [key for key, *_ in ENTITY_SOURCES] + ["classfeats", "subclasses", "racefeats"]
+
+# model attributes that are searched by name and should have a precomputed search index
+SEARCHABLE_ENTITY_LISTS = (
+    "backgrounds",
+    "classes",
+    "subclasses",
+    "races",
+    "subraces",
+    "feats",
+    "cfeats",
+    "optional_cfeats",
+    "rfeats",
+    "subrfeats",
+    "adventuring_gear",
+    "armor",
+    "magic_items",
+    "weapons",
+    "monsters",
+    "spells",
+)
+
+
+SNAPSHOT_VERSION = 1
+# the attributes of a fully loaded compendium that are written to a snapshot
+# search indices are not snapshotted since they are keyed by object identity, and are cheap to rebuild
+SNAPSHOT_ATTRS = (
+    *(attr for _, attr, *_ in ENTITY_SOURCES),
+    "cfeats",
+    "optional_cfeats",
+    "subclasses",
+    "rfeats",
+    "subrfeats",
+    "actions",
+    "names",
+    "rule_references",
+    "_entity_lookup",
+    "_book_lookup",
+    "_actions_by_uid",
+    "_actions_by_eid",
+    "_lookup_groups",
+    "_raw_hashes",
+)
+
+
+class _EntityLookupGroup:
+    """
+    The entity lookups registered by one part of the compendium (e.g. all monsters). Reloads only rebuild the groups
+    whose source data changed, then merge every group into the entity lookup in registration order.
+    """
+
+    def __init__(self):
+        self.lookup = {}  # {(entity type or type id, entity id): Sourced}
+        self.no_overwrite = {}  # {entity lookup key: type id lookup key} of entities that may not overwrite others
+
 
 class Compendium:
     # noinspection PyTypeHints
@@ -75,13 +179,28 @@ def __init__(self):
         self._entity_lookup = {}
         self._book_lookup = {}
         self._actions_by_uid = {}  # {uuid: Action}
-        self._actions_by_eid = collections.defaultdict(lambda: [])  # {(tid, eid): [Action]}
+        self._actions_by_eid = collections.defaultdict(list)  # {(tid, eid): [Action]}
+        self._search_indices = {}  # {id(first entity): SearchIndex}
+        self._lookup_groups = {}  # {group key: _EntityLookupGroup}
+        self._raw_hashes = {}  # {static data key: content hash}
         self._epoch = 0
+        self._reload_listeners = []  # coroutine functions called after a reload that changed data
+        self._listener_tasks = set()  # running reload listeners, referenced until they are done
 
         self._base_path = os.path.relpath("res")
 
+    def add_reload_listener(self, listener):
+        """Registers a coroutine function to be run in the background after each reload that changes any data."""
+        self._reload_listeners.append(listener)
+
     async def reload_task(self, mdb=None):
         wait_for = int(config.RELOAD_INTERVAL)
+        if config.COMPENDIUM_SNAPSHOT_PATH is not None:
+            # boot from the snapshot if we can - the reload below then only rebuilds data that changed since it was taken
+            loop = asyncio.get_event_loop()
+            await loop.run_in_executor(
+                None, self.load_snapshot, config.COMPENDIUM_SNAPSHOT_PATH, int(config.COMPENDIUM_SNAPSHOT_MAX_AGE)
+            )
         await self.reload(mdb)
         if wait_for > 0:
             log.info("Reloading data every %d seconds", wait_for)
@@ -89,7 +208,7 @@ async def reload_task(self, mdb=None):
                 await asyncio.sleep(wait_for)
                 await self.reload(mdb)
 
-    async def reload(self, mdb=None):
+    async def reload(self, mdb=None, incremental=True):
         log.info("Reloading data")
 
         loop = asyncio.get_event_loop()
@@ -99,96 +218,137 @@ async def reload(self, mdb=None):
         else:
             await self.load_all_mongodb(mdb)
 
-        await loop.run_in_executor(None, self.load_common)
+        old_epoch = self._epoch
+        await loop.run_in_executor(None, functools.partial(self.load_common, incremental=incremental))
         log.info(f"Done loading data - {len(self._entity_lookup)} lookups registered")
 
+        if config.COMPENDIUM_SNAPSHOT_PATH is not None and self._epoch != old_epoch:
+            await loop.run_in_executor(None, self.save_snapshot, config.COMPENDIUM_SNAPSHOT_PATH)
+
+        if self._epoch != old_epoch:
+            for listener in self._reload_listeners:
+                task = asyncio.create_task(listener())
+                self._listener_tasks.add(task)
+                task.add_done_callback(self._on_listener_done)
+
+    def _on_listener_done(self, task):
+        self._listener_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            log.error("Reload listener failed:", exc_info=task.exception())
+
     def load_all_json(self, base_path=None):
         if base_path is not None:
             self._base_path = base_path
 
-        self.raw_classes = self.read_json("classes.json", [])
-        self.raw_feats = self.read_json("feats.json", [])
-        self.raw_monsters = self.read_json("monsters.json", [])
-        self.raw_backgrounds = self.read_json("backgrounds.json", [])
-        self.raw_adventuring_gear = self.read_json("adventuring-gear.json", [])
-        self.raw_armor = self.read_json("armor.json", [])
-        self.raw_magic_items = self.read_json("magic-items.json", [])
-        self.raw_weapons = self.read_json("weapons.json", [])
-        self.raw_races = self.read_json("races.json", [])
-        self.raw_subraces = self.read_json("subraces.json", [])
-        self.raw_spells = self.read_json("spells.json", [])
-        self.raw_books = self.read_json("books.json", [])
-        self.raw_actions = self.read_json("actions.json", [])
-
-        self.names = self.read_json("names.json", [])
-        self.rule_references = self.read_json("srd-references.json", [])
+        for key, attr in STATIC_DATA_KEYS.items():
+            setattr(self, attr, self.read_json(f"{key}.json", []))
 
     async def load_all_mongodb(self, mdb):
         lookup = {d["key"]: d["object"] async for d in mdb.static_data.find({})}
 
-        self.raw_classes = lookup.get("classes", [])
-        self.raw_feats = lookup.get("feats", [])
-        self.raw_monsters = lookup.get("monsters", [])
-        self.raw_backgrounds = lookup.get("backgrounds", [])
-        self.raw_adventuring_gear = lookup.get("adventuring-gear", [])
-        self.raw_armor = lookup.get("armor", [])
-        self.raw_magic_items = lookup.get("magic-items", [])
-        self.raw_weapons = lookup.get("weapons", [])
-        self.raw_races = lookup.get("races", [])
-        self.raw_subraces = lookup.get("subraces", [])
-        self.raw_spells = lookup.get("spells", [])
-        self.raw_books = lookup.get("books", [])
-        self.raw_actions = lookup.get("actions", [])
-
-        self.names = lookup.get("names", [])
-        self.rule_references = lookup.get("srd-references", [])
+        for key, attr in STATIC_DATA_KEYS.items():
+            setattr(self, attr, lookup.get(key, []))
 
     # noinspection DuplicatedCode
-    def load_common(self):
-        self._entity_lookup = {}
-        self._book_lookup = {}
+    def load_common(self, incremental=False):
+        """
+        Deserializes the loaded raw data into models and registers all lookups.
 
-        self.backgrounds = self._deserialize_and_register_lookups(Background, self.raw_backgrounds)
-        self.classes = self._deserialize_and_register_lookups(Class, self.raw_classes)
-        self.races = self._deserialize_and_register_lookups(Race, self.raw_races)
-        self.subraces = self._deserialize_and_register_lookups(SubRace, self.raw_subraces)
-        # if a Feat has the hidden attribute, we skip registering it in the lookup list but still register it in
-        # entity lookup so it can grant limiteduse/etc
-        self.feats = self._deserialize_and_register_lookups(Feat, self.raw_feats, skip_out_filter=lambda f: f.hidden)
-        self.adventuring_gear = self._deserialize_and_register_lookups(AdventuringGear, self.raw_adventuring_gear)
-        self.armor = self._deserialize_and_register_lookups(Armor, self.raw_armor)
-        self.magic_items = self._deserialize_and_register_lookups(MagicItem, self.raw_magic_items)
-        self.weapons = self._deserialize_and_register_lookups(Weapon, self.raw_weapons)
-        self.monsters = self._deserialize_and_register_lookups(Monster, self.raw_monsters)
-        self.spells = self._deserialize_and_register_lookups(gamedata.spell.Spell, self.raw_spells)
-        self.books = self._deserialize_and_register_lookups(Book, self.raw_books)
+        :param incremental: If True, only the models and lookups built from static data keys whose content changed
+                            since the last load are rebuilt; the rest are reused as-is.
+        """
+        hashes = {key: self._hash_raw(getattr(self, attr)) for key, attr in STATIC_DATA_KEYS.items()}
+        if incremental:
+            changed = {key for key, raw_hash in hashes.items() if self._raw_hashes.get(key) != raw_hash}
+        else:
+            changed = set(STATIC_DATA_KEYS)
+        self._rebind_lazy_entities(unchanged=set(STATIC_DATA_KEYS) - changed)
+        if not changed:
+            log.info("No static data changed, skipping rebuild")
+            return
+        log.info(f"Rebuilding static data for keys: {', '.join(sorted(changed))}")
+
+        # everything is built into these, then swapped in at once so readers never see a half-built compendium
+        updates = {}
+        lookup_groups = self._lookup_groups.copy()
+
+        for key, attr, cls, skip_out_filter in ENTITY_SOURCES:
+            if key not in changed:
+                continue
+            updates[attr], lookup_groups[key] = self._deserialize_and_register_lookups(
+                cls,
+                getattr(self, STATIC_DATA_KEYS[key]),
+                skip_out_filter=skip_out_filter,
+                lazy=config.COMPENDIUM_LAZY_ENTITIES and key in LAZY_ENTITY_SOURCES,
+            )
+
+        def current(attr):
+            return updates.get(attr, getattr(self, attr))
 
         # generated
-        self._load_classfeats()
-        self._load_subclasses()
-        self._load_racefeats()
-        self._load_actions()  # actions don't register as DDB entities, they're their own thing
-        self._register_book_lookups()
-
+        if "classes" in changed:
+            updates["cfeats"], updates["optional_cfeats"], lookup_groups["classfeats"] = self._load_classfeats(
+                current("classes")
+            )
+            updates["subclasses"], lookup_groups["subclasses"] = self._load_subclasses(current("classes"))
+        if "races" in changed or "subraces" in changed:
+            updates["rfeats"], updates["subrfeats"], lookup_groups["racefeats"] = self._load_racefeats(
+                current("races"), current("subraces")
+            )
+        if "actions" in changed:
+            # actions don't register as DDB entities, they're their own thing
+            updates["actions"], updates["_actions_by_uid"], updates["_actions_by_eid"] = self._load_actions()
+        if "books" in changed:
+            updates["_book_lookup"] = self._register_book_lookups(current("books"))
+
+        updates["_lookup_groups"] = lookup_groups
+        updates["_entity_lookup"] = self._merge_lookup_groups(lookup_groups)
+        updates["_search_indices"] = self._build_search_indices(current)
+        updates["_raw_hashes"] = hashes
         # increase epoch for any dependents
-        self._epoch += 1
+        updates["_epoch"] = self._epoch + 1
 
-    def _load_subclasses(self):
-        self.subclasses = []
-        for cls in self.classes:
+        self.__dict__.update(updates)
+
+    def _rebind_lazy_entities(self, unchanged):
+        """
+        Points the lazy entities built from the static data keys in *unchanged* at the newly loaded raw data, which has
+        the same content, so the previously loaded raw data is not kept alive by the entities.
+        """
+        for key, attr, *_ in ENTITY_SOURCES:
+            if key not in unchanged or key not in LAZY_ENTITY_SOURCES:
+                continue
+            data_source = getattr(self, STATIC_DATA_KEYS[key])
+            lookup_group = self._lookup_groups.get(key)
+            entities = itertools.chain(getattr(self, attr), lookup_group.lookup.values() if lookup_group else ())
+            for entity in entities:
+                if isinstance(entity, LazyEntity):
+                    entity.rebind(data_source)
+
+    @staticmethod
+    def _hash_raw(data) -> str:
+        """Returns a content hash of a piece of raw static data, to tell whether it changed between reloads."""
+        return hashlib.sha256(json.dumps(data).encode()).hexdigest()
+
+    def _load_subclasses(self, classes):
+        subclasses = []
+        lookup_group = _EntityLookupGroup()
+        for cls in classes:
             for subcls in cls.subclasses:
                 copied = copy.copy(subcls)
                 copied.name = f"{cls.name}: {subcls.name}"
                 # register lookups
-                self._register_entity_lookup(subcls)
-                self.subclasses.append(copied)
+                self._register_entity_lookup(subcls, lookup_group)
+                subclasses.append(copied)
+        return subclasses, lookup_group
 
-    def _load_classfeats(self):
+    def _load_classfeats(self, classes):
         """
         Loads all class features by iterating over classes and subclasses.
         """
-        self.cfeats = []
-        self.optional_cfeats = []
+        cfeats = []
+        optional_cfeats = []
+        lookup_group = _EntityLookupGroup()
         seen = set()
 
         def handle_class(cls_or_sub):
@@ -200,36 +360,36 @@ def handle_class(cls_or_sub):
                     if copied.name in seen:
                         copied.name = f"{copied.name} (Level {i + 1})"
                     seen.add(copied.name)
-                    self.cfeats.append(copied)
-                    self._register_entity_lookup(feature)
+                    cfeats.append(copied)
+                    self._register_entity_lookup(feature, lookup_group)
 
                     for cfo in feature.options:
                         copied = copy.copy(cfo)
                         copied.name = f"{cls_or_sub.name}: {feature.name}: {cfo.name}"
-                        self.cfeats.append(copied)
-                        self._register_entity_lookup(cfo)
+                        cfeats.append(copied)
+                        self._register_entity_lookup(cfo, lookup_group)
 
             # TCoE optional features and options
             for feature in cls_or_sub.optional_features:
                 copied = copy.copy(feature)
                 copied.name = f"{cls_or_sub.name}: {feature.name}"
-                self.optional_cfeats.append(copied)
-                self._register_entity_lookup(feature)
+                optional_cfeats.append(copied)
+                self._register_entity_lookup(feature, lookup_group)
 
                 for cfo in feature.options:
                     copied = copy.copy(cfo)
                     copied.name = f"{cls_or_sub.name}: {feature.name}: {cfo.name}"
-                    self.optional_cfeats.append(copied)
-                    self._register_entity_lookup(cfo)
+                    optional_cfeats.append(copied)
+                    self._register_entity_lookup(cfo, lookup_group)
 
-        for cls in self.classes:
+        for cls in classes:
             handle_class(cls)
             for subcls in cls.subclasses:
                 handle_class(subcls)
+        return cfeats, optional_cfeats, lookup_group
 
-    def _load_racefeats(self):
-        self.rfeats = []
-        self.subrfeats = []
+    def _load_racefeats(self, races, subraces):
+        lookup_group = _EntityLookupGroup()
 
         def handle_race(race):
             for feature in race.traits:
@@ -237,69 +397,164 @@ def handle_race(race):
                 copied.name = f"{race.name}: {feature.name}"
                 yield copied
 
-                self._register_entity_lookup(feature, allow_overwrite=not feature.inherited)
+                self._register_entity_lookup(feature, lookup_group, allow_overwrite=not feature.inherited)
                 # race feature options (e.g. breath weapon, silver dragon) are registered here as well
                 for rfo in feature.options:
-                    self._register_entity_lookup(rfo, allow_overwrite=not feature.inherited)
-
-        for base_race in self.races:
-            self.rfeats.extend(handle_race(base_race))
+                    self._register_entity_lookup(rfo, lookup_group, allow_overwrite=not feature.inherited)
 
-        for subrace in self.subraces:
-            self.subrfeats.extend(handle_race(subrace))
+        rfeats = list(itertools.chain.from_iterable(handle_race(base_race) for base_race in races))
+        subrfeats = list(itertools.chain.from_iterable(handle_race(subrace) for subrace in subraces))
+        return rfeats, subrfeats, lookup_group
 
     def _load_actions(self):
-        self.actions = []
-        self._actions_by_eid.clear()
-        self._actions_by_uid.clear()
+        actions = []
+        actions_by_uid = {}
+        actions_by_eid = collections.defaultdict(list)
         for action_data in self.raw_actions:
             action = Action.from_data(action_data)
-            self.actions.append(action)
-            self._actions_by_uid[action.uid] = action
-            self._actions_by_eid[(action.type_id, action.id)].append(action)
+            actions.append(action)
+            actions_by_uid[action.uid] = action
+            actions_by_eid[(action.type_id, action.id)].append(action)
+        return actions, actions_by_uid, actions_by_eid
 
     def _deserialize_and_register_lookups(
-        self, cls: Type[T], data_source: List[dict], skip_out_filter: Callable[[T], bool] = None, **kwargs
-    ) -> List[T]:
+        self,
+        cls: Type[T],
+        data_source: List[dict],
+        skip_out_filter: Callable[[T], bool] = None,
+        lazy: bool = False,
+        **kwargs,
+    ) -> Tuple[List[T], "_EntityLookupGroup"]:
+        """
+        :param lazy: If True, only keeps a lightweight stub of each entity, built from its raw data - the entity is
+                     deserialized on first use.
+        """
         out = []
-        for entity_data in data_source:
-            entity = cls.from_data(entity_data, **kwargs)
-            self._register_entity_lookup(entity)
+        lookup_group = _EntityLookupGroup()
+        for idx, entity_data in enumerate(data_source):
+            if lazy:
+                entity = LazyEntity(cls, data_source, idx)
+            else:
+                entity = cls.from_data(entity_data, **kwargs)
+            self._register_entity_lookup(entity, lookup_group)
             if skip_out_filter is None or not skip_out_filter(entity):
                 out.append(entity)
-        return out
+        return out, lookup_group
 
-    def _register_entity_lookup(self, entity: Sourced, allow_overwrite=True):
+    def _register_entity_lookup(self, entity: Sourced, lookup_group: "_EntityLookupGroup", allow_overwrite=True):
         k = (entity.entity_type, entity.entity_id)
-        if k in self._entity_lookup:
+        kt = (entity.type_id, entity.entity_id)
+        lookup = lookup_group.lookup
+        if k in lookup:
             if not allow_overwrite:
-                log.debug(
-                    f"Entity was not registered due to overwrite rules: {k} "
-                    f"({self._entity_lookup[k].name} -> {entity.name})"
-                )
+                log.debug(f"Entity was not registered due to overwrite rules: {k} ({lookup[k].name} -> {entity.name})")
                 return
-            elif entity.name != self._entity_lookup[k].name:
-                log.debug(
-                    f"Overwriting existing entity lookup key: {k} ({self._entity_lookup[k].name} -> {entity.name})"
-                )
+            elif entity.name != lookup[k].name:
+                log.debug(f"Overwriting existing entity lookup key: {k} ({lookup[k].name} -> {entity.name})")
             else:
-                log.debug(
-                    f"Entity lookup key {k} is registered multiple times: "
-                    f"({self._entity_lookup[k].name}, {entity.name})"
-                )
+                log.debug(f"Entity lookup key {k} is registered multiple times: ({lookup[k].name}, {entity.name})")
         log.debug(f"Registered entity {k}: {entity!r}")
-        self._entity_lookup[k] = entity
-        kt = (entity.type_id, entity.entity_id)
-        self._entity_lookup[kt] = entity
+        lookup[k] = entity
+        lookup[kt] = entity
+        # entities registered without overwrite must also not overwrite lookups registered by earlier groups
+        if allow_overwrite:
+            lookup_group.no_overwrite.pop(k, None)
+        else:
+            lookup_group.no_overwrite[k] = kt
 
         # if the entity has granted limited uses, register those too
         if isinstance(entity, LimitedUseGrantorMixin):
             for lu in entity.limited_use:
-                self._register_entity_lookup(lu)
+                self._register_entity_lookup(lu, lookup_group)
+
+    @staticmethod
+    def _merge_lookup_groups(lookup_groups: Dict[str, "_EntityLookupGroup"]) -> dict:
+        """Merges the entity lookups of each group in registration order, respecting overwrite rules."""
+        entity_lookup = {}
+        for group_key in LOOKUP_GROUP_ORDER:
+            lookup_group = lookup_groups.get(group_key)
+            if lookup_group is None:
+                continue
+            skipped = set()
+            for k, kt in lookup_group.no_overwrite.items():
+                if k in entity_lookup:
+                    log.debug(f"Entity was not registered due to overwrite rules: {k}")
+                    skipped.update((k, kt))
+            entity_lookup.update((k, entity) for k, entity in lookup_group.lookup.items() if k not in skipped)
+        return entity_lookup
+
+    @staticmethod
+    def _register_book_lookups(books):
+        return {book.source: book for book in books}
+
+    def _build_search_indices(self, current: Callable[[str], list]) -> dict:
+        """
+        Builds a search index over each of the entity lists searched by name, so that lookups do not need to
+        renormalize every name in the compendium on each query. Indices over lists that were not rebuilt are reused.
 
-    def _register_book_lookups(self):
-        for book in self.books:
-            self._book_lookup[book.source] = book
+        :param current: A callable returning the list that will be assigned to a given model attribute.
+        """
+        search_indices = {}
+        for attr in SEARCHABLE_ENTITY_LISTS:
+            entities = current(attr)
+            if not entities:
+                continue
+            index = self._search_indices.get(id(entities[0]))
+            if index is None or len(index) != len(entities) or not index.is_prefix_of(entities):
+                index = SearchIndex(entities, key=lambda e: e.name)
+            search_indices[id(entities[0])] = index
+        return search_indices
+
+    # ==== snapshots ====
+    def save_snapshot(self, path):
+        """
+        Writes the deserialized compendium, with all of its lookups already built, to a snapshot file at *path*.
+        The snapshot is written to a temporary file first, so readers never see a partially written snapshot.
+        """
+        header = {"version": SNAPSHOT_VERSION, "code_version": config.GIT_COMMIT_SHA, "timestamp": time.time()}
+        state = {attr: getattr(self, attr) for attr in SNAPSHOT_ATTRS}
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                pickle.dump(header, f, protocol=pickle.HIGHEST_PROTOCOL)
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except Exception:
+            log.warning(f"Could not write compendium snapshot to {path}", exc_info=True)
+            return
+        log.info(f"Wrote compendium snapshot to {path}")
+
+    def load_snapshot(self, path, max_age=None) -> bool:
+        """
+        Loads the compendium from a snapshot written by :meth:`save_snapshot`, if one exists and is not stale.
+        A snapshot is stale if it was written by a different snapshot format or version of the code, or is older than
+        *max_age* seconds.
+
+        :returns: Whether the snapshot was loaded.
+        """
+        try:
+            with open(path, "rb") as f:
+                header = pickle.load(f)
+                if header.get("version") != SNAPSHOT_VERSION or header.get("code_version") != config.GIT_COMMIT_SHA:
+                    log.info(f"Compendium snapshot at {path} is from a different version, ignoring")
+                    return False
+                if max_age is not None and time.time() - header.get("timestamp", 0) > max_age:
+                    log.info(f"Compendium snapshot at {path} is older than {max_age} seconds, ignoring")
+                    return False
+                state = pickle.load(f)
+        except FileNotFoundError:
+            log.info(f"No compendium snapshot found at {path}")
+            return False
+        except Exception:
+            log.warning(f"Could not load compendium snapshot from {path}", exc_info=True)
+            return False
+
+        state["_search_indices"] = self._build_search_indices(lambda attr: state[attr])
+        # increase epoch for any dependents
+        state["_epoch"] = self._epoch + 1
+        self.__dict__.update(state)
+        log.info(f"Loaded compendium snapshot from {path} - {len(self._entity_lookup)} lookups registered")
+        return True
 
     def read_json(self, filename, default):
         data = default
@@ -347,6 +602,20 @@ def lookup_actions_for_entity(self, tid, eid):
         """
         return self._actions_by_eid[(tid, eid)]
 
+    def search_index_for(self, entities: list) -> tuple[SearchIndex | None, list]:
+        """
+        Splits a list of entities to search by name into the precomputed search index over the compendium list it
+        starts with, if any (e.g. ``compendium.monsters`` followed by homebrew monsters), and the remaining entities.
+
+        :returns: A two-tuple (index or None, remaining entities)
+        """
+        if not entities:
+            return None, entities
+        index = self._search_indices.get(id(entities[0]))
+        if index is None or not index.is_prefix_of(entities):
+            return None, entities
+        return index, entities[len(index) :]
+
     @property
     def epoch(self):
         """
@@ -0,0 +1,126 @@
+import logging
+from typing import Type
+
+import cachetools
+
+from utils import config
+from .shared import Sourced
+
+log = logging.getLogger(__name__)
+
+# the attributes a lazy entity keeps in memory - enough to search, select, and check entitlements without
+# deserializing the full entity
+STUB_ATTRS = (
+    "name",
+    "homebrew",
+    "source",
+    "entity_id",
+    "page",
+    "_url",
+    "is_free",
+    "is_legacy",
+    "entitlement_entity_type",
+    "entitlement_entity_id",
+)
+
+# stub -> fully deserialized entity, for the most recently used lazy entities
+_materialized = cachetools.LRUCache(maxsize=int(config.COMPENDIUM_LAZY_CACHE_SIZE))
+
+
+class LazyEntity:
+    """
+    A lightweight stand-in for a compendium entity, which keeps only the entity's basic metadata and its own raw data
+    in memory. The full entity is deserialized on first access of any other attribute, and kept in a bounded LRU
+    cache. Lazy entities are read-only: setting an attribute outside the stub raises an AttributeError, since the
+    change would be lost when the full entity is evicted from the cache.
+
+    Lazy entities report the class of the entity they stand in for as their ``__class__``, so ``isinstance`` checks
+    against the model class behave as they would on the real entity.
+    """
+
+    __slots__ = ("_cls", "_data", "_index", *STUB_ATTRS)
+
+    def __init__(self, entity_cls: Type[Sourced], data_source: list, index: int):
+        """
+        :param entity_cls: The class of the entity to stand in for.
+        :param data_source: The raw data to deserialize the entity from. Only the entity's own data is retained.
+        :param index: The index of the entity's data in the data source.
+        """
+        self._cls = entity_cls
+        self._data = data_source[index]
+        self._index = index
+        # the stub is built from the raw data as Sourced.__init__ would - the entity is only deserialized on first access
+        sourcing = entity_cls.sourcing_from_data(self._data)
+        self.name = self._data["name"]
+        self.homebrew = sourcing["homebrew"]
+        self.source = sourcing["source"]
+        self.entity_id = sourcing["entity_id"]
+        self.page = sourcing["page"]
+        self._url = sourcing["url"]
+        self.is_free = sourcing["is_free"] or sourcing["homebrew"]
+        self.is_legacy = sourcing["is_legacy"]
+        self.entitlement_entity_type = entity_cls.entity_type
+        self.entitlement_entity_id = sourcing["entity_id"]
+
+    @classmethod
+    def _from_stub(cls, entity_cls, data, index, stub_data):
+        inst = cls.__new__(cls)
+        inst._cls = entity_cls
+        inst._data = data
+        inst._index = index
+        for attr, value in zip(STUB_ATTRS, stub_data):
+            setattr(inst, attr, value)
+        return inst
+
+    def rebind(self, data_source: list):
+        """
+        Points this entity at its data in *data_source*, a newly loaded copy of the raw data it was deserialized from
+        with the same content, so the previously loaded copy can be freed.
+        """
+        self._data = data_source[self._index]
+
+    def materialize(self) -> Sourced:
+        """Returns the full entity, deserializing it if it is not cached."""
+        try:
+            return _materialized[self]
+        except KeyError:
+            pass
+        log.debug(f"Materializing lazy entity {self!r}")
+        entity = self._cls.from_data(self._data)
+        _materialized[self] = entity
+        return entity
+
+    # ==== proxying ====
+    @property
+    def __class__(self):
+        return self._cls
+
+    @property
+    def entity_type(self):
+        return self._cls.entity_type
+
+    @property
+    def type_id(self):
+        return self._cls.type_id
+
+    def __getattr__(self, item):
+        # only called for attributes not in the stub
+        if item in LazyEntity.__slots__:
+            raise AttributeError(item)
+        return getattr(self.materialize(), item)
+
+    def __setattr__(self, key, value):
+        if key in LazyEntity.__slots__:
+            object.__setattr__(self, key, value)
+        else:
+            raise AttributeError(f"{key!r} cannot be set on a lazy entity")
+
+    def __reduce__(self):
+        stub_data = tuple(getattr(self, attr) for attr in STUB_ATTRS)
+        return LazyEntity._from_stub, (self._cls, self._data, self._index, stub_data)
+
+    def __repr__(self):
+        return (
+            f"<{self._cls.__name__} (lazy) name={self.name!r} entity_id={self.entity_id!r} "
+            f"entity_type={self.entity_type!r} url={self._url!r}>"
+        )
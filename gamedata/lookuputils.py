@@ -3,18 +3,24 @@
 
 @author: andrew
 """
+import datetime
 import itertools
 import logging
 from typing import Dict, List, TYPE_CHECKING, TypeVar
 
+import cachetools
+from bson import ObjectId
+
 from cogs5e.models.embeds import EmbedWithAuthor
 from cogs5e.models.errors import NoActiveBrew, RequiresLicense
 from cogs5e.models.homebrew import Pack, Tome
 from cogs5e.models.homebrew.bestiary import Bestiary
 from cogsmisc.stats import Stats
+from utils import config, img, invalidation
 from utils.constants import HOMEBREW_EMOJI, HOMEBREW_ICON
-from utils.functions import get_selection, search_and_select
+from utils.functions import SearchIndex, get_selection, search_and_select
 from utils.settings.guild import LegacyPreference
+from utils.subscription_mixins import HOMEBREW_CHOICES_CACHE_NAME, guild_scope, object_scope, user_scope
 from .compendium import compendium
 
 if TYPE_CHECKING:
@@ -61,8 +67,8 @@ async def handle_required_license(ctx, err):
     """
     result = err.entity  # type: Sourced
 
-    await ctx.bot.mdb.analytics_nsrd_lookup.update_one(
-        {"type": result.entity_type, "name": result.name}, {"$inc": {"num_lookups": 1}}, upsert=True
+    await ctx.bot.analytics.increment(
+        "analytics_nsrd_lookup", {"type": result.entity_type, "name": result.name}, {"num_lookups": 1}
     )
 
     embed = EmbedWithAuthor(ctx)
@@ -246,6 +252,15 @@ async def search_entities(
     # get licensed objects, mapped by entity type
     available_ids = {k: await ctx.bot.ddb.get_accessible_entities(ctx, ctx.author.id, k) for k in entities}
 
+    # use the compendium's precomputed search indices where possible, indexing any extra (homebrew) entities ad hoc
+    search_indices = []
+    for entity_list in entities.values():
+        index, extra = compendium.search_index_for(entity_list)
+        if index is not None:
+            search_indices.append(index)
+        if extra:
+            search_indices.append(SearchIndex(extra, key=lambda e: e.name, ngrams=False))
+
     result, metadata = await search_and_select(
         ctx,
         list(itertools.chain.from_iterable(entities.values())),
@@ -254,6 +269,7 @@ async def search_entities(
         selectkey=_create_selectkey(available_ids),
         selector=_create_selector(available_ids),
         return_metadata=True,
+        search_indices=search_indices,
         **kwargs,
     )
 
@@ -277,6 +293,91 @@ async def search_entities(
     return entity
 
 
+# ---- homebrew choices ----
+class _HomebrewChoices:
+    __slots__ = ("entities", "object_ids")
+
+    def __init__(self, entities: list, object_ids: set):
+        self.entities = entities  # shared between lookups - never mutate
+        self.object_ids = object_ids
+
+
+# (entity type, user id, guild id or None) -> _HomebrewChoices
+_homebrew_choices = cachetools.TTLCache(
+    maxsize=int(config.HOMEBREW_CHOICE_CACHE_SIZE), ttl=int(config.HOMEBREW_CHOICE_CACHE_TTL)
+)
+# incremented on every invalidation, so choices loaded while an invalidation happened are not cached
+_homebrew_choices_generation = 0
+
+
+async def _get_homebrew_choices(ctx, entity_type, container_cls, server_active, get_entities) -> list:
+    """
+    Returns the homebrew entities from the contextual author's active container and the containers active on the
+    contextual guild, loading them only if they are not cached for this (user, guild).
+
+    :param server_active: A callable taking the context and returning an async iterator of the server's containers.
+    :param get_entities: A coroutine function taking the context and a container and returning its entities.
+    """
+    key = (entity_type, ctx.author.id, ctx.guild.id if ctx.guild else None)
+    if (cached := _homebrew_choices.get(key)) is not None:
+        return cached.entities
+
+    generation = _homebrew_choices_generation
+    entities = []
+    object_ids = set()
+
+    # personal active container
+    try:
+        container = await container_cls.from_ctx(ctx)
+        entities.extend(await get_entities(ctx, container))
+        object_ids.add(container.id)
+    except NoActiveBrew:
+        pass
+
+    # server containers
+    if ctx.guild:
+        async for container in server_active(ctx):
+            if container.id not in object_ids:
+                entities.extend(await get_entities(ctx, container))
+                object_ids.add(container.id)
+
+    if generation == _homebrew_choices_generation:
+        _homebrew_choices[key] = _HomebrewChoices(entities, object_ids)
+    return entities
+
+
+def _invalidate_homebrew_choices(scopes):
+    global _homebrew_choices_generation
+    _homebrew_choices_generation += 1
+    scopes = set(scopes)
+    stale = [
+        key
+        for key, choices in list(_homebrew_choices.items())
+        if user_scope(key[1]) in scopes
+        or (key[2] is not None and guild_scope(key[2]) in scopes)
+        or any(object_scope(oid) in scopes for oid in choices.object_ids)
+    ]
+    for key in stale:
+        _homebrew_choices.pop(key, None)
+
+
+# dropped by subscription changes (see utils.subscription_mixins.CommonHomebrewMixin), or by publishing an
+# invalidation of this cache with the key "object:<id>" when a homebrew container's content is edited
+invalidation.register(HOMEBREW_CHOICES_CACHE_NAME, _invalidate_homebrew_choices)
+
+
+async def _bestiary_monsters(ctx, bestiary):
+    return await bestiary.load_monsters(ctx)
+
+
+async def _tome_spells(_, tome):
+    return tome.spells
+
+
+async def _pack_items(_, pack):
+    return pack.items
+
+
 # ---- monster stuff ----
 async def select_monster_full(ctx, name, extra_choices=None, **kwargs):
     """
@@ -302,24 +403,36 @@ async def get_monster_choices(ctx, homebrew=True):
     if not homebrew:
         return compendium.monsters
 
-    # personal bestiary
-    try:
-        bestiary = await Bestiary.from_ctx(ctx)
-        await bestiary.load_monsters(ctx)
-        custom_monsters = bestiary.monsters
-        bestiary_id = bestiary.id
-    except NoActiveBrew:
-        custom_monsters = []
-        bestiary_id = None
+    custom_monsters = await _get_homebrew_choices(
+        ctx, "monster", Bestiary, Bestiary.server_bestiaries, _bestiary_monsters
+    )
+    return list(itertools.chain(compendium.monsters, custom_monsters))
 
-    # server bestiaries
-    choices = list(itertools.chain(compendium.monsters, custom_monsters))
-    if ctx.guild:
-        async for servbestiary in Bestiary.server_bestiaries(ctx):
-            if servbestiary.id != bestiary_id:
-                await servbestiary.load_monsters(ctx)
-                choices.extend(servbestiary.monsters)
-    return choices
+
+async def prewarm_monster_tokens(mdb, num_monsters: int, days: int):
+    """
+    Downloads the tokens of the compendium monsters most looked up in the last *days* days, so the first !token for
+    each after a restart or compendium update does not wait on the download.
+    """
+    # lookups are not timestamped, but their ObjectIds are - this only scans the window's lookups, by the _id index
+    since = ObjectId.from_datetime(datetime.datetime.utcnow() - datetime.timedelta(days=days))
+    most_looked_up = await mdb.nn_training.aggregate(
+        [
+            {"$match": {"_id": {"$gte": since}, "type": "monster"}},
+            {"$sortByCount": "$result"},
+            {"$limit": num_monsters},
+        ],
+        allowDiskUse=True,
+    ).to_list(None)
+    names = {r["_id"] for r in most_looked_up}
+    token_urls = []
+    for monster in compendium.monsters:
+        if monster.name not in names:
+            continue
+        for is_sub in (False, True):
+            if token_url := monster.get_token_url(is_sub):
+                token_urls.append(token_url)
+    await img.prewarm_monster_tokens(token_urls)
 
 
 # ---- spell stuff ----
@@ -349,22 +462,8 @@ async def get_spell_choices(ctx, homebrew=True):
     if not homebrew:
         return compendium.spells
 
-    # personal active tome
-    try:
-        tome = await Tome.from_ctx(ctx)
-        custom_spells = tome.spells
-        tome_id = tome.id
-    except NoActiveBrew:
-        custom_spells = []
-        tome_id = None
-
-    # server tomes
-    choices = list(itertools.chain(compendium.spells, custom_spells))
-    if ctx.guild:
-        async for servtome in Tome.server_active(ctx):
-            if servtome.id != tome_id:
-                choices.extend(servtome.spells)
-    return choices
+    custom_spells = await _get_homebrew_choices(ctx, "spell", Tome, Tome.server_active, _tome_spells)
+    return list(itertools.chain(compendium.spells, custom_spells))
 
 
 # ---- item stuff ----
@@ -385,23 +484,8 @@ async def get_item_entitlement_choice_map(ctx, homebrew=True):
     if not homebrew:
         return available_items
 
-    # personal pack
-    try:
-        pack = await Pack.from_ctx(ctx)
-        custom_items = pack.items
-        pack_id = pack.id
-    except NoActiveBrew:
-        custom_items = []
-        pack_id = None
-
-    # server packs
-    choices = custom_items
-    if ctx.guild:
-        async for servpack in Pack.server_active(ctx):
-            if servpack.id != pack_id:
-                choices.extend(servpack.items)
-
-    available_items["magic-item"] = compendium.magic_items + choices
+    custom_items = await _get_homebrew_choices(ctx, "item", Pack, Pack.server_active, _pack_items)
+    available_items["magic-item"] = compendium.magic_items + custom_items
     return available_items
 
 
@@ -43,6 +43,22 @@ def __init__(
         self.entitlement_entity_type = entitlement_entity_type or self.entity_type
         self.entitlement_entity_id = entitlement_entity_id or entity_id
 
+    @classmethod
+    def sourcing_from_data(cls, d: dict) -> dict:
+        """
+        Returns the sourcing attributes of an entity from its raw static data, as its ``from_data`` reads them,
+        without deserializing the rest of the entity.
+        """
+        return dict(
+            homebrew=False,
+            source=d["source"],
+            entity_id=d["id"],
+            page=d["page"],
+            url=d["url"],
+            is_free=d["isFree"],
+            is_legacy=d.get("isLegacy", False),
+        )
+
     @classmethod
     def lookup(cls, entity_id: int):
         """Utility method to look up an instance of this class from the compendium."""
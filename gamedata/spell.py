@@ -83,6 +83,13 @@ def from_data(cls, d):  # local JSON
             is_free=d["isFree"],
         ).initialize_automation(d)
 
+    @classmethod
+    def sourcing_from_data(cls, d):
+        # spells do not read the legacy flag from local JSON
+        sourcing = super().sourcing_from_data(d)
+        sourcing["is_legacy"] = False
+        return sourcing
+
     @classmethod
     def from_homebrew(cls, data, source):  # homebrew spells
         data["components"] = parse_homebrew_components(data["components"])
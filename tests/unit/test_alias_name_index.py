@@ -0,0 +1,103 @@
+import cachetools
+import pytest
+
+from aliasing import name_index
+from utils import invalidation
+
+USER_ID = 1
+OTHER_USER_ID = 2
+GUILD_ID = 100
+
+
+class RDB:
+    async def publish(self, *_):
+        pass
+
+
+class Bot:
+    rdb = RDB()
+
+
+class Author:
+    def __init__(self, id):
+        self.id = id
+
+
+class Guild:
+    def __init__(self, id):
+        self.id = id
+
+
+class Context:
+    def __init__(self, user_id, guild_id):
+        self.bot = Bot()
+        self.author = Author(user_id)
+        self.guild = Guild(guild_id) if guild_id is not None else None
+
+
+@pytest.fixture(autouse=True)
+def fresh_caches(monkeypatch):
+    monkeypatch.setattr(name_index, "_indices", cachetools.TTLCache(maxsize=100, ttl=60))
+    monkeypatch.setattr(name_index, "_misses", cachetools.TTLCache(maxsize=100, ttl=60))
+    monkeypatch.setattr(name_index, "_invalidated", name_index._InvalidationGenerations(maxsize=100, ttl=60))
+
+
+def record_miss(user_id, guild_id, name):
+    name_index.record_miss(user_id, guild_id, name, name_index.current_generation())
+    assert name_index.is_known_miss(user_id, guild_id, name)
+
+
+@pytest.mark.parametrize("guild_id", (GUILD_ID, None))
+async def test_personal_alias_created(guild_id):
+    record_miss(USER_ID, guild_id, "attack")
+    record_miss(OTHER_USER_ID, guild_id, "attack")
+
+    # e.g. !alias attack ..., or editing a snippet
+    await name_index.invalidate_ctx(Context(USER_ID, guild_id), is_server=False)
+    assert not name_index.is_known_miss(USER_ID, guild_id, "attack")
+    assert name_index.is_known_miss(OTHER_USER_ID, guild_id, "attack")
+
+
+async def test_server_alias_created():
+    record_miss(USER_ID, GUILD_ID, "attack")
+    record_miss(OTHER_USER_ID, GUILD_ID, "attack")
+    record_miss(USER_ID, None, "attack")
+
+    # e.g. !servalias attack ..., or subscribing a server to a workshop collection
+    await name_index.invalidate_ctx(Context(USER_ID, GUILD_ID), is_server=True)
+    assert not name_index.is_known_miss(USER_ID, GUILD_ID, "attack")
+    assert not name_index.is_known_miss(OTHER_USER_ID, GUILD_ID, "attack")
+    assert name_index.is_known_miss(USER_ID, None, "attack")
+
+
+async def test_workshop_subscription():
+    record_miss(USER_ID, GUILD_ID, "attack")
+    await name_index.invalidate_user(Bot(), USER_ID)
+    assert not name_index.is_known_miss(USER_ID, GUILD_ID, "attack")
+
+
+async def test_miss_recorded_after_invalidation():
+    await name_index.invalidate_user(Bot(), USER_ID)
+    record_miss(USER_ID, GUILD_ID, "attack")
+
+
+async def test_invalidated_during_lookup():
+    # an alias is created while the name is being looked up, so the lookup may not have seen it
+    generation = name_index.current_generation()
+    await name_index.invalidate_user(Bot(), OTHER_USER_ID)
+    name_index.record_miss(USER_ID, GUILD_ID, "attack", generation)
+    assert not name_index.is_known_miss(USER_ID, GUILD_ID, "attack")
+
+
+def test_invalidated_by_other_cluster():
+    record_miss(USER_ID, GUILD_ID, "attack")
+    invalidation.invalidate_local(name_index.NAME_INDEX_CACHE_NAME, [invalidation.guild_scope(GUILD_ID)])
+    assert not name_index.is_known_miss(USER_ID, GUILD_ID, "attack")
+
+
+async def test_evicted_invalidation(monkeypatch):
+    monkeypatch.setattr(name_index, "_invalidated", name_index._InvalidationGenerations(maxsize=1, ttl=60))
+    record_miss(USER_ID, GUILD_ID, "attack")
+    await name_index.invalidate_user(Bot(), USER_ID)
+    await name_index.invalidate_user(Bot(), OTHER_USER_ID)  # evicts the first user's invalidation
+    assert not name_index.is_known_miss(USER_ID, GUILD_ID, "attack")
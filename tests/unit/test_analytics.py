@@ -0,0 +1,117 @@
+import asyncio
+
+import pytest
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+from utils.analytics import AnalyticsBuffer
+
+
+class StubCollection:
+    def __init__(self):
+        self.writes = []
+        # exceptions to raise from the next bulk writes, in order
+        self.failures = []
+
+    async def bulk_write(self, requests, ordered=True):
+        assert not ordered
+        if self.failures:
+            raise self.failures.pop(0)
+        self.writes.append(requests)
+
+
+class StubDatabase(dict):
+    def __missing__(self, key):
+        collection = self[key] = StubCollection()
+        return collection
+
+
+@pytest.fixture()
+def mdb():
+    return StubDatabase()
+
+
+def inc(query, n):
+    return UpdateOne(query, {"$inc": {"num_invocations": n}}, upsert=True)
+
+
+async def test_flush_on_size(mdb):
+    buffer = AnalyticsBuffer(mdb, max_size=2, flush_interval=60)
+    await buffer.insert("events", {"a": 1})
+    await buffer.increment("counters", {"key": "x"}, {"num_invocations": 1})
+    assert not mdb
+    await buffer.insert("events", {"a": 2})  # the buffer is full, so this waits for a flush
+    assert mdb["events"].writes == [[InsertOne({"a": 1})]]
+    assert mdb["counters"].writes == [[inc({"key": "x"}, 1)]]
+
+
+async def test_increments_aggregated(mdb):
+    buffer = AnalyticsBuffer(mdb, max_size=10, flush_interval=60)
+    await buffer.increment("counters", {"key": "x"}, {"num_invocations": 1})
+    await buffer.increment("counters", {"key": "x"}, {"num_invocations": 2})
+    await buffer.increment("counters", {"key": "y"}, {"num_invocations": 1})
+    await buffer.flush()
+    assert mdb["counters"].writes == [[inc({"key": "x"}, 3), inc({"key": "y"}, 1)]]
+
+
+async def test_flush_on_interval(mdb):
+    buffer = AnalyticsBuffer(mdb, max_size=10, flush_interval=0.01)
+    buffer.start(asyncio.get_running_loop())
+    await buffer.insert("events", {"a": 1})
+    await asyncio.sleep(0.05)
+    assert mdb["events"].writes == [[InsertOne({"a": 1})]]
+    await buffer.close()
+
+
+async def test_requeue_on_connection_failure(mdb):
+    buffer = AnalyticsBuffer(mdb, max_size=10, flush_interval=60)
+    mdb["events"].failures.append(AutoReconnect("connection refused"))
+    mdb["counters"].failures.append(AutoReconnect("connection refused"))
+    await buffer.insert("events", {"a": 1})
+    await buffer.increment("counters", {"key": "x"}, {"num_invocations": 1}, set_on_insert={"first": 1})
+    await buffer.flush()
+    assert not mdb["events"].writes
+
+    # recorded after the failed flush
+    await buffer.insert("events", {"a": 2})
+    await buffer.increment("counters", {"key": "x"}, {"num_invocations": 2}, set_on_insert={"first": 2})
+    await buffer.flush()
+    assert len(mdb["events"].writes) == 1
+    assert [request._doc["a"] for request in mdb["events"].writes[0]] == [1, 2]
+    assert mdb["counters"].writes == [
+        [UpdateOne({"key": "x"}, {"$inc": {"num_invocations": 3}, "$setOnInsert": {"first": 1}}, upsert=True)]
+    ]
+
+
+async def test_requeue_bounded(mdb):
+    buffer = AnalyticsBuffer(mdb, max_size=4, flush_interval=60)
+    mdb["events"].failures.append(AutoReconnect("connection refused"))
+    for i in range(4):
+        await buffer.insert("events", {"a": i})
+    await buffer.flush()
+    # only half of the buffer is re-queued, so events can still be recorded without waiting
+    assert buffer._size == 2
+    await buffer.insert("events", {"a": 4})
+    assert not mdb["events"].writes
+    await buffer.flush()
+    assert [request._doc["a"] for request in mdb["events"].writes[0]] == [0, 1, 4]
+
+
+async def test_rejected_writes_dropped(mdb):
+    buffer = AnalyticsBuffer(mdb, max_size=10, flush_interval=60)
+    mdb["events"].failures.append(BulkWriteError({"writeErrors": [{"index": 0, "code": 11000}]}))
+    await buffer.insert("events", {"a": 1})
+    await buffer.flush()
+    await buffer.flush()
+    assert not mdb["events"].writes
+
+
+async def test_close_drains(mdb):
+    buffer = AnalyticsBuffer(mdb, max_size=10, flush_interval=60)
+    buffer.start(asyncio.get_running_loop())
+    await buffer.insert("events", {"a": 1})
+    await buffer.increment("counters", {"key": "x"}, {"num_invocations": 1})
+    await buffer.close()
+    assert mdb["events"].writes == [[InsertOne({"a": 1})]]
+    assert mdb["counters"].writes == [[inc({"key": "x"}, 1)]]
+    assert buffer._task is None
@@ -0,0 +1,226 @@
+import copy
+
+import pytest
+
+from cogs5e.initiative import Combat, CombatConflict, CombatOptions
+
+CHANNEL_ID = "1234"
+
+
+class UpdateResult:
+    def __init__(self, matched_count):
+        self.matched_count = matched_count
+
+
+class CombatCollection:
+    """An in-memory stand-in for the combats collection, holding a single combat."""
+
+    def __init__(self, doc):
+        self.doc = copy.deepcopy(doc)
+        self.updates = []
+        # called after each find_one, to simulate another command writing in between
+        self.after_find = None
+
+    def _get(self, path):
+        value = self.doc
+        for part in path.split("."):
+            if isinstance(value, list):
+                value = value[int(part)] if int(part) < len(value) else None
+            else:
+                value = value.get(part)
+        return value
+
+    def _set(self, path, value):
+        *parents, key = path.split(".")
+        target = self.doc
+        for part in parents:
+            target = target[int(part)] if isinstance(target, list) else target[part]
+        if isinstance(target, list):
+            target[int(key)] = copy.deepcopy(value)
+        else:
+            target[key] = copy.deepcopy(value)
+
+    def _unset(self, path):
+        *parents, key = path.split(".")
+        target = self.doc
+        for part in parents:
+            target = target[int(part)] if isinstance(target, list) else target[part]
+        target.pop(key, None)
+
+    async def find_one(self, query):
+        doc = copy.deepcopy(self.doc)
+        if self.after_find is not None:
+            self.after_find(self)
+        return doc
+
+    async def update_one(self, query, update, upsert=False):
+        self.updates.append((query, update))
+        if self.doc is None or any(self._get(k) != v for k, v in query.items()):
+            return UpdateResult(0)
+        for path, value in update.get("$set", {}).items():
+            self._set(path, value)
+        for path in update.get("$unset", {}):
+            self._unset(path)
+        self.doc["version"] = (self.doc.get("version") or 0) + update.get("$inc", {}).get("version", 0)
+        return UpdateResult(1)
+
+    def write(self, **changes):
+        """Another command's write."""
+        self.doc.update(copy.deepcopy(changes))
+        self.doc["version"] = (self.doc.get("version") or 0) + 1
+
+
+class MDB:
+    def __init__(self, combats):
+        self.combats = combats
+
+
+class RDB:
+    async def publish(self, *_):
+        pass
+
+
+class Bot:
+    def __init__(self, combats):
+        self.mdb = MDB(combats)
+        self.rdb = RDB()
+
+
+class DictCombat(Combat):
+    """A combat whose state is a plain dict, so that its writes can be tested without combatants."""
+
+    def __init__(self, doc):
+        super().__init__(CHANNEL_ID, 1, 1, CombatOptions(), ctx=None)
+        self.state = copy.deepcopy({k: v for k, v in doc.items() if k != "version"})
+        self._version = doc.get("version", 0)
+        self._mark_committed(self.to_dict())
+
+    def to_dict(self):
+        return copy.deepcopy(self.state)
+
+
+def combatant(cid, hp, **kwargs):
+    return {"id": cid, "name": cid, "hp": hp, **kwargs}
+
+
+@pytest.fixture()
+def doc():
+    return {
+        "channel": CHANNEL_ID,
+        "round": 1,
+        "turn": 10,
+        "metadata": {},
+        "combatants": [combatant("a", 20), combatant("b", 15)],
+        "version": 3,
+    }
+
+
+async def test_write_changed_fields(doc):
+    combats = CombatCollection(doc)
+    combat = DictCombat(doc)
+    combat.state["round"] = 2
+    combat.state["combatants"][1]["hp"] = 10
+    await combat._write(Bot(combats))
+
+    assert len(combats.updates) == 1
+    query, update = combats.updates[0]
+    assert query == {"channel": CHANNEL_ID, "version": 3, "combatants.1.id": "b"}
+    assert update["$set"] == {"round": 2, "combatants.1.hp": 10}
+    assert combats.doc["version"] == 4
+    assert combat._version == 4
+
+
+async def test_write_unchanged(doc):
+    combats = CombatCollection(doc)
+    await DictCombat(doc)._write(Bot(combats))
+    assert not combats.updates
+
+
+async def test_rebase_onto_their_combatants(doc):
+    combats = CombatCollection(doc)
+    combat = DictCombat(doc)
+    Combat._cache[CHANNEL_ID] = combat
+    # they add a combatant and damage another, we damage the same combatant and end the round
+    combats.write(combatants=[combatant("a", 20), combatant("b", 12), combatant("c", 30)])
+    combat.state["combatants"][1]["hp"] = 10
+    combat.state["round"] = 2
+    await combat._write(Bot(combats))
+
+    assert combats.doc["combatants"] == [combatant("a", 20), combatant("b", 7), combatant("c", 30)]
+    assert combats.doc["round"] == 2
+    assert combats.doc["version"] == 5
+    assert CHANNEL_ID not in Combat._cache
+
+
+async def test_rebase_onto_their_fields(doc):
+    combats = CombatCollection(doc)
+    combat = DictCombat(doc)
+    # we remove a combatant, they damage the other and change the combat's metadata
+    combats.write(combatants=[combatant("a", 11), combatant("b", 15)], metadata={"theirs": True})
+    combat.state["combatants"] = [combatant("b", 15)]
+    await combat._write(Bot(combats))
+
+    assert combats.doc["combatants"] == [combatant("b", 15)]
+    assert combats.doc["metadata"] == {"theirs": True}
+
+
+async def test_no_version_after_rebase(doc):
+    combats = CombatCollection(doc)
+    combat = DictCombat(doc)
+    combats.write(turn=5)
+    combat.state["round"] = 2
+    await combat._write(Bot(combats))
+    assert combat._version is None
+
+    # our object does not have their turn, so writing it again must not overwrite it
+    combat.state["combatants"][0]["hp"] = 18
+    await combat._write(Bot(combats))
+    assert combats.doc["turn"] == 5
+    assert combats.doc["round"] == 2
+    assert combats.doc["combatants"][0]["hp"] == 18
+
+
+async def test_rebase_retried(doc):
+    combats = CombatCollection(doc)
+    combat = DictCombat(doc)
+    combats.write(combatants=[combatant("a", 17), combatant("b", 15)])
+    combat.state["combatants"][0]["hp"] = 10
+
+    def write_once(coll):
+        # they damage the combatant again while we are rebasing
+        coll.after_find = None
+        coll.write(combatants=[combatant("a", 14), combatant("b", 15)])
+
+    combats.after_find = write_once
+    await combat._write(Bot(combats))
+    assert combats.doc["combatants"][0]["hp"] == 4  # 20 - 6 (theirs) - 10 (ours)
+
+
+async def test_rebase_gives_up(doc):
+    combats = CombatCollection(doc)
+    combat = DictCombat(doc)
+    combats.write(turn=5)
+    combats.after_find = lambda coll: coll.write(turn=5)  # they always write while we are rebasing
+    combat.state["round"] = 2
+    with pytest.raises(CombatConflict):
+        await combat._write(Bot(combats))
+    assert combats.doc["round"] == 1
+
+
+async def test_both_change_combatants_conflict(doc):
+    combats = CombatCollection(doc)
+    combat = DictCombat(doc)
+    combats.write(combatants=[combatant("a", 20), combatant("b", 15), combatant("c", 30)])
+    combat.state["combatants"].append(combatant("d", 40))
+    with pytest.raises(CombatConflict):
+        await combat._write(Bot(combats))
+    assert [c["id"] for c in combats.doc["combatants"]] == ["a", "b", "c"]
+
+
+async def test_ended_combat_not_recreated(doc):
+    combats = CombatCollection(doc)
+    combat = DictCombat(doc)
+    combats.doc = None  # another command ended the combat
+    combat.state["round"] = 2
+    await combat._write(Bot(combats))
+    assert combats.doc is None
@@ -0,0 +1,82 @@
+from utils import dirty
+
+
+def test_diff_unchanged():
+    data = {"name": "Bob", "hp": 10, "effects": [{"name": "Blessed"}]}
+    assert dirty.diff(data, dirty.snapshot(data)) == ({}, {})
+
+
+def test_diff_changed_added_and_removed():
+    old = {"name": "Bob", "hp": 10, "temp": 5}
+    new = {"name": "Bob", "hp": 7, "notes": "hurt"}
+    assert dirty.diff(new, dirty.snapshot(old), prefix="combatants.3.") == (
+        {"combatants.3.hp": 7, "combatants.3.notes": "hurt"},
+        {"combatants.3.temp": True},
+    )
+
+
+def test_snapshot_is_not_mutated():
+    data = {"effects": [{"name": "Blessed"}]}
+    snapshot = dirty.snapshot(data)
+    data["effects"].append({"name": "Cursed"})  # e.g. a live list returned by to_dict()
+    assert dirty.diff(data, snapshot) == ({"effects": data["effects"]}, {})
+
+
+def test_diff_subdocument():
+    old = {"stats": {"a": 1, "b": 2, "c": 3}}
+    new = {"stats": {"a": 1, "b": 5, "d": 4}}
+    assert dirty.diff(new, dirty.snapshot(old, subdocuments=("stats",))) == (
+        {"stats.b": 5, "stats.d": 4},
+        {"stats.c": True},
+    )
+
+
+def test_diff_subdocument_unsafe_keys():
+    # keys that cannot be used in a field path are written as a whole
+    old = {"stats": {"a.b": 1}}
+    new = {"stats": {"a.b": 2}}
+    assert dirty.diff(new, dirty.snapshot(old, subdocuments=("stats",))) == ({"stats": {"a.b": 2}}, {})
+
+
+def test_diff_unencodable():
+    data = {"value": object()}
+    assert dirty.diff(data, dirty.snapshot(data)) == (data, {})
+
+
+def test_merge_theirs_unchanged_by_us():
+    base = {"name": "Bob", "hp": 10, "notes": None}
+    ours = {"name": "Bob", "hp": 10, "notes": "ours"}
+    theirs = {"name": "Robert", "hp": 10, "notes": None}
+    assert dirty.merge(dirty.snapshot(base), ours, theirs) == {"name": "Robert", "hp": 10, "notes": "ours"}
+
+
+def test_merge_ours_takes_precedence():
+    base = {"notes": None}
+    assert dirty.merge(dirty.snapshot(base), {"notes": "ours"}, {"notes": "theirs"}) == {"notes": "ours"}
+
+
+def test_merge_added_and_removed():
+    base = {"a": 1, "b": 2}
+    ours = {"a": 1, "c": 3}  # we removed b and added c
+    theirs = {"a": 1, "b": 2, "d": 4}  # they added d
+    assert dirty.merge(dirty.snapshot(base), ours, theirs) == {"a": 1, "c": 3, "d": 4}
+
+
+def test_merge_additive():
+    base = {"hp": 20, "temp": 5}
+    ours = {"hp": 15, "temp": 0}  # we dealt 5 damage
+    theirs = {"hp": 12, "temp": 3}  # they dealt 8 damage
+    merged = dirty.merge(dirty.snapshot(base), ours, theirs, additive=("hp",))
+    assert merged == {"hp": 7, "temp": 0}
+
+
+def test_merge_additive_only_when_we_changed_it():
+    base = {"hp": 20}
+    assert dirty.merge(dirty.snapshot(base), {"hp": 20}, {"hp": 12}, additive=("hp",)) == {"hp": 12}
+
+
+def test_merge_additive_non_numeric():
+    # e.g. a combatant whose hp was unset by one side
+    base = {"hp": 20}
+    assert dirty.merge(dirty.snapshot(base), {"hp": 15}, {"hp": None}, additive=("hp",)) == {"hp": 15}
+    assert dirty.merge(dirty.snapshot({"hp": None}), {"hp": 15}, {"hp": 12}, additive=("hp",)) == {"hp": 15}
@@ -0,0 +1,91 @@
+import asyncio
+import json
+
+import pytest
+from ldclient.versioned_data_kind import FEATURES
+
+from utils.feature_flags import AsyncLaunchDarklyClient
+
+SUBSCRIBER_FLAG = {
+    "key": "subscriber-flag",
+    "on": True,
+    "targets": [],
+    "rules": [
+        {
+            "id": "subscribers",
+            "clauses": [{"attribute": "Subscription", "op": "in", "values": ["Hero"], "negate": False}],
+            "variation": 0,
+        }
+    ],
+    "prerequisites": [],
+    "fallthrough": {"variation": 1},
+    "offVariation": 1,
+    "variations": [True, False],
+    "version": 1,
+    "salt": "salt",
+}
+
+
+def ddb_user(subscription):
+    return {"key": "1234", "name": "user", "custom": {"Roles": [], "Subscription": subscription}}
+
+
+@pytest.fixture()
+async def ldclient(tmp_path):
+    # the path that LAUNCHDARKLY_FLAG_DATA_PATH points to
+    flag_data_path = tmp_path / "flags.json"
+    flag_data_path.write_text(
+        json.dumps({"flagValues": {"untargeted-flag": "on"}, "flags": {"subscriber-flag": SUBSCRIBER_FLAG}})
+    )
+    client = AsyncLaunchDarklyClient(asyncio.get_running_loop(), sdk_key="test", flag_data_path=str(flag_data_path))
+    yield client
+    client.close()
+
+
+async def test_flag_data_path(ldclient):
+    assert await ldclient.variation("untargeted-flag", {"key": "1234"}, "off") == "on"
+    assert await ldclient.variation("subscriber-flag", ddb_user("Hero"), False) is True
+    assert await ldclient.variation("subscriber-flag", ddb_user(None), False) is False
+
+
+async def test_evaluations_cached(ldclient, monkeypatch):
+    assert await ldclient.variation("untargeted-flag", {"key": "1234"}, "off") == "on"
+
+    def fail(*_):
+        raise AssertionError("evaluation was not cached")
+
+    monkeypatch.setattr(ldclient, "variation_detail", fail)
+    assert await ldclient.variation("untargeted-flag", {"key": "1234"}, "off") == "on"
+
+
+async def test_cache_keyed_by_targeted_attributes(ldclient):
+    assert await ldclient.variation("subscriber-flag", ddb_user(None), False) is False
+    # the same user, after subscribing
+    assert await ldclient.variation("subscriber-flag", ddb_user("Hero"), False) is True
+
+
+async def test_default_not_cached(ldclient):
+    assert await ldclient.variation("missing-flag", {"key": "1234"}, "a") == "a"
+    assert await ldclient.variation("missing-flag", {"key": "1234"}, "b") == "b"
+
+
+async def test_cache_invalidated_on_flag_change(ldclient):
+    assert await ldclient.variation("subscriber-flag", ddb_user("Hero"), False) is True
+
+    # as the SDK's update thread would on a flag change
+    ldclient._store.upsert(FEATURES, {**SUBSCRIBER_FLAG, "on": False, "version": 2})
+    await asyncio.sleep(0)  # let the invalidation run
+    assert await ldclient.variation("subscriber-flag", ddb_user("Hero"), False) is False
+
+
+async def test_evaluation_during_flag_change_not_cached(ldclient, monkeypatch):
+    variation_detail = ldclient.variation_detail
+
+    def change_during_evaluation(*args):
+        detail = variation_detail(*args)
+        ldclient._flag_changed()  # the flag changes after it was evaluated, but before the evaluation is cached
+        return detail
+
+    monkeypatch.setattr(ldclient, "variation_detail", change_during_evaluation)
+    assert await ldclient.variation("subscriber-flag", ddb_user("Hero"), False) is True
+    assert not ldclient._evaluations
@@ -0,0 +1,115 @@
+import pytest
+
+from utils.functions import SearchIndex, search, search_indexed
+
+# a sample of compendium names, including names that appear more than once (e.g. legacy and updated versions)
+COMPENDIUM_NAMES = [
+    "Adult Red Dragon",
+    "Ancient Red Dragon",
+    "Young Red Dragon",
+    "Red Dragon Wyrmling",
+    "Adult Blue Dragon",
+    "Dragon Turtle",
+    "Goblin",
+    "Goblin Boss",
+    "Hobgoblin",
+    "Hobgoblin Captain",
+    "Bugbear",
+    "Owlbear",
+    "Tarrasque",
+    "Beholder",
+    "Death Tyrant",
+    "Lich",
+    "Demilich",
+    "Fireball",
+    "Delayed Blast Fireball",
+    "Fire Bolt",
+    "Fire Shield",
+    "Wall of Fire",
+    "Cure Wounds",
+    "Mass Cure Wounds",
+    "Healing Word",
+    "Mass Healing Word",
+    "Magic Missile",
+    "Shield",
+    "Shield of Faith",
+    "Bag of Holding",
+    "Portable Hole",
+    "Potion of Healing",
+    "Potion of Greater Healing",
+    "Longsword",
+    "Longsword +1",
+    "Goblin",
+    "Shield",
+]
+HOMEBREW_NAMES = ["Fireball", "Goblin Shaman", "Ice Dragon", "Wand of Fireballs"]
+
+QUERIES = [
+    # exact
+    "Goblin",
+    "goblin",
+    "shield",
+    "Fireball",
+    "Longsword +1",
+    # partial
+    "tarras",
+    "dragon",
+    "red dragon",
+    "heal",
+    "fire",
+    "ol",
+    "e",
+    # fuzzy
+    "gobiln",
+    "firbal",
+    "beholdr",
+    "ancient red dargon",
+    "potoin of helaing",
+    "xyzzy",
+]
+
+
+class Entity:
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return f"<Entity {self.name!r}>"
+
+
+@pytest.fixture(scope="module")
+def compendium():
+    return [Entity(name) for name in COMPENDIUM_NAMES]
+
+
+@pytest.fixture(scope="module")
+def homebrew():
+    return [Entity(name) for name in HOMEBREW_NAMES]
+
+
+def key(e):
+    return e.name
+
+
+@pytest.mark.parametrize("strict", (False, True))
+@pytest.mark.parametrize("query", QUERIES)
+def test_search_indexed(compendium, query, strict):
+    index = SearchIndex(compendium, key=key)
+    assert search_indexed([index], query, strict=strict) == search(compendium, query, key=key, strict=strict)
+
+
+@pytest.mark.parametrize("strict", (False, True))
+@pytest.mark.parametrize("query", QUERIES)
+def test_search_indexed_with_homebrew(compendium, homebrew, query, strict):
+    indices = [SearchIndex(compendium, key=key), SearchIndex(homebrew, key=key, ngrams=False)]
+    expected = search(compendium + homebrew, query, key=key, strict=strict)
+    assert search_indexed(indices, query, strict=strict) == expected
+
+
+def test_search_indexed_cutoff(compendium):
+    index = SearchIndex(compendium, key=key)
+    assert search_indexed([index], "gobiln", cutoff=90) == search(compendium, "gobiln", key=key, cutoff=90)
+
+
+def test_search_indexed_empty():
+    assert search_indexed([SearchIndex([], key=key)], "goblin") == ([], False)
@@ -118,10 +118,10 @@ async def server_settings(avrae, **settings):
     old_servsettings = await ServerSettings.for_guild(avrae.mdb, TEST_GUILD_ID)
     try:
         new_servsettings = ServerSettings(guild_id=int(TEST_GUILD_ID), **settings)
-        await new_servsettings.commit(avrae.mdb)
+        await new_servsettings.commit(avrae)
         yield
     finally:
-        await old_servsettings.commit(avrae.mdb)
+        await old_servsettings.commit(avrae)
 
 
 class ContextBotProxy:
@@ -37,7 +37,7 @@ async def commit_settings(self):
         This is significantly more efficient than using Character.commit().
         """
         self.character.options = self.settings
-        await self.settings.commit(self.bot.mdb, self.character)
+        await self.settings.commit(self.bot, self.character)
 
     async def can_do_character_sync(self):
         """Returns a pair of bools (outbound_possible, inbound_possible)."""
@@ -0,0 +1,198 @@
+"""
+An in-process buffer for analytics writes, so that logging a command, lookup, or alias invocation does not wait on
+MongoDB.
+
+Counters (``$inc`` upserts) are aggregated in memory by document, and events (inserts) are queued; both are written
+periodically with one unordered ``bulk_write`` per collection. The buffer is bounded: when it is full, the
+coroutine recording an event waits for the buffer to be flushed. Batches that fail to write because the database is
+unreachable are re-queued for the next flush, into at most half of the buffer, so an outage neither grows the buffer
+without bound nor makes every event wait on a flush; what does not fit, and batches the database rejects, are logged
+and dropped. Anything left is flushed when the bot closes.
+"""
+import asyncio
+import datetime
+import functools
+import logging
+from collections import Counter, defaultdict
+
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import ConnectionFailure
+
+log = logging.getLogger(__name__)
+
+
+class _Increment:
+    __slots__ = ("query", "inc", "timestamps", "set", "set_on_insert")
+
+    def __init__(self, query: dict):
+        self.query = query
+        self.inc = Counter()
+        self.timestamps = {}  # field -> the time of the latest event, written with $max
+        self.set = {}
+        self.set_on_insert = {}
+
+    def to_update(self) -> UpdateOne:
+        update = {"$inc": dict(self.inc)}
+        if self.timestamps:
+            update["$max"] = self.timestamps
+        if self.set:
+            update["$set"] = self.set
+        if self.set_on_insert:
+            update["$setOnInsert"] = self.set_on_insert
+        return UpdateOne(self.query, update, upsert=True)
+
+    def merge_earlier(self, earlier: "_Increment"):
+        """Merges an increment of the same document that was recorded before this one into this one."""
+        self.inc.update(earlier.inc)
+        self.timestamps = {**earlier.timestamps, **self.timestamps}
+        self.set = {**earlier.set, **self.set}
+        self.set_on_insert = {**self.set_on_insert, **earlier.set_on_insert}
+
+
+class AnalyticsBuffer:
+    def __init__(self, mdb, max_size: int, flush_interval: float):
+        """
+        :param mdb: The database to write to.
+        :param max_size: The number of counters and events to buffer before recording another waits for a flush.
+        :param flush_interval: The number of seconds between flushes.
+        """
+        self.mdb = mdb
+        self.max_size = max_size
+        self.flush_interval = flush_interval
+        # collection name -> {query key: _Increment}
+        self._increments = defaultdict(dict)
+        # collection name -> list of documents
+        self._inserts = defaultdict(list)
+        self._size = 0
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+
+    # ==== recording ====
+    async def increment(
+        self,
+        collection: str,
+        query: dict,
+        inc: dict,
+        timestamps=(),
+        set_fields: dict = None,
+        set_on_insert: dict = None,
+    ):
+        """
+        Increments the counters *inc* of the document matching *query* in *collection*, creating it if it does not
+        exist.
+
+        :param timestamps: The names of fields to set to the current time (if it is later than the current value).
+        :param set_fields: Fields to set. Later increments of the same document take precedence.
+        :param set_on_insert: Fields to set if the document is created. Earlier increments take precedence.
+        """
+        await self._reserve()
+        key = tuple(sorted(query.items()))
+        entry = self._increments[collection].get(key)
+        if entry is None:
+            entry = self._increments[collection][key] = _Increment(query)
+            self._size += 1
+        entry.inc.update(inc)
+        if timestamps:
+            now = datetime.datetime.utcnow()
+            entry.timestamps.update({field: now for field in timestamps})
+        if set_fields:
+            entry.set.update(set_fields)
+        if set_on_insert:
+            entry.set_on_insert = {**set_on_insert, **entry.set_on_insert}
+
+    async def insert(self, collection: str, document: dict):
+        """Inserts *document* into *collection*."""
+        await self._reserve()
+        self._inserts[collection].append(document)
+        self._size += 1
+
+    async def _reserve(self):
+        # backpressure: wait until there is room in the buffer
+        while self._size >= self.max_size:
+            await self.flush()
+
+    # ==== flushing ====
+    async def flush(self):
+        """Writes everything buffered so far."""
+        async with self._flush_lock:
+            increments, self._increments = self._increments, defaultdict(dict)
+            inserts, self._inserts = self._inserts, defaultdict(list)
+            self._size = 0
+
+            writes = []
+            requeues = []
+            for collection, entries in increments.items():
+                entries = list(entries.values())
+                writes.append(self._write(collection, [entry.to_update() for entry in entries]))
+                requeues.append(functools.partial(self._requeue_increments, collection, entries))
+            for collection, documents in inserts.items():
+                writes.append(self._write(collection, [InsertOne(document) for document in documents]))
+                requeues.append(functools.partial(self._requeue_inserts, collection, documents))
+            results = await asyncio.gather(*writes)
+
+            # re-queued operations take up at most half of the buffer, so that events can still be recorded without
+            # waiting on a flush while the database is unreachable
+            room = min(self.max_size // 2, self.max_size - self._size)
+            for written, requeue in zip(results, requeues):
+                if not written:
+                    room -= requeue(room)
+
+    async def _write(self, collection, requests) -> bool:
+        """Returns False if the operations should be retried on the next flush."""
+        try:
+            await self.mdb[collection].bulk_write(requests, ordered=False)
+        except ConnectionFailure as e:
+            log.warning(f"Failed to write {len(requests)} analytics operations to {collection!r}, retrying later: {e}")
+            return False
+        except Exception as e:
+            log.warning(f"Failed to write {len(requests)} analytics operations to {collection!r}: {e}")
+        return True
+
+    def _requeue_increments(self, collection, entries, room) -> int:
+        """Re-queues the failed counters *entries* into at most *room* buffer entries. Returns the number used."""
+        current = self._increments[collection]
+        used = dropped = 0
+        for entry in entries:
+            key = tuple(sorted(entry.query.items()))
+            if key in current:  # the same document was incremented again since the flush
+                current[key].merge_earlier(entry)
+            elif used < room:
+                current[key] = entry
+                used += 1
+            else:
+                dropped += 1
+        self._size += used
+        self._log_dropped(collection, dropped)
+        return used
+
+    def _requeue_inserts(self, collection, documents, room) -> int:
+        """Re-queues the failed *documents* into at most *room* buffer entries. Returns the number used."""
+        requeued = documents[: max(room, 0)]
+        self._inserts[collection][:0] = requeued
+        self._size += len(requeued)
+        self._log_dropped(collection, len(documents) - len(requeued))
+        return len(requeued)
+
+    @staticmethod
+    def _log_dropped(collection, dropped):
+        if dropped:
+            log.warning(f"Dropped {dropped} analytics operations to {collection!r}: the buffer is full")
+
+    async def run(self):
+        """Flushes the buffer every *flush_interval* seconds. Runs until cancelled."""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                log.exception("Failed to flush analytics:")
+
+    def start(self, loop):
+        self._task = loop.create_task(self.run())
+
+    async def close(self):
+        """Stops flushing periodically and writes everything buffered. Call before shutting down."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
@@ -9,11 +9,55 @@
 NUM_CLUSTERS = int(os.getenv("NUM_CLUSTERS")) if "NUM_CLUSTERS" in os.environ else None
 NUM_SHARDS = int(os.getenv("NUM_SHARDS")) if "NUM_SHARDS" in os.environ else None
 RELOAD_INTERVAL = os.getenv("RELOAD_INTERVAL", "0")  # compendium static data reload interval
+# optional - if set, the deserialized compendium is snapshotted here and loaded from here on startup
+COMPENDIUM_SNAPSHOT_PATH = os.getenv("COMPENDIUM_SNAPSHOT_PATH")
+COMPENDIUM_SNAPSHOT_MAX_AGE = os.getenv("COMPENDIUM_SNAPSHOT_MAX_AGE", "86400")  # seconds
+# if set, large compendium entities are only deserialized when used, and the most recently used are cached
+COMPENDIUM_LAZY_ENTITIES = bool(os.getenv("COMPENDIUM_LAZY_ENTITIES"))
+COMPENDIUM_LAZY_CACHE_SIZE = os.getenv("COMPENDIUM_LAZY_CACHE_SIZE", "1000")
 ECS_METADATA_ENDPT = os.getenv("ECS_CONTAINER_METADATA_URI")  # set by ECS
 MONSTER_TOKEN_ENDPOINT = os.getenv("MONSTER_TOKEN_ENDPOINT")  # S3: monster tokens
 # secret for the draconic signature() function
 DRACONIC_SIGNATURE_SECRET = os.getenv("DRACONIC_SIGNATURE_SECRET", "secret").encode()
 
+# process-wide cache of gvars and parsed gvar modules shared between script executions
+GVAR_CACHE_MAX_BYTES = os.getenv("GVAR_CACHE_MAX_BYTES", str(64 * 1024 * 1024))
+GVAR_CACHE_TTL = os.getenv("GVAR_CACHE_TTL", "3600")  # seconds
+# cache of the alias/snippet names in scope for each user and guild
+ALIAS_INDEX_CACHE_SIZE = os.getenv("ALIAS_INDEX_CACHE_SIZE", "10000")
+ALIAS_INDEX_CACHE_TTL = os.getenv("ALIAS_INDEX_CACHE_TTL", "300")  # seconds
+ALIAS_MISS_CACHE_SIZE = os.getenv("ALIAS_MISS_CACHE_SIZE", "50000")  # recent words that matched no alias
+# cache of deserialized homebrew bestiary monsters, sized by the bestiaries' size in the db
+BESTIARY_CACHE_MAX_BYTES = os.getenv("BESTIARY_CACHE_MAX_BYTES", str(64 * 1024 * 1024))
+CRITTERDB_FETCH_CONCURRENCY = os.getenv("CRITTERDB_FETCH_CONCURRENCY", "5")  # requests in flight per bestiary import
+# the homebrew spells, items, and monsters in scope for each (user, guild)
+HOMEBREW_CHOICE_CACHE_SIZE = os.getenv("HOMEBREW_CHOICE_CACHE_SIZE", "10000")
+HOMEBREW_CHOICE_CACHE_TTL = os.getenv("HOMEBREW_CHOICE_CACHE_TTL", "120")  # seconds; picks up dashboard edits
+# token rendering
+TOKEN_RENDER_PROCESSES = os.getenv("TOKEN_RENDER_PROCESSES", "2")
+TOKEN_RENDER_CACHE_MAX_BYTES = os.getenv("TOKEN_RENDER_CACHE_MAX_BYTES", str(32 * 1024 * 1024))
+TOKEN_RENDER_CACHE_TTL = os.getenv("TOKEN_RENDER_CACHE_TTL", "3600")  # seconds; source images may change
+MONSTER_TOKEN_CACHE_MAX_BYTES = os.getenv("MONSTER_TOKEN_CACHE_MAX_BYTES", str(256 * 1024 * 1024))  # on disk
+MONSTER_TOKEN_PREWARM_COUNT = os.getenv("MONSTER_TOKEN_PREWARM_COUNT", "0")  # monsters; 0 to disable
+MONSTER_TOKEN_PREWARM_DAYS = os.getenv("MONSTER_TOKEN_PREWARM_DAYS", "7")  # days of lookups to rank monsters by
+# seconds to defer and coalesce character writes by; 0 to write on every commit
+CHARACTER_WRITE_BEHIND_DELAY = os.getenv("CHARACTER_WRITE_BEHIND_DELAY", "0")
+# in-memory character and combat caches - kept coherent between clusters over redis pubsub
+CHARACTER_CACHE_SIZE = os.getenv("CHARACTER_CACHE_SIZE", "50")
+CHARACTER_CACHE_TTL = os.getenv("CHARACTER_CACHE_TTL", "5")  # seconds
+COMBAT_CACHE_SIZE = os.getenv("COMBAT_CACHE_SIZE", "500")
+COMBAT_CACHE_TTL = os.getenv("COMBAT_CACHE_TTL", "10")  # seconds
+COMBAT_COMMIT_DEBOUNCE = os.getenv("COMBAT_COMMIT_DEBOUNCE", "0")  # seconds; 0 to write on every commit
+# analytics are buffered in memory and written in batches
+ANALYTICS_BUFFER_SIZE = os.getenv("ANALYTICS_BUFFER_SIZE", "10000")  # counters and events
+ANALYTICS_FLUSH_INTERVAL = os.getenv("ANALYTICS_FLUSH_INTERVAL", "10")  # seconds
+# users recently found not to be running a tutorial
+TUTORIAL_MISS_CACHE_SIZE = os.getenv("TUTORIAL_MISS_CACHE_SIZE", "50000")
+TUTORIAL_MISS_CACHE_TTL = os.getenv("TUTORIAL_MISS_CACHE_TTL", "600")  # seconds
+# guild prefixes and server settings - kept coherent between clusters over redis pubsub, and preloaded on connect
+GUILD_CONFIG_CACHE_SIZE = os.getenv("GUILD_CONFIG_CACHE_SIZE", "20000")
+GUILD_CONFIG_CACHE_TTL = os.getenv("GUILD_CONFIG_CACHE_TTL", "600")  # seconds; picks up edits made elsewhere
+
 # ---- mongo/redis ----
 MONGO_URL = os.getenv("MONGO_URL", "mongodb://localhost:27017")
 MONGODB_DB_NAME = os.getenv("MONGODB_DB_NAME", "avrae")
@@ -64,6 +108,10 @@
 
 # ---- launchdarkly ----
 LAUNCHDARKLY_SDK_KEY = os.getenv("LAUNCHDARKLY_SDK_KEY")
+# optional - if set, feature flags are read from this file rather than from LaunchDarkly (e.g. for offline testing)
+LAUNCHDARKLY_FLAG_DATA_PATH = os.getenv("LAUNCHDARKLY_FLAG_DATA_PATH")
+LAUNCHDARKLY_CACHE_SIZE = os.getenv("LAUNCHDARKLY_CACHE_SIZE", "10000")  # (flag, user) evaluations
+LAUNCHDARKLY_CACHE_TTL = os.getenv("LAUNCHDARKLY_CACHE_TTL", "300")  # seconds; evaluations are dropped on flag changes
 
 # ---- discord bot list ----
 DBL_TOKEN = os.getenv("DBL_TOKEN")  # optional
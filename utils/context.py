@@ -25,6 +25,9 @@ def __init__(self, **kwargs):
         self._character = _sentinel
         self._combat = _sentinel
         self._server_settings = _sentinel
+        # whether loading the combat locks the channel's combat until the command finishes (set in the initiative cog)
+        self.locks_combat = False
+        self.combat_lock = None  # the channel's combat lock, while this context holds it
         self._last_typing_start = 0
         # NLP metadata
         self.nlp_is_alias = False  # set in aliasing.helpers
@@ -57,10 +60,30 @@ async def get_combat(self):
         """
         if self._combat is not _sentinel:
             return self._combat
+        if self.locks_combat:
+            await self.lock_combat()
         combat = await Combat.from_ctx(self)
         self._combat = combat
         return combat
 
+    async def lock_combat(self):
+        """
+        Holds the lock on the combat in this channel (see :meth:`Combat.channel_lock`), until
+        :meth:`release_combat_lock` is called. It is released while waiting for user input (see
+        :func:`utils.functions.wait_for_message`).
+        """
+        if self.combat_lock is not None:
+            return
+        lock = Combat.channel_lock(str(self.channel.id))
+        await lock.acquire()
+        self.combat_lock = lock
+
+    def release_combat_lock(self):
+        """Releases the lock on the combat in this channel, if this context holds it."""
+        if self.combat_lock is not None:
+            self.combat_lock.release()
+            self.combat_lock = None
+
     async def get_server_settings(self):
         """
         Gets the server settings in this context. If the context is not in a guild, returns None.
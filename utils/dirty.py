@@ -0,0 +1,105 @@
+"""
+Helpers to write only the fields of a document that changed since it was last read from or written to the database.
+
+Snapshots hold the BSON encoding of each field rather than the field itself, so mutating the objects that were
+serialized (e.g. a live cvar dict returned by ``to_dict()``) does not change the snapshot.
+"""
+import bson
+from bson.errors import InvalidDocument
+
+
+class _Subdocument:
+    """Snapshot of a dict field that is diffed key-by-key, rather than written whole when it changes."""
+
+    __slots__ = ("fields",)
+
+    def __init__(self, fields: dict):
+        self.fields = fields
+
+
+def _encode(value):
+    try:
+        return bson.encode({"v": value})
+    except (InvalidDocument, OverflowError, TypeError):
+        return None  # unencodable values never compare equal, so they are always written
+
+
+def _has_path_safe_keys(value):
+    return all(isinstance(k, str) and k and "." not in k and not k.startswith("$") for k in value)
+
+
+def snapshot(data: dict, subdocuments=()) -> dict:
+    """
+    Returns a snapshot of a document about to be (or just) written to or read from the database.
+
+    :param subdocuments: The keys of dict fields to diff key-by-key (e.g. a large dict of which usually only one key
+        changes at a time).
+    """
+    out = {}
+    for k, v in data.items():
+        if k in subdocuments and isinstance(v, dict) and _has_path_safe_keys(v):
+            out[k] = _Subdocument(snapshot(v))
+        else:
+            out[k] = _encode(v)
+    return out
+
+
+def diff(data: dict, old_snapshot: dict, prefix: str = "") -> tuple[dict, dict]:
+    """
+    Compares a document against a snapshot taken by :func:`snapshot`.
+
+    :param data: The current document.
+    :param old_snapshot: The snapshot of the document as it is in the database.
+    :param prefix: A prefix to prepend to each returned key (e.g. ``"combatants.3."``).
+    :returns: A tuple (``$set`` document, ``$unset`` document) of the fields that changed.
+    """
+    to_set = {}
+    to_unset = {}
+    for k, v in data.items():
+        old = old_snapshot.get(k)
+        if isinstance(old, _Subdocument) and isinstance(v, dict) and _has_path_safe_keys(v):
+            sub_set, sub_unset = diff(v, old.fields, prefix=f"{prefix}{k}.")
+            to_set.update(sub_set)
+            to_unset.update(sub_unset)
+        elif isinstance(old, _Subdocument) or old is None or _encode(v) != old:
+            to_set[f"{prefix}{k}"] = v
+    to_unset.update({f"{prefix}{k}": True for k in old_snapshot.keys() - data.keys()})
+    return to_set, to_unset
+
+
+def _decode(encoded):
+    return bson.decode(encoded)["v"]
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def merge(base_snapshot: dict, ours: dict, theirs: dict, additive=()) -> dict:
+    """
+    Three-way merges two versions of a document that were both derived from the document *base_snapshot* was taken of.
+
+    :param base_snapshot: A snapshot (see :func:`snapshot`) of the common ancestor of *ours* and *theirs*.
+    :param ours: Our version of the document. Fields we changed take precedence over *theirs*.
+    :param theirs: Their version of the document.
+    :param additive: The keys of numeric fields whose changes are applied on top of each other when both versions
+        changed them (e.g. two concurrent changes to a creature's HP), rather than ours taking precedence.
+    :returns: A new document.
+    """
+    merged = dict(theirs)
+    for k, v in ours.items():
+        old = base_snapshot.get(k)
+        if old is None or isinstance(old, _Subdocument):
+            merged[k] = v
+            continue
+        if _encode(v) == old:  # we didn't change it
+            continue
+        if k in additive and k in theirs:
+            base_value = _decode(old)
+            if _is_number(v) and _is_number(theirs[k]) and _is_number(base_value):
+                merged[k] = theirs[k] + (v - base_value)
+                continue
+        merged[k] = v
+    for k in base_snapshot.keys() - ours.keys():
+        merged.pop(k, None)
+    return merged
@@ -3,23 +3,84 @@
 """
 from typing import Optional, TYPE_CHECKING
 
+import cachetools
 import ldclient
+from ldclient.feature_store import InMemoryFeatureStore
+from ldclient.integrations import Files
+from ldclient.versioned_data_kind import FEATURES
+
+from utils import config
 
 if TYPE_CHECKING:
     import ddb.auth
     import disnake
 
 
+class _ObservedFeatureStore(InMemoryFeatureStore):
+    """
+    An in-memory feature store that calls *on_change* whenever a flag or segment changes. Called from the SDK's update
+    thread.
+    """
+
+    def __init__(self, on_change):
+        super().__init__()
+        self._on_change = on_change
+
+    def init(self, all_data):
+        super().init(all_data)
+        self._on_change()
+
+    def upsert(self, kind, item):
+        super().upsert(kind, item)
+        self._on_change()
+
+    def delete(self, kind, key, version):
+        super().delete(kind, key, version)
+        self._on_change()
+
+
 class AsyncLaunchDarklyClient(ldclient.LDClient):
-    """Works exactly like a normal LDClient, except certain blocking methods run in a separate thread."""
+    """
+    Works exactly like a normal LDClient, except certain blocking methods run in a separate thread.
 
-    def __init__(self, loop, sdk_key, *args, **kwargs):
-        config = ldclient.Config(sdk_key=sdk_key, *args, **kwargs)
-        super().__init__(config=config)
+    Evaluations are cached by flag key and user (including every attribute rules can target) until any flag changes,
+    so evaluations served from the cache are not reported to LaunchDarkly. Evaluations that fall back to the default
+    value (e.g. the flag does not exist) are not cached. Flags without individual targets, rules, or prerequisites
+    need nothing but the flag itself to evaluate, so they are evaluated in the event loop rather than in a separate
+    thread.
+
+    If *flag_data_path* is given, flags are read from that file rather than from LaunchDarkly (see
+    https://docs.launchdarkly.com/sdk/features/flags-from-files#python), and no events are sent.
+    """
+
+    def __init__(self, loop, sdk_key, *args, flag_data_path: Optional[str] = None, **kwargs):
         self.loop = loop
+        # (flag key, user attributes) -> value; only accessed from the event loop
+        self._evaluations = cachetools.TTLCache(
+            maxsize=int(config.LAUNCHDARKLY_CACHE_SIZE), ttl=int(config.LAUNCHDARKLY_CACHE_TTL)
+        )
+        self._generation = 0  # incremented on every invalidation, so stale evaluations are not cached
+        self._store = _ObservedFeatureStore(self._flag_changed)
+        if flag_data_path is not None:
+            kwargs.update(update_processor_class=Files.new_data_source(paths=[flag_data_path]), send_events=False)
+        ld_config = ldclient.Config(sdk_key=sdk_key, feature_store=self._store, *args, **kwargs)
+        super().__init__(config=ld_config)
 
-    async def variation(self, key, user, default):  # run variation evaluation in a separate thread
-        return await self.loop.run_in_executor(None, super().variation, key, user, default)
+    async def variation(self, key, user, default):
+        cache_key = (key, _freeze(user))
+        try:
+            return self._evaluations[cache_key]
+        except KeyError:
+            pass
+        generation = self._generation
+        if self._is_untargeted(key):
+            detail = self.variation_detail(key, user, default)
+        else:  # run variation evaluation in a separate thread
+            detail = await self.loop.run_in_executor(None, self.variation_detail, key, user, default)
+        # an evaluation with no variation returned *default*, which may differ between callers
+        if detail.variation_index is not None and generation == self._generation:
+            self._evaluations[cache_key] = detail.value
+        return detail.value
 
     async def variation_for_discord_user(self, key: str, user: "disnake.User", default):
         """Return a variation for a key given a discord user."""
@@ -33,6 +94,33 @@ async def variation_for_ddb_user(self, key: str, user: Optional["ddb.auth.Beyond
             user = user.to_ld_dict()
         return await self.variation(key, user, default)
 
+    # ==== evaluation cache ====
+    def _is_untargeted(self, key) -> bool:
+        flag = self._store.get(FEATURES, key, lambda x: x)
+        if flag is None:  # evaluates to the default
+            return True
+        return not (flag.get("targets") or flag.get("rules") or flag.get("prerequisites"))
+
+    def _flag_changed(self):
+        try:
+            self.loop.call_soon_threadsafe(self._invalidate)
+        except RuntimeError:  # the loop is closed
+            pass
+
+    def _invalidate(self):
+        # flags can depend on other flags and segments, and changes are rare - so drop every evaluation
+        self._generation += 1
+        self._evaluations.clear()
+
+
+def _freeze(value):
+    """Returns a hashable copy of a user dict (or one of its attributes)."""
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
 
 def discord_user_to_dict(user):
     """Converts a Discord user to a user dict for LD."""
@@ -96,6 +96,136 @@ def search(
         return results[0], True
 
 
+class SearchIndex:
+    """
+    A precomputed index over a list to search, for lists that are searched many times (e.g. the compendium).
+    Searching one or more indices with :func:`search_indexed` returns the same results as :func:`search` over the
+    concatenation of their haystacks, without renormalizing or rescanning every name on each query.
+    """
+
+    NGRAM_SIZE = 3
+
+    def __init__(self, haystack: list[_HaystackT], key: Callable[[_HaystackT], str], ngrams=True):
+        """
+        :param haystack: The list to index.
+        :param key: A function defining what to search for.
+        :param ngrams: Whether to build an n-gram index for substring matches. Small, short-lived indices are faster
+                       to scan linearly.
+        """
+        self.haystack = list(haystack)
+        self.key = key
+        self.names = [key(d).lower() for d in haystack]
+        # {lowercased name: [index]} for exact matches, {lowercased name: last matching obj} for fuzzy results
+        self.exact_index = {}
+        self.fuzzy_map = {}
+        for idx, name in enumerate(self.names):
+            self.exact_index.setdefault(name, []).append(idx)
+            self.fuzzy_map[name] = haystack[idx]
+
+        # {ngram: [index]}, each posting list in ascending order
+        self.ngram_index = None
+        if ngrams:
+            self.ngram_index = {}
+            for idx, name in enumerate(self.names):
+                for gram in {name[i : i + self.NGRAM_SIZE] for i in range(len(name) - self.NGRAM_SIZE + 1)}:
+                    self.ngram_index.setdefault(gram, []).append(idx)
+
+    def __len__(self):
+        return len(self.haystack)
+
+    def is_prefix_of(self, list_to_search: list) -> bool:
+        """Returns whether the given list starts with this index's haystack (e.g. compendium + homebrew choices)."""
+        n = len(self.haystack)
+        return (
+            n > 0
+            and len(list_to_search) >= n
+            and list_to_search[0] is self.haystack[0]
+            and list_to_search[n - 1] is self.haystack[-1]
+        )
+
+    def exact_matches(self, value: str) -> list[int]:
+        """Returns the indices of objects whose key is exactly the (lowercased) value, in order."""
+        return self.exact_index.get(value, [])
+
+    def partial_matches(self, value: str) -> list[int]:
+        """Returns the indices of objects whose key contains the (lowercased) value, in order."""
+        if self.ngram_index is None or len(value) < self.NGRAM_SIZE:
+            candidates = range(len(self.names))
+        else:
+            grams = {value[i : i + self.NGRAM_SIZE] for i in range(len(value) - self.NGRAM_SIZE + 1)}
+            candidates = min((self.ngram_index.get(gram, ()) for gram in grams), key=len)
+        return [idx for idx in candidates if value in self.names[idx]]
+
+    def fuzzy_matches(self, value: str, limit=5) -> list[tuple[str, float, int]]:
+        """Returns the top ``limit`` (name, score, index) fuzzy results for the (lowercased) value."""
+        return process.extract(value, self.names, scorer=fuzz.ratio, limit=limit)
+
+
+def search_indexed(
+    indices: list[SearchIndex], value: str, cutoff=5, strict=False
+) -> tuple[_HaystackT | list[_HaystackT], bool]:
+    """
+    Fuzzy searches the concatenation of the haystacks of one or more :class:`SearchIndex` for an object.
+    Behaves identically to :func:`search`.
+
+    :param indices: The indices to search, in order.
+    :param value: The value to search for.
+    :param cutoff: The scorer cutoff value for fuzzy searching.
+    :param strict: If True, will only search for exact matches.
+    :returns: A two-tuple (result, strict)
+    """
+    if not any(len(index) for index in indices):
+        return [], False
+
+    value_lower = value.lower()
+
+    # full match, return result
+    exact_matches = [index.haystack[i] for index in indices for i in index.exact_matches(value_lower)]
+    if not (exact_matches or strict):
+        partial_matches = [(index, index.haystack[i]) for index in indices for i in index.partial_matches(value_lower)]
+        if len(partial_matches) > 1 or not partial_matches:
+            # merge the top fuzzy results of each index, as if we had extracted from the concatenated names
+            fuzzy_candidates = []
+            offset = 0
+            for index in indices:
+                fuzzy_candidates.extend(
+                    (name, score, offset + i) for name, score, i in index.fuzzy_matches(value_lower)
+                )
+                offset += len(index)
+            fuzzy_candidates.sort(key=lambda r: (-r[1], r[2]))
+            fuzzy_results = [r for r in fuzzy_candidates[:5] if r[1] >= cutoff]
+            fuzzy_sum = sum(r[1] for r in fuzzy_results)
+
+            def fuzzy_match(name):
+                # later entries with the same name take precedence, like the fuzzy_map in search()
+                for index in reversed(indices):
+                    if name in index.fuzzy_map:
+                        return index.fuzzy_map[name]
+
+            # display the results in order of confidence
+            weighted_results = []
+            weighted_results.extend((fuzzy_match(r[0]), r[1] / fuzzy_sum) for r in fuzzy_results)
+            weighted_results.extend((match, len(value) / len(index.key(match))) for index, match in partial_matches)
+            sorted_weighted = sorted(weighted_results, key=lambda e: e[1], reverse=True)
+
+            # build results list, unique
+            results = []
+            for r in sorted_weighted:
+                if r[0] not in results:
+                    results.append(r[0])
+        else:
+            results = [match for _, match in partial_matches]
+    else:
+        results = exact_matches
+
+    if len(results) > 1:
+        return results, False
+    elif not results:
+        return [], False
+    else:
+        return results[0], True
+
+
 def paginate(choices: list[_HaystackT], per_page: int) -> list[list[_HaystackT]]:
     out = []
     for start_idx in range(0, len(choices), per_page):
@@ -168,7 +298,7 @@ def chk(msg):
             select_msg = await ctx.author.send(embed=embed)
 
         try:
-            m = await ctx.bot.wait_for("message", timeout=30, check=chk)
+            m = await wait_for_message(ctx, check=chk)
         except asyncio.TimeoutError:
             m = None
 
@@ -211,6 +341,7 @@ async def search_and_select(
     return_metadata=False,
     strip_query_quotes=True,
     selector=get_selection,
+    search_indices: list[SearchIndex] = None,
 ) -> _HaystackT:
     """
     Searches a list for an object matching the key, and prompts user to select on multiple matches.
@@ -228,14 +359,20 @@ async def search_and_select(
     :param return_metadata: Whether to return a metadata object {num_options, chosen_index}.
     :param strip_query_quotes: Whether to strip quotes from the query.
     :param selector: The coroutine to use to select a result if multiple results are possible.
+    :param search_indices: If supplied, precomputed indices over list_to_search to search instead of the list.
+                           Ignored if list_filter is supplied.
     """
     if list_filter:
         list_to_search = list(filter(list_filter, list_to_search))
+        search_indices = None
 
     if strip_query_quotes:
         query = query.strip("\"'")
 
-    result = search(list_to_search, query, key, cutoff)
+    if search_indices is not None:
+        result = search_indexed(search_indices, query, cutoff)
+    else:
+        result = search(list_to_search, query, key, cutoff)
 
     if result is None:
         raise NoSelectionElements("No matches found.")
@@ -259,6 +396,23 @@ async def search_and_select(
     return result, metadata
 
 
+async def wait_for_message(ctx, check, timeout=30):
+    """
+    Waits for a message matching *check*, like ``bot.wait_for("message")``. If the context holds the lock on its
+    channel's combat, it is released while waiting, so other commands can use the combat while the user responds.
+
+    :raises asyncio.TimeoutError: If no matching message is sent within *timeout* seconds.
+    """
+    lock = getattr(ctx, "combat_lock", None)
+    if lock is None:
+        return await ctx.bot.wait_for("message", timeout=timeout, check=check)
+    ctx.release_combat_lock()
+    try:
+        return await ctx.bot.wait_for("message", timeout=timeout, check=check)
+    finally:
+        await ctx.lock_combat()
+
+
 async def confirm(ctx, message, delete_msgs=False, response_check=get_positivity):
     """
     Confirms whether a user wants to take an action.
@@ -273,7 +427,7 @@ async def confirm(ctx, message, delete_msgs=False, response_check=get_positivity
     """
     msg = await ctx.channel.send(message)
     try:
-        reply = await ctx.bot.wait_for("message", timeout=30, check=auth_and_chan(ctx))
+        reply = await wait_for_message(ctx, check=auth_and_chan(ctx))
     except asyncio.TimeoutError:
         return None
     reply_bool = response_check(reply.content) if reply is not None else None
@@ -2,18 +2,44 @@
 Image processing utilities.
 """
 import asyncio
+import collections
+import concurrent.futures
 import hashlib
+import logging
+import multiprocessing
 import os
 from io import BytesIO
 
 import aiohttp
+import cachetools
 from PIL import Image, ImageChops
 
 from cogs5e.models.errors import ExternalImportError
 from utils import config
 
+log = logging.getLogger(__name__)
+
 TOKEN_SIZE = (256, 256)
 
+# one pooled HTTP session for all image downloads, created on first use
+_http_session = None
+
+
+def _get_http_session():
+    global _http_session
+    if _http_session is None or _http_session.closed:
+        _http_session = aiohttp.ClientSession()
+    return _http_session
+
+
+async def close():
+    """Closes the shared HTTP session and shuts down the token renderer. Call when the bot closes."""
+    global _http_session
+    shutdown_token_renderer()
+    if _http_session is not None:
+        await _http_session.close()
+        _http_session = None
+
 
 def preprocess_url(url):
     """
@@ -24,7 +50,107 @@ def preprocess_url(url):
     return url.replace("www.dndbeyond.com/avatars", f"{config.DDB_MEDIA_S3_BUCKET_DOMAIN}/avatars")
 
 
+# ==== token rendering ====
+ALPHA_TEMPLATE_FP = "res/alphatemplate.tif"
+TEMPLATE_FPS = ("res/template-f.png", "res/template-s.png")
+
+# rendering is CPU-bound, so it runs in a pool of worker processes (see start_token_renderer) rather than competing
+# with the event loop for the GIL
+_render_pool = None
+# (sha256 of image url, template path) -> rendered token PNG bytes
+_rendered_tokens = cachetools.TTLCache(
+    maxsize=int(config.TOKEN_RENDER_CACHE_MAX_BYTES), ttl=int(config.TOKEN_RENDER_CACHE_TTL), getsizeof=len
+)
+
+# the mask and templates, loaded once in each worker process
+_worker_alpha_template = None
+_worker_templates = {}
+
+
+def _init_render_worker():
+    global _worker_alpha_template
+    _worker_alpha_template = Image.open(ALPHA_TEMPLATE_FP)
+    _worker_alpha_template.load()
+    for template_fp in TEMPLATE_FPS:
+        template_img = Image.open(template_fp)
+        template_img.load()
+        _worker_templates[template_fp] = template_img
+
+
+def _render_token(the_img_bytes, template_fp="res/template-f.png") -> bytes:
+    """Renders a token from the given image bytes in a worker process, returning the PNG bytes."""
+    # open the image
+    b = BytesIO(the_img_bytes)
+    img = Image.open(b).convert("RGBA")
+
+    # crop/resize the token image
+    width, height = img.size
+    is_taller = height >= width
+    if is_taller:
+        box = (0, 0, width, width)
+    else:
+        box = (width / 2 - height / 2, 0, width / 2 + height / 2, height)
+    img = img.crop(box)
+    img = img.resize(TOKEN_SIZE, Image.ANTIALIAS)
+
+    # paste mask
+    mask_img = ImageChops.darker(_worker_alpha_template, img.getchannel("A"))
+    img.putalpha(mask_img)
+    mask_img.close()
+
+    # paste template
+    if template_fp:
+        template_img = _worker_templates[template_fp]
+        img.paste(template_img, mask=template_img)
+
+    # save the image, close files
+    out_bytes = BytesIO()
+    img.save(out_bytes, "PNG")
+    img.close()
+    return out_bytes.getvalue()
+
+
+def start_token_renderer():
+    """
+    Forks the token rendering worker processes. Call once at startup, before any other threads are started, so the
+    workers do not inherit locks held by other threads, and share as little of the bot's memory as possible.
+
+    Workers are forked rather than spawned, since spawning re-runs the main script (i.e. sets up another bot) in each
+    worker. For the same reason, workers are never forked again: if the pool breaks, tokens cannot be rendered until
+    the bot restarts.
+    """
+    global _render_pool
+    if _render_pool is not None:
+        return
+    _render_pool = concurrent.futures.ProcessPoolExecutor(
+        max_workers=int(config.TOKEN_RENDER_PROCESSES),
+        mp_context=multiprocessing.get_context("fork"),
+        initializer=_init_render_worker,
+    )
+    # with the fork start method, the first submission forks every worker (and they are never forked again)
+    _render_pool.submit(int)
+
+
+def _get_render_pool():
+    if _render_pool is None:
+        raise ExternalImportError("Token rendering is currently unavailable. Please try again later.")
+    return _render_pool
+
+
+def shutdown_token_renderer():
+    """Shuts down the token rendering worker processes, if they were started."""
+    global _render_pool
+    if _render_pool is not None:
+        _render_pool.shutdown(wait=False, cancel_futures=True)
+        _render_pool = None
+
+
 async def generate_token(img_url, is_subscriber=False, token_args=None):
+    """
+    Generates a token from the image at the given URL. Recently rendered tokens are returned from memory.
+
+    :returns: A BytesIO containing the token PNG.
+    """
     img_url = preprocess_url(img_url)
     template = "res/template-s.png" if is_subscriber else "res/template-f.png"
     if token_args:
@@ -34,82 +160,151 @@ async def generate_token(img_url, is_subscriber=False, token_args=None):
         elif border == "none":
             template = None
 
-    def process_img(the_img_bytes, template_fp="res/template-f.png"):
-        # open the image
-        b = BytesIO(the_img_bytes)
-        img = Image.open(b).convert("RGBA")
-
-        # crop/resize the token image
-        width, height = img.size
-        is_taller = height >= width
-        if is_taller:
-            box = (0, 0, width, width)
-        else:
-            box = (width / 2 - height / 2, 0, width / 2 + height / 2, height)
-        img = img.crop(box)
-        img = img.resize(TOKEN_SIZE, Image.ANTIALIAS)
-
-        # paste mask
-        mask_img = Image.open("res/alphatemplate.tif")
-        mask_img = ImageChops.darker(mask_img, img.getchannel("A"))
-        img.putalpha(mask_img)
-        mask_img.close()
-
-        # paste template
-        if template_fp:
-            template_img = Image.open(template_fp)
-            img.paste(template_img, mask=template_img)
-            template_img.close()
-
-        # save the image, close files
-        out_bytes = BytesIO()
-        img.save(out_bytes, "PNG")
-        img.close()
-        out_bytes.seek(0)
-        return out_bytes
+    cache_key = (hashlib.sha256(img_url.encode()).hexdigest(), template)
+    if (rendered := _rendered_tokens.get(cache_key)) is not None:
+        return BytesIO(rendered)
+
+    async with _get_http_session().get(img_url) as resp:
+        if not 199 < resp.status < 300:
+            raise ExternalImportError(f"I was unable to download the image to tokenize. ({resp.status} {resp.reason})")
+        # get the image type from the content type header
+        content_type = resp.headers.get("Content-Type", "")
+        if not content_type.startswith("image/"):
+            raise ExternalImportError(f"This does not look like an image file (content type {content_type}).")
+        img_bytes = await resp.read()
 
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(img_url) as resp:
-                if not 199 < resp.status < 300:
-                    raise ExternalImportError(
-                        f"I was unable to download the image to tokenize. ({resp.status} {resp.reason})"
-                    )
-                # get the image type from the content type header
-                content_type = resp.headers.get("Content-Type", "")
-                if not content_type.startswith("image/"):
-                    raise ExternalImportError(f"This does not look like an image file (content type {content_type}).")
-                img_bytes = await resp.read()
-        processed = await asyncio.get_event_loop().run_in_executor(None, process_img, img_bytes, template)
-    except Exception:
-        raise
-
-    return processed
+        rendered = await asyncio.get_event_loop().run_in_executor(
+            _get_render_pool(), _render_token, img_bytes, template
+        )
+    except concurrent.futures.process.BrokenProcessPool:
+        # a worker died (e.g. OOM on a huge image) - forking new workers now would fork a bot that is running threads
+        log.error("Token rendering pool broke, tokens cannot be rendered until the bot restarts")
+        shutdown_token_renderer()
+        raise ExternalImportError("I was unable to process this image.")
+
+    if len(rendered) <= _rendered_tokens.maxsize:
+        _rendered_tokens[cache_key] = rendered
+    return BytesIO(rendered)
+
+
+# ==== monster tokens ====
+class TokenStore:
+    """
+    A store of images on disk, bounded by their total size, evicting the least recently used images first. The last
+    use of each image is its file's modification time, so the eviction order survives restarts.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._sizes = None  # filename -> size in bytes, least recently used first; loaded on first use
+        self._total_bytes = 0
+
+    def _load(self):
+        os.makedirs(self.directory, exist_ok=True)
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.is_file() and entry.name.endswith(".png"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, entry.name, stat.st_size))
+        entries.sort()
+        self._sizes = collections.OrderedDict((name, size) for _, name, size in entries)
+        self._total_bytes = sum(self._sizes.values())
+        self._evict()
+
+    def _path(self, filename):
+        return os.path.join(self.directory, filename)
+
+    def get(self, key: str):
+        """Returns the path to the image stored under *key*, or None if it is not stored."""
+        if self._sizes is None:
+            self._load()
+        filename = f"{key}.png"
+        if filename not in self._sizes:
+            return None
+        path = self._path(filename)
+        try:
+            os.utime(path)
+        except FileNotFoundError:  # removed from under us
+            self._total_bytes -= self._sizes.pop(filename)
+            return None
+        self._sizes.move_to_end(filename)
+        return path
+
+    def put(self, key: str, data: bytes):
+        """Stores *data* under *key*, evicting the least recently used images if the store is over its size."""
+        if self._sizes is None:
+            self._load()
+        if len(data) > self.max_bytes:
+            return
+        filename = f"{key}.png"
+        tmp_path = self._path(f"{filename}.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self._path(filename))
+
+        self._total_bytes -= self._sizes.pop(filename, 0)
+        self._sizes[filename] = len(data)
+        self._total_bytes += len(data)
+        self._evict()
+
+    def _evict(self):
+        while self._total_bytes > self.max_bytes and self._sizes:
+            filename, size = self._sizes.popitem(last=False)
+            self._total_bytes -= size
+            try:
+                os.remove(self._path(filename))
+            except FileNotFoundError:
+                pass
+
+
+monster_tokens = TokenStore(".cache/monster-tokens", int(config.MONSTER_TOKEN_CACHE_MAX_BYTES))
+# url -> task downloading the token, so concurrent requests for the same token only download it once
+_monster_token_fetches = {}
+
+
+async def _download_monster_token(img_url: str, key: str) -> bytes:
+    async with _get_http_session().get(img_url) as resp:
+        if not 199 < resp.status < 300:
+            raise ExternalImportError(f"I was unable to retrieve the monster token. ({resp.status} {resp.reason})")
+        img_bytes = await resp.read()
+    monster_tokens.put(key, img_bytes)
+    return img_bytes
 
 
 async def fetch_monster_image(img_url: str):
     """
-    Fetches a monster token image from the given URL, caching it until the bot restarts.
+    Fetches a monster token image from the given URL, caching it on disk.
 
     :returns: A file-like object (file or bytesio) containing the monster token, or a path to the existing cached image.
     :rtype: BytesIO or str
     """
-    # ensure cache dir exists
-    os.makedirs(".cache/monster-tokens", exist_ok=True)
-
-    sha = hashlib.sha1(img_url.encode()).hexdigest()
-    cache_path = f".cache/monster-tokens/{sha}.png"
-    if os.path.exists(cache_path):
+    key = hashlib.sha1(img_url.encode()).hexdigest()
+    if (cache_path := monster_tokens.get(key)) is not None:
         return cache_path
 
-    async with aiohttp.ClientSession() as session:
-        async with session.get(img_url) as resp:
-            if not 199 < resp.status < 300:
-                raise ExternalImportError(f"I was unable to retrieve the monster token. ({resp.status} {resp.reason})")
-            img_bytes = await resp.read()
+    task = _monster_token_fetches.get(img_url)
+    if task is None:
+        task = asyncio.ensure_future(_download_monster_token(img_url, key))
+        _monster_token_fetches[img_url] = task
+        task.add_done_callback(lambda _: _monster_token_fetches.pop(img_url, None))
+    # shielded, so one cancelled command does not cancel the download for everyone else waiting on it
+    img_bytes = await asyncio.shield(task)
+    return BytesIO(img_bytes)
 
-    # cache
-    with open(cache_path, "wb") as f:
-        f.write(img_bytes)
 
-    return BytesIO(img_bytes)
+async def prewarm_monster_tokens(img_urls):
+    """Fetches each of the given monster token URLs that is not already cached, one at a time."""
+    num_fetched = 0
+    for img_url in img_urls:
+        if monster_tokens.get(hashlib.sha1(img_url.encode()).hexdigest()) is not None:
+            continue
+        try:
+            await fetch_monster_image(img_url)
+        except Exception as e:
+            log.warning(f"Failed to prewarm monster token {img_url}: {e}")
+            continue
+        num_fetched += 1
+    log.info(f"Prewarmed {num_fetched} monster tokens")
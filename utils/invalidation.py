@@ -0,0 +1,92 @@
+"""
+Cross-cluster invalidation of process-local caches.
+
+Caches register a handler under a name with :func:`register`. Calling :func:`invalidate` runs the handler in this
+process immediately, and publishes the invalidation to every other process over Redis pubsub, where the handler is
+run by :func:`invalidation_pubsub`. Caches whose copy in this process is the latest (e.g. an object that was just
+written) use :func:`invalidate_remote` to only drop the copies in other processes.
+"""
+import asyncio
+import logging
+import uuid
+from typing import Callable, Dict, Iterable
+
+import utils.redisIO as redis
+from utils import config
+
+log = logging.getLogger(__name__)
+
+INVALIDATION_PUBSUB_CHANNEL = f"cache-invalidation:{config.ENVIRONMENT}"
+# identifies this process as the sender of invalidations - cluster ids are not unique (e.g. unclustered processes)
+PROCESS_ID = uuid.uuid4().hex
+
+# cache name -> callable taking a list of keys to drop
+_handlers: Dict[str, Callable[[list], None]] = {}
+
+
+def user_scope(user_id) -> str:
+    """The key that caches of things in scope for a user (e.g. their aliases or homebrew) are invalidated by."""
+    return f"user:{user_id}"
+
+
+def guild_scope(guild_id) -> str:
+    """The key that caches of things in scope for a guild (e.g. its aliases or homebrew) are invalidated by."""
+    return f"guild:{guild_id}"
+
+
+def register(cache: str, handler: Callable[[list], None]):
+    """Registers a handler to be called with a list of keys when the cache named *cache* is invalidated."""
+    _handlers[cache] = handler
+
+
+def invalidate_local(cache: str, keys: Iterable):
+    handler = _handlers.get(cache)
+    if handler is None:
+        log.warning(f"No invalidation handler registered for cache {cache!r}")
+        return
+    handler(list(keys))
+
+
+async def invalidate(bot, cache: str, *keys):
+    """
+    Drops *keys* from the cache named *cache* in this process, and notifies all other processes to do the same.
+    A failure to publish is logged, not raised - the other processes' caches will expire on their own.
+    """
+    invalidate_local(cache, keys)
+    await invalidate_remote(bot, cache, *keys)
+
+
+async def invalidate_remote(bot, cache: str, *keys):
+    """
+    Notifies all other processes to drop *keys* from the cache named *cache*, keeping them in this process.
+    A failure to publish is logged, not raised.
+    """
+    message = redis.PubSubInvalidation.new(PROCESS_ID, cache, keys)
+    try:
+        await bot.rdb.publish(INVALIDATION_PUBSUB_CHANNEL, message.to_json())
+    except Exception as e:
+        log.warning(f"Failed to publish invalidation of {cache!r} keys {keys!r}: {e}")
+
+
+async def invalidation_pubsub(bot):
+    """Listens for published invalidations and runs their handlers. Runs forever."""
+    while True:  # if we ever disconnect from pubsub, wait 5s and try reinitializing
+        try:  # connect to the pubsub channel
+            channel = (await bot.rdb.subscribe(INVALIDATION_PUBSUB_CHANNEL))[0]
+        except:
+            log.warning("Could not connect to invalidation pubsub! Waiting to reconnect...")
+            await asyncio.sleep(5)
+            continue
+
+        log.info("Connected to invalidation pubsub.")
+        async for msg in channel.iter(encoding="utf-8"):
+            try:
+                redis.pslogger.debug(msg)
+                message = redis.deserialize_ps_msg(msg)
+                # our own invalidations are echoed back to us, but were already handled
+                if message.type == "invalidate" and message.sender != PROCESS_ID:
+                    invalidate_local(message.cache, message.keys)
+            except Exception as e:
+                log.error(str(e))
+        log.warning("Disconnected from invalidation pubsub! Waiting to reconnect...")
+        await asyncio.sleep(5)
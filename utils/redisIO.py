@@ -197,7 +197,24 @@ def to_dict(self):
         return inst
 
 
-PS_DESER_MAP = {"cmd": PubSubCommand, "reply": PubSubReply}
+class PubSubInvalidation(_PubSubMessageBase):
+    def __init__(self, id, sender, cache, keys):
+        super().__init__("invalidate", id, sender)
+        self.cache = cache
+        self.keys = keys
+
+    @classmethod
+    def new(cls, sender, cache, keys):
+        _id = str(uuid.uuid4())
+        return cls(_id, sender, cache, list(keys))
+
+    def to_dict(self):
+        inst = super().to_dict()
+        inst.update({"cache": self.cache, "keys": self.keys})
+        return inst
+
+
+PS_DESER_MAP = {"cmd": PubSubCommand, "reply": PubSubReply, "invalidate": PubSubInvalidation}
 
 
 def deserialize_ps_msg(message: str):
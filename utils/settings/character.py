@@ -4,6 +4,7 @@
 from pydantic import ValidationError, conint
 from pydantic.color import Color
 
+from utils import invalidation
 from utils.functions import get_positivity
 from . import SettingsBaseModel
 from utils.enums import CoinsAutoConvert
@@ -46,15 +47,21 @@ def from_old_csettings(cls, d):
             srslots=old_settings.get("srslots") or False,
         )
 
-    async def commit(self, mdb, character):
-        """Commits the settings to the database for a given character."""
-        await mdb.characters.update_one(
+    async def commit(self, bot, character):
+        """
+        Commits the settings to the database for a given character, and drops the cached character from other
+        processes.
+        """
+        from cogs5e.models.character import CHARACTER_CACHE_NAME
+
+        await bot.mdb.characters.update_one(
             {"owner": character.owner, "upstream": character.upstream},
             {
                 "$set": {"options_v2": self.dict()},
                 "$unset": {"options": True},  # delete any old options - they should have been converted by now
             },
         )
+        await invalidation.invalidate_remote(bot, CHARACTER_CACHE_NAME, [character.owner, character.upstream])
 
 
 # ==== legacy csettings ====
@@ -1,13 +1,22 @@
 import enum
-from typing import List, Optional, Literal
+from typing import Iterable, List, Optional, Literal
 
+import cachetools
 import disnake
 from pydantic import BaseModel
 
 from . import SettingsBaseModel
+from utils import config, invalidation
 from utils.enums import CritDamageType
 
 DEFAULT_DM_ROLE_NAMES = {"dm", "gm", "dungeon master", "game master"}
+GUILD_SETTINGS_CACHE_NAME = "guild_settings"
+
+# guild id -> ServerSettings, read on every inline roll and most lookups
+# other processes drop their copy when the settings are committed
+_cache = cachetools.TTLCache(maxsize=int(config.GUILD_CONFIG_CACHE_SIZE), ttl=int(config.GUILD_CONFIG_CACHE_TTL))
+# incremented on every invalidation, so settings loaded while they were committed are not cached
+_generation = 0
 
 
 class InlineRollingType(enum.IntEnum):
@@ -53,6 +62,16 @@ class ServerSettings(SettingsBaseModel):
     @classmethod
     async def for_guild(cls, mdb, guild_id: int):
         """Returns the server settings for a given guild."""
+        if (cached := _cache.get(guild_id)) is not None:
+            return cached.copy(deep=True)  # callers may change the settings before committing them
+        generation = _generation
+        inst = await cls._load(mdb, guild_id)
+        if generation == _generation:
+            _cache[guild_id] = inst.copy(deep=True)
+        return inst
+
+    @classmethod
+    async def _load(cls, mdb, guild_id: int):
         # new-style
         existing = await mdb.guild_settings.find_one({"guild_id": guild_id})
         if existing is not None:
@@ -75,9 +94,36 @@ def from_old_lookupsettings(cls, guild_id: int, d):
             lookup_pm_result=d.get("pm_result", False),
         )
 
-    async def commit(self, mdb):
+    @classmethod
+    async def preload(cls, mdb, guild_ids: Iterable[int]):
+        """
+        Loads the server settings of many guilds into the cache at once (e.g. the guilds a cluster just connected to).
+        Does nothing once the cache is full, rather than evict settings that are in use.
+        """
+        guild_ids = [guild_id for guild_id in guild_ids if guild_id not in _cache]
+        if not guild_ids or len(_cache) >= _cache.maxsize:
+            return
+        generation = _generation
+        loaded = {}
+        async for d in mdb.guild_settings.find({"guild_id": {"$in": guild_ids}}):
+            loaded[d["guild_id"]] = cls.parse_obj(d)
+        missing = {str(guild_id): guild_id for guild_id in guild_ids if guild_id not in loaded}
+        if missing:
+            async for d in mdb.lookupsettings.find({"server": {"$in": list(missing)}}):
+                guild_id = missing[d["server"]]
+                loaded[guild_id] = cls.from_old_lookupsettings(guild_id, d)
+        if generation != _generation:
+            return
+        for guild_id in guild_ids:
+            if len(_cache) >= _cache.maxsize:
+                break
+            _cache.setdefault(guild_id, loaded.get(guild_id) or cls(guild_id=guild_id))
+
+    async def commit(self, bot):
         """Commits the settings to the database."""
-        await mdb.guild_settings.update_one({"guild_id": self.guild_id}, {"$set": self.dict()}, upsert=True)
+        await bot.mdb.guild_settings.update_one({"guild_id": self.guild_id}, {"$set": self.dict()}, upsert=True)
+        _cache[self.guild_id] = self.copy(deep=True)
+        await invalidation.invalidate_remote(bot, GUILD_SETTINGS_CACHE_NAME, self.guild_id)
 
     # ==== helpers ====
     def is_dm(self, member: disnake.Member):
@@ -86,3 +132,13 @@ def is_dm(self, member: disnake.Member):
             return any(r.name.lower() in DEFAULT_DM_ROLE_NAMES for r in member.roles)
         dm_role_set = set(self.dm_roles)
         return any(r.id in dm_role_set for r in member.roles)
+
+
+def _invalidate_cached_settings(guild_ids):
+    global _generation
+    _generation += 1
+    for guild_id in guild_ids:
+        _cache.pop(guild_id, None)
+
+
+invalidation.register(GUILD_SETTINGS_CACHE_NAME, _invalidate_cached_settings)
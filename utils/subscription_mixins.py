@@ -1,6 +1,15 @@
 import abc
 
 from cogs5e.models.errors import NotAllowed
+from utils import invalidation
+from utils.invalidation import guild_scope, user_scope
+
+# the name of the cache of the homebrew entities in scope for a user/guild, dropped when subscriptions change
+HOMEBREW_CHOICES_CACHE_NAME = "homebrew_choices"
+
+
+def object_scope(object_id):
+    return f"object:{object_id}"
 
 
 class MixinBase(abc.ABC):
@@ -18,6 +27,16 @@ def sub_coll(ctx):
     async def remove_all_tracking(self, ctx):
         """Removes all subscriber documents associated with this object."""
         await self.sub_coll(ctx).delete_many({"object_id": self.id})
+        await self.subscriptions_changed(ctx, object_scope(self.id))
+
+    async def subscriptions_changed(self, ctx, *scopes):
+        """
+        Called after the subscriber documents of this object change.
+
+        :param scopes: The scopes affected by the change (see :func:`user_scope`, :func:`guild_scope`,
+            :func:`object_scope`).
+        """
+        pass
 
 
 class SubscriberMixin(MixinBase, abc.ABC):
@@ -37,6 +56,7 @@ async def subscribe(self, ctx):
             raise NotAllowed("You are already subscribed to this.")
 
         await self.sub_coll(ctx).insert_one({"type": "subscribe", "subscriber_id": ctx.author.id, "object_id": self.id})
+        await self.subscriptions_changed(ctx, user_scope(ctx.author.id))
 
     async def unsubscribe(self, ctx):
         """Removes the contextual author from subscribers."""
@@ -47,6 +67,7 @@ async def unsubscribe(self, ctx):
             {"type": {"$in": ["subscribe", "active"]}, "subscriber_id": ctx.author.id, "object_id": self.id}
             # unsubscribe, unactive
         )
+        await self.subscriptions_changed(ctx, user_scope(ctx.author.id))
 
     async def num_subscribers(self, ctx):
         """Returns the number of subscribers."""
@@ -72,6 +93,7 @@ async def set_active(self, ctx):
         """Sets the object as active for the contextual author, and removes active status from any other documents."""
         await self.sub_coll(ctx).delete_many({"type": "active", "subscriber_id": ctx.author.id})
         await self.sub_coll(ctx).insert_one({"type": "active", "subscriber_id": ctx.author.id, "object_id": self.id})
+        await self.subscriptions_changed(ctx, user_scope(ctx.author.id))
 
     @classmethod
     async def active_id(cls, ctx):
@@ -108,12 +130,14 @@ async def set_server_active(self, ctx):
         await self.sub_coll(ctx).insert_one(
             {"type": "server_active", "subscriber_id": ctx.guild.id, "object_id": self.id}
         )
+        await self.subscriptions_changed(ctx, guild_scope(ctx.guild.id))
 
     async def unset_server_active(self, ctx):
         """Sets the object as inactive for the contextual guild."""
         await self.sub_coll(ctx).delete_many(
             {"type": "server_active", "subscriber_id": ctx.guild.id, "object_id": self.id}
         )
+        await self.subscriptions_changed(ctx, guild_scope(ctx.guild.id))
 
     async def num_server_active(self, ctx):
         """Returns the number of guilds that have this object active."""
@@ -169,7 +193,9 @@ async def my_editable_ids(cls, ctx):
 
 # ==== utilities ====
 class CommonHomebrewMixin(SubscriberMixin, ActiveMixin, GuildActiveMixin, abc.ABC):
-    pass
+    async def subscriptions_changed(self, ctx, *scopes):
+        """Drops the cached homebrew choices of the affected users and guilds on every cluster."""
+        await invalidation.invalidate(ctx.bot, HOMEBREW_CHOICES_CACHE_NAME, *scopes)
 
 
 # ==== notes ====